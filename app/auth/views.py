@@ -110,9 +110,10 @@ def about():
         abort(404)
     else:
         count = math.ceil(current_user.get_garbage_list_count() / 10)
-        garbage_list = current_user.get_garbage_list(limit=10, offset=(page - 1) * 10)
+        garbage_list, last = current_user.get_garbage_list(limit=10, offset=(page - 1) * 10,
+                                                           after=request.args.get("after"))
         order_list = user.get_order_goods_list()
-        page_list = get_page("auth.about", page, count)
+        page_list = get_page("auth.about", page, count, last)
         return render_template("auth/about.html", order=user.order, order_list=order_list,
                                garbage_list=garbage_list, page_list=page_list, page=page)
 
@@ -48,7 +48,7 @@ def index():
             abort(500)
         return redirect(url_for("news.index", page=1))
     page = int(request.args.get("page", 1))
-    res, context_list, page_list = views.website.get_news(page)
+    res, context_list, page_list = views.website.get_news(page, request.args.get("after"))
     if res == 0:
         abort(404)
     delete_form = NewDelete()
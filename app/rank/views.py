@@ -16,7 +16,7 @@ def rank_up():
     except (ValueError, TypeError):
         abort(404)
     else:
-        data, page_list = views.website.get_rank(page, "DESC", "rank_up")
+        data, page_list = views.website.get_rank(page, "DESC", "rank_up", request.args.get("after"))
         return render_template("rank/ranking.html", rank_info=data, ranking_name="高分榜",
                                page_list=page_list, page=page)
 
@@ -31,7 +31,7 @@ def rank_down():
     except (ValueError, TypeError):
         abort(404)
     else:
-        data, page_list = views.website.get_rank(page, "ASC", "rank_down")
+        data, page_list = views.website.get_rank(page, "ASC", "rank_down", request.args.get("after"))
         return render_template("rank/ranking.html", rank_info=data, ranking_name="警示榜",
                                page_list=page_list, page=f"{page}")
 
@@ -5,7 +5,7 @@ import math
 from sql.store import get_store_item_list, get_store_item, confirm_order
 
 from tool.typing import *
-from tool.page import get_page
+from tool.page import get_page, make_cursor, parse_cursor
 from tool.login import create_uid
 
 from core.garbage import GarbageType
@@ -13,7 +13,8 @@ from core.garbage import GarbageType
 from sql import DBBit
 from sql.db import DB
 from sql.garbage import count_garbage_by_uid, get_garbage_by_uid
-from sql.user import find_user_by_name, find_user_by_id, get_rank_for_user, count_all_user
+from sql.user import find_user_by_name, find_user_by_id, get_rank_for_user, count_rank_user
+from sql.rollup import search_garbage_daily, search_garbage_hourly, search_passing_rate, get_passing_rate
 from sql.news import write_news, get_news, get_news_count, delete_news
 from sql.store import check_order, get_goods_from_order, set_goods_quantity, set_goods_score, add_new_goods
 
@@ -63,13 +64,15 @@ class AuthWebsite(WebsiteBase):
     def get_user_garbage_count(self, uid: uid_t):
         return count_garbage_by_uid(uid, self._db, time_limit=False)
 
-    def get_user_garbage_list(self, uid: uid_t, limit: int, offset: int = 0):
+    def get_user_garbage_list(self, uid: uid_t, limit: int, offset: int = 0, after: Optional[str] = None):
         garbage_list = get_garbage_by_uid(uid,
-                                          columns=["UseTime", "Location", "GarbageType", "CheckResult"],
+                                          columns=["UseTime", "Location", "GarbageType", "CheckResult", "GarbageID"],
                                           limit=limit,
                                           db=self.db,
-                                          offset=offset)
+                                          offset=offset,
+                                          after=parse_cursor(after, [str, int]))
         res = []
+        last = None
         for i in garbage_list:
             t = i[0].strftime("%Y-%m-%d %H:%M:%S")
             loc = i[1]
@@ -84,7 +87,8 @@ class AuthWebsite(WebsiteBase):
                 result = "投放错误"
                 result_class = 'fail'
             res.append((t, loc, type_, result, result_class))
-        return res
+            last = (t, i[4])
+        return res, make_cursor(last)
 
     def get_user_by_id(self, uid: uid_t):
         res = find_user_by_id(uid, self._db)
@@ -127,10 +131,11 @@ class StoreWebsite(WebsiteBase):
 
 class RankWebsite(WebsiteBase):
     """ 排行榜 """
-    def get_rank(self, page: int, order_by: str = "DESC", url: str = "rank_up"):
-        count = math.ceil(count_all_user(self._db) / 20)
+    def get_rank(self, page: int, order_by: str = "DESC", url: str = "rank_up", after: Optional[str] = None):
+        count = math.ceil(count_rank_user(self._db) / 20)
         offset = 20 * (page - 1)
-        return get_rank_for_user(self.db, 20, offset, order_by), get_page(f"rank.{url}", page, count)
+        res, last = get_rank_for_user(self.db, 20, offset, order_by, parse_cursor(after, [int, int, str]))
+        return res, get_page(f"rank.{url}", page, count, make_cursor(last))
 
 
 class NewsWebsite(WebsiteBase):
@@ -138,16 +143,17 @@ class NewsWebsite(WebsiteBase):
     def write_news(self, context: str, uid: uid_t):
         return write_news(context, uid, self.db)
 
-    def get_news(self, page: int = 1):
+    def get_news(self, page: int = 1, after: Optional[str] = None):
         count = math.ceil(get_news_count(self.db) / 10)
         if count == 0:
             return -1, [], []
         elif page > count:
             return 0, None, None
-        res, news_list = get_news(limit=20, offset=((page - 1) * 10), db=self.db)
+        res, news_list, last = get_news(limit=10, offset=((page - 1) * 10), db=self.db,
+                                        after=parse_cursor(after, [str, int]))
         if not res:
             return 0, None, None
-        return 1, news_list, get_page("news.index", page, count)
+        return 1, news_list, get_page("news.index", page, count, make_cursor(last))
 
     def delete_news(self, context_id: str):
         return delete_news(context_id, self._db)
@@ -159,37 +165,19 @@ class DataWebsite(WebsiteBase):
     """
 
     def count_by_days(self):
-        cur = self._db.search(columns=["GarbageType", "DATE_FORMAT(UseTime,'%H') AS days", "count(GarbageID) AS count"],
-                              table="garbage",
-                              group_by=["GarbageType", "days"],
-                              order_by=[("GarbageType", "ASC"), ("days", "ASC")],
-                              where="UseTime IS NOT NULL")
-        if cur is None:
-            return None
-        return cur.fetchall()
+        return search_garbage_hourly(["GarbageType", "hour", "count"], self._db,
+                                     order_by=[("GarbageType", "ASC"), ("hour", "ASC")])
 
     def count_by_times(self, days):
-        cur = self._db.search(columns=["GarbageType", "days", "count(GarbageID) AS count"],
-                              table=f"garbage_{days}d",
-                              group_by=["GarbageType", "days"],
-                              order_by=[("GarbageType", "ASC"), ("days", "ASC")],
-                              where="UseTime IS NOT NULL")
-        if cur is None:
-            return None
-        return cur.fetchall()
+        return search_garbage_daily(["GarbageType", "days", "count"], days, self._db,
+                                    order_by=[("GarbageType", "ASC"), ("days", "ASC")])
 
     def count_passing_rate(self):
-        cur = self._db.search(columns=["GarbageType",
-                                       f"get_avg(count(GarbageID), "
-                                       f"(SELECT count(g.GarbageID) "
-                                       f"FROM garbage AS g WHERE g.CheckResult is not null)) AS count"],
-                              table="garbage",
-                              where=["CheckResult is not null", "CheckResult=1"],
-                              group_by=["GarbageType"],
-                              order_by=[("GarbageType", "ASC")])
-        if cur is None:
+        res = search_passing_rate(["GarbageType", "passing", "not_passing"], self._db,
+                                  order_by=[("GarbageType", "ASC")])
+        if res is None:
             return None
-        return cur.fetchall()
+        return [(i[0], get_passing_rate(i[1], i[2])) for i in res]
 
 
 class Website(AuthWebsite, StoreWebsite, RankWebsite, NewsWebsite, DataWebsite, WebsiteBase):
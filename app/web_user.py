@@ -48,8 +48,8 @@ class WebAnonymous(AnonymousUserMixin):
         return 0
 
     @staticmethod
-    def get_garbage_list(limit, offset):
-        return []
+    def get_garbage_list(limit, offset, after=None):
+        return [], None
 
     @staticmethod
     def get_user():
@@ -76,8 +76,9 @@ class WebUser(UserMixin):
 
     def update_info(self) -> bool:
         info = search_from_user_view(columns=["Score", "Reputation", "IsManager"],
-                                     where=f"UserID='{self._uid}'",
-                                     db=views.website.db)
+                                     where="UserID = %s",
+                                     db=views.website.db,
+                                     params=(self._uid,))
         if info is None:
             return False
         info = info[0]
@@ -134,7 +135,8 @@ class WebUser(UserMixin):
     def order(self) -> str:
         cur = views.website.db.search(columns=["OrderID"],
                                       table="orders",
-                                      where=f"UserID = '{self._uid}' and status=0")
+                                      where="UserID = %s and status=0",
+                                      params=(self._uid,))
         if cur is None or cur.rowcount == 0:
             return "None"
         assert cur.rowcount == 1
@@ -151,7 +153,8 @@ class WebUser(UserMixin):
             return []
         cur = views.website.db.search(columns=["Name", "Quantity"],
                                       table="order_goods_view",
-                                      where=f"OrderID = '{order}'")
+                                      where="OrderID = %s",
+                                      params=(order,))
         if cur is None:
             return []
 
@@ -164,8 +167,12 @@ class WebUser(UserMixin):
     def get_garbage_list_count(self):
         return views.website.get_user_garbage_count(self._uid)
 
-    def get_garbage_list(self, limit: int, offset: int = 0):
-        return views.website.get_user_garbage_list(self._uid, limit=limit, offset=offset)
+    def get_garbage_list(self, limit: int, offset: int = 0, after: Optional[str] = None):
+        """
+        :param after: 上一页最后一行的键 (键集分页)
+        :return: 垃圾袋列表, 本页最后一行的键
+        """
+        return views.website.get_user_garbage_list(self._uid, limit=limit, offset=offset, after=after)
 
     def get_user(self) -> User:
         return views.website.get_user_by_id(self._uid)
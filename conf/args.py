@@ -29,6 +29,8 @@ if res is None or res == "False":
 
     parser.add_argument("--app_secret", nargs=1, type=str, help="系统密钥-SECRET")
     parser.add_argument("--program", nargs=1, type=str, choices=["setup",
+                                                                 "migrate",
+                                                                 "rollup",
                                                                  "garbage",
                                                                  "ranking",
                                                                  "manager",
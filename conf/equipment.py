@@ -6,6 +6,21 @@ class ConfigCaptureRelease:
     use_opencv = bool(conf_args.get("use_opencv", True))
     capture_num = tk_zoom = float(conf_args.get("capture_num", 1))  # 摄像头号
     capture_arg = []
+    capture_buffer = int(conf_args.get("capture_buffer", 4))  # 摄像头环形缓冲区保留的帧数
+    capture_retry = float(conf_args.get("capture_retry", 0.5))  # 读取摄像头失败后, 等待该秒数再重试
+    capture_width = int(conf_args.get("capture_width", 640))  # picamera 的分辨率 (宽为32的倍数, 高为16的倍数)
+    capture_height = int(conf_args.get("capture_height", 480))
+    capture_framerate = int(conf_args.get("capture_framerate", 30))  # picamera 的帧率
+
+    qr_scan_width = int(conf_args.get("qr_scan_width", 480))  # 识别二维码前把图像缩小到该宽度
+    qr_scan_diff = float(conf_args.get("qr_scan_diff", 2.0))  # 图像平均变化小于该值 (0-255) 时沿用上一次的识别结果
+    qr_scan_refresh = float(conf_args.get("qr_scan_refresh", 0.2))  # 上一次没有识别到二维码时, 即使图像不变也每隔该秒数重新识别
+    qr_roi_margin = float(conf_args.get("qr_roi_margin", 0.5))  # 在上一个二维码周围识别时, 向外扩展的比例
+    qr_worker = bool(conf_args.get("qr_worker", False))  # 在子进程中识别二维码 (适用于多核CPU)
+
+    qr_label_workers = int(conf_args.get("qr_label_workers", 0))  # 生成二维码标签的进程数 (0 为CPU核心数, 1 为不使用进程池)
+    qr_label_pool_min = int(conf_args.get("qr_label_pool_min", 64))  # 标签数量达到该值时才使用进程池
+    qr_label_chunk = int(conf_args.get("qr_label_chunk", 32))  # 每次分配给子进程的标签数
 
 
 ConfigCapture = ConfigCaptureRelease
@@ -1,13 +1,40 @@
+import os
+
 from . import args
+from .conf import conf_args, conf_path
 
 
 class ConfigDatabaseRelease:
-    """ MySQL 相关配置 """
-    database = 'MySQL'
+    """ 数据库相关配置 """
+    database = conf_args.get("database", "MySQL")  # MySQL 或 SQLite
+    search_iter_chunk = int(conf_args.get("search_iter_chunk", 500))  # 分块查询时每块的行数
+    insert_many_chunk = int(conf_args.get("insert_many_chunk", 500))  # 批量插入时每条语句的行数
+    csv_import_chunk = int(conf_args.get("csv_import_chunk", 2000))  # 从CSV导入用户时每次处理的行数
     mysql_url = args.p_args['mysql_url']
     mysql_name = args.p_args['mysql_name']
     mysql_passwd = args.p_args['mysql_passwd']
     mysql_port = args.p_args['mysql_port']
 
+    mysql_pool_min = int(conf_args.get("mysql_pool_min", 1))  # 连接池保持的最少连接数
+    mysql_pool_max = int(conf_args.get("mysql_pool_max", 10))  # 连接池允许的最多连接数
+    mysql_pool_ping = float(conf_args.get("mysql_pool_ping", 60))  # 连接空闲超过该秒数后, 使用前先 ping
+    mysql_pool_timeout = float(conf_args.get("mysql_pool_timeout", 30))  # 等待空闲连接的最长时间
+
+    slow_query_time = float(conf_args.get("slow_query_time", 0.5))  # 超过该秒数的语句记入慢查询日志
+    slow_query_log = conf_args.get("slow_query_log", os.path.join(conf_path, "log", "slow_query.log"))  # 为空则不记录
+    slow_query_log_size = int(conf_args.get("slow_query_log_size", 4 * 1024 * 1024))  # 单个日志文件的大小
+    slow_query_log_count = int(conf_args.get("slow_query_log_count", 5))  # 保留的日志文件个数
+    query_stats_top = int(conf_args.get("query_stats_top", 20))  # 管理员界面显示的语句个数
+
+    query_cache = bool(conf_args.get("query_cache", True))  # 是否启用查询缓存
+    query_cache_ttl = float(conf_args.get("query_cache_ttl", 10))  # 缓存结果的有效时间
+    query_cache_size = int(conf_args.get("query_cache_size", 512))  # 缓存结果的最大个数
+
+    leaderboard = bool(conf_args.get("leaderboard", True))  # 是否使用内存排行榜
+    leaderboard_reload = float(conf_args.get("leaderboard_reload", 60))  # 内存排行榜从数据库重新加载的间隔
+
+    sqlite_path = conf_args.get("sqlite_path", os.path.join(conf_path, "hgssystem.db"))  # SQLite 数据库文件
+    sqlite_timeout = float(conf_args.get("sqlite_timeout", 30))  # 等待数据库写锁的最长时间
+
 
 ConfigDatabase = ConfigDatabaseRelease
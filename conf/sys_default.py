@@ -18,6 +18,8 @@ class ConfUserRelease:
 
     max_score = int(conf_args.get("max_score", 500))
 
+    user_lease_time = float(conf_args.get("user_lease_time", 300))  # 用户锁 (租约) 的有效时间, 超时后自动失效
+
 
 class ConfigSystemRelease:
     """ 系统信息相关配置 """
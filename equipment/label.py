@@ -0,0 +1,386 @@
+"""
+二维码标签 (用户二维码、垃圾袋二维码) 生成
+标签中不变的部分 (标题、垃圾站地点、缩放后的 logo、文字尺寸) 只生成一次, 之后每个标签复制底图后只绘制二维码和变化的文字
+二维码直接由 qrcode 生成的矩阵转换为图片, 不使用 qrcode 逐个方块绘制的 make_image
+批量生成时使用进程池并行生成, 并通过回调报告进度
+
+批量生成的输出方式:
+    png: 每个标签保存为一个 PNG 文件
+    zip: 所有标签的 PNG 写入一个 ZIP 文件 (不生成中间文件)
+    pdf, tiff: 标签按 sheet_columns x sheet_rows 排版到 A4 页面, 写入一个多页文件, 可直接打印
+
+本模块只依赖 PIL 和 qrcode, 进程池的子进程不需要导入摄像头等模块
+"""
+
+import io
+import os
+import zlib
+import zipfile
+import functools
+import traceback
+import concurrent.futures
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import qrcode
+from PIL import Image, ImageDraw, ImageFont, TiffImagePlugin
+
+from conf import Config
+from tool.typing import *
+
+label_width = 510
+qr_size = 500
+logo_size = 64
+
+title_font = ("noto-bold", 35)
+sub_font = ("noto-medium", 30)
+info_font = ("noto", 30)
+
+sheet_dpi = 200
+sheet_size = (1654, 2339)  # A4
+sheet_columns = 3
+sheet_rows = 3
+
+label_output = ["png", "pdf", "tiff", "zip"]  # 批量生成的输出方式
+
+label_t = Tuple[str, str, str, bool, str, Tuple[int, int, int], str]  # 标签: data, 标题, 副标题, 副标题是否不变, 信息, 信息颜色, 文件名
+label_progress_t = Optional[Callable[[int, int], None]]  # 进度回调: (已生成个数, 总数)
+
+
+@functools.lru_cache(maxsize=None)
+def get_font(font: Tuple[str, int]) -> ImageFont.FreeTypeFont:
+    return ImageFont.truetype(font=Config.font_d[font[0]], size=font[1], encoding="unic")
+
+
+@functools.lru_cache(maxsize=None)
+def get_logo() -> Image.Image:
+    return Image.open(Config.picture_d['logo']).resize((logo_size, logo_size))
+
+
+def text_size(font: Tuple[str, int], text: str) -> Tuple[int, int]:
+    f = get_font(font)
+    if hasattr(f, "getsize"):
+        return f.getsize(text)
+    left, top, right, bottom = f.getbbox(text)  # Pillow 10 移除了 getsize
+    return right, bottom
+
+
+@functools.lru_cache(maxsize=64)
+def get_text_size(font: Tuple[str, int], text: str) -> Tuple[int, int]:
+    """ 不变的文字 (标题等) 的尺寸 """
+    return text_size(font, text)
+
+
+@functools.lru_cache(maxsize=64)
+def __get_canvas(title: str, sub: Optional[str], sub_height: int) -> Image.Image:
+    """
+    标签底图
+    :param title: 标题
+    :param sub: 副标题 (副标题随标签变化时为 None, 不绘制)
+    :param sub_height: 副标题高度
+    :return:
+    """
+    title_width, title_height = get_text_size(title_font, title)
+    image = Image.new('RGB', (label_width, qr_size + title_height + sub_height + 110), (255, 255, 255))
+    draw = ImageDraw.Draw(image)
+    draw.text((((label_width - title_width) / 2), 5), title, (0, 0, 0), font=get_font(title_font))
+    if sub is not None:
+        sub_width = min(get_text_size(sub_font, sub)[0], label_width)
+        draw.text((((label_width - sub_width) / 2), title_height + 5), sub, (0, 0, 0), font=get_font(sub_font))
+    return image
+
+
+def make_qr_image(data: str) -> Image.Image:
+    """
+    生成带 logo 的二维码图片
+    :param data: 二维码内容
+    :return:
+    """
+    qr = qrcode.QRCode(version=None, box_size=1, border=4)
+    qr.add_data(data)
+    qr.make(fit=True)
+    matrix = np.array(qr.get_matrix(), dtype=np.uint8)  # 包括边框, 1 为黑色
+    qr_img = Image.fromarray((1 - matrix) * 255, mode="L").convert("RGB")
+    qr_img = qr_img.resize((qr_size, qr_size), Image.NEAREST)
+    qr_img.paste(get_logo(), (int((qr_size - logo_size) / 2), int((qr_size - logo_size) / 2)))
+    return qr_img
+
+
+def render_label(data: str, title: str, sub: str, sub_static: bool, info: str,
+                 info_color: Tuple[int, int, int]) -> Image.Image:
+    """
+    生成标签
+    :param data: 二维码内容
+    :param title: 标题
+    :param sub: 副标题
+    :param sub_static: 副标题对所有标签都相同 (绘制在底图中)
+    :param info: 二维码下方的信息
+    :param info_color: 信息的颜色
+    :return:
+    """
+    qr_img = make_qr_image(data)
+    title_height = get_text_size(title_font, title)[1]
+    sub_width, sub_height = (get_text_size if sub_static else text_size)(sub_font, sub)
+    sub_width = min(sub_width, label_width)
+    info_width = text_size(info_font, info)[0]
+
+    image = __get_canvas(title, sub if sub_static else None, sub_height).copy()
+    draw = ImageDraw.Draw(image)
+    if not sub_static:
+        draw.text((((label_width - sub_width) / 2), title_height + 5), sub, (0, 0, 0), font=get_font(sub_font))
+    image.paste(qr_img, (5, title_height + sub_height + 10))
+    draw.text((((label_width - info_width) / 2), qr_size + title_height + sub_height + 10), info,
+              info_color, font=get_font(info_font))
+    return image
+
+
+def render_sheet(labels: List[label_t]) -> Image.Image:
+    """
+    把标签排版到一页 (按行排列, 每个标签在格子中居中)
+    :param labels: 标签 (最多 sheet_columns * sheet_rows 个)
+    :return:
+    """
+    sheet = Image.new('RGB', sheet_size, (255, 255, 255))
+    cell_width = sheet_size[0] // sheet_columns
+    cell_height = sheet_size[1] // sheet_rows
+    for i, label in enumerate(labels):
+        image = render_label(*label[:-1])
+        x = (i % sheet_columns) * cell_width + (cell_width - image.width) // 2
+        y = (i // sheet_columns) * cell_height + (cell_height - image.height) // 2
+        sheet.paste(image, (x, max(y, 0)))
+    return sheet
+
+
+def __to_png(image: Image.Image) -> bytes:
+    buf = io.BytesIO()
+    image.save(buf, format="PNG", compress_level=1)  # 标签大部分为空白, 低压缩级别的文件大小相差不大, 但保存快得多
+    return buf.getvalue()
+
+
+def make_label(data: str, title: str, sub: str, sub_static: bool, info: str, info_color: Tuple[int, int, int],
+               path: str) -> bool:
+    """
+    生成标签并保存为 PNG
+    :param data: 二维码内容
+    :param title: 标题
+    :param sub: 副标题
+    :param sub_static: 副标题对所有标签都相同 (绘制在底图中)
+    :param info: 二维码下方的信息
+    :param info_color: 信息的颜色
+    :param path: 保存路径
+    :return:
+    """
+    try:
+        image = render_label(data, title, sub, sub_static, info, info_color)
+        with open(path, "wb") as f:
+            f.write(__to_png(image))
+    except (IOError, ValueError):
+        traceback.print_exc()
+        return False
+    return True
+
+
+def __make_label(label: label_t) -> bool:
+    return make_label(*label)
+
+
+def __make_label_png(label: label_t) -> Optional[bytes]:
+    try:
+        return __to_png(render_label(*label[:-1]))
+    except (IOError, ValueError):
+        traceback.print_exc()
+        return None
+
+
+def __make_sheet_png(labels: List[label_t]) -> Optional[bytes]:
+    try:
+        return __to_png(render_sheet(labels))
+    except (IOError, ValueError):
+        traceback.print_exc()
+        return None
+
+
+def __make_sheet_pdf(labels: List[label_t]) -> Optional[Tuple[int, int, bytes]]:
+    try:
+        sheet = render_sheet(labels)
+        return sheet.width, sheet.height, zlib.compress(sheet.tobytes(), 6)
+    except (IOError, ValueError):
+        traceback.print_exc()
+        return None
+
+
+class PdfSheetWriter:
+    """
+    逐页写入 PDF, 每页为一张 FlateDecode (无损) 压缩的 RGB 图像
+    写完一页后不再保留该页, 页面树和交叉引用表在关闭时写入
+    """
+
+    def __init__(self, path: str, dpi: int = sheet_dpi):
+        self._f = open(path, "wb")
+        self._dpi = dpi
+        self._offset: List[int] = []  # 每个对象在文件中的位置
+        self._pages: List[int] = []
+        self._f.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        self._pages_id = self.__new_obj()
+
+    def __new_obj(self) -> int:
+        self._offset.append(0)
+        return len(self._offset)
+
+    def __write_obj(self, obj_id: int, obj: bytes, stream: Optional[bytes] = None):
+        self._offset[obj_id - 1] = self._f.tell()
+        self._f.write(b"%d 0 obj\n" % obj_id + obj)
+        if stream is not None:
+            self._f.write(b"\nstream\n" + stream + b"\nendstream")
+        self._f.write(b"\nendobj\n")
+
+    def add_page(self, width: int, height: int, data: bytes):
+        """
+        :param width: 图像宽度
+        :param height: 图像高度
+        :param data: zlib 压缩的 RGB 数据
+        """
+        w = width * 72.0 / self._dpi
+        h = height * 72.0 / self._dpi
+        image_id = self.__new_obj()
+        self.__write_obj(image_id, b"<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace /DeviceRGB "
+                                   b"/BitsPerComponent 8 /Filter /FlateDecode /Length %d >>"
+                         % (width, height, len(data)), data)
+        content = b"q %.2f 0 0 %.2f 0 0 cm /Im0 Do Q" % (w, h)
+        content_id = self.__new_obj()
+        self.__write_obj(content_id, b"<< /Length %d >>" % len(content), content)
+        page_id = self.__new_obj()
+        self.__write_obj(page_id, b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %.2f %.2f] "
+                                  b"/Resources << /XObject << /Im0 %d 0 R >> >> /Contents %d 0 R >>"
+                         % (self._pages_id, w, h, image_id, content_id))
+        self._pages.append(page_id)
+
+    def close(self):
+        kids = b" ".join(b"%d 0 R" % i for i in self._pages)
+        self.__write_obj(self._pages_id, b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(self._pages)))
+        catalog_id = self.__new_obj()
+        self.__write_obj(catalog_id, b"<< /Type /Catalog /Pages %d 0 R >>" % self._pages_id)
+
+        xref = self._f.tell()
+        self._f.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(self._offset) + 1))
+        self._f.write(b"".join(b"%010d 00000 n \n" % i for i in self._offset))
+        self._f.write(b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+                      % (len(self._offset) + 1, catalog_id, xref))
+        self._f.close()
+
+
+def __map(func: Callable, jobs: list, count: int, chunk: int):
+    """
+    按顺序返回每个任务的结果
+    任务较多时使用进程池 (进程数为 Config.qr_label_workers, 为 0 时使用 CPU 核心数), 无法使用进程池时在本进程中执行剩余的任务
+    :param func: 任务函数
+    :param jobs: 任务
+    :param count: 标签总数
+    :param chunk: 每次分配给子进程的任务数
+    :return:
+    """
+    done = 0
+    if Config.qr_label_workers != 1 and count >= Config.qr_label_pool_min:
+        try:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=Config.qr_label_workers or None) as pool:
+                for res in pool.map(func, jobs, chunksize=max(chunk, 1)):
+                    done += 1
+                    yield res
+        except (OSError, BrokenProcessPool):
+            traceback.print_exc()
+
+    for job in jobs[done:]:
+        yield func(job)
+
+
+def __write_png(labels: List[label_t], path: str, progress: label_progress_t) -> List[bool]:
+    dirs = {os.path.dirname(os.path.join(path, label[-1])) for label in labels}
+    for dir_ in dirs:
+        if len(dir_) > 0:
+            os.makedirs(dir_, exist_ok=True)  # 每个目录只创建一次
+
+    labels = [(*label[:-1], os.path.join(path, label[-1])) for label in labels]
+    res: List[bool] = []
+    for ok in __map(__make_label, labels, len(labels), Config.qr_label_chunk):
+        res.append(ok)
+        if progress is not None:
+            progress(len(res), len(labels))
+    return res
+
+
+def __write_zip(labels: List[label_t], path: str, progress: label_progress_t) -> List[bool]:
+    res: List[bool] = []
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_STORED) as zf:  # PNG 已经压缩
+        for label, png in zip(labels, __map(__make_label_png, labels, len(labels), Config.qr_label_chunk)):
+            if png is not None:
+                zf.writestr(label[-1], png)
+            res.append(png is not None)
+            if progress is not None:
+                progress(len(res), len(labels))
+    return res
+
+
+def __write_sheet(labels: List[label_t], path: str, output: str, progress: label_progress_t) -> List[bool]:
+    """ 排版后逐页写入多页 PDF 或 TIFF (内存中只保留当前页) """
+    if len(labels) == 0:
+        return []  # 不生成没有页面的文件 (阅读器无法打开)
+
+    per_sheet = sheet_columns * sheet_rows
+    sheets = [labels[i:i + per_sheet] for i in range(0, len(labels), per_sheet)]
+    res: List[bool] = []
+    if output == "pdf":
+        writer, func = PdfSheetWriter(path), __make_sheet_pdf
+    else:
+        writer, func = TiffImagePlugin.AppendingTiffWriter(path, new=True), __make_sheet_png
+
+    try:
+        for sheet, page in zip(sheets, __map(func, sheets, len(labels), Config.qr_label_chunk // per_sheet)):
+            if page is None:
+                pass
+            elif output == "pdf":
+                writer.add_page(*page)
+            else:
+                Image.open(io.BytesIO(page)).save(writer, format="TIFF", compression="tiff_deflate",
+                                                  dpi=(sheet_dpi, sheet_dpi))
+                writer.newFrame()
+            res += [page is not None] * len(sheet)
+            if progress is not None:
+                progress(len(res), len(labels))
+    finally:
+        writer.close()
+    return res
+
+
+def make_labels(labels: List[label_t], path: str, output: str = "png", progress: label_progress_t = None) -> List[bool]:
+    """
+    批量生成标签
+    :param labels: 标签 (最后一项为文件名)
+    :param path: 输出位置 (png 为目录, 其余为文件)
+    :param output: 输出方式, 见 label_output
+    :param progress: 进度回调
+    :return: 每个标签是否生成成功
+    """
+    try:
+        if output == "png":
+            return __write_png(labels, path, progress)
+        elif output == "zip":
+            return __write_zip(labels, path, progress)
+        elif output == "pdf" or output == "tiff":
+            return __write_sheet(labels, path, output, progress)
+    except IOError:
+        traceback.print_exc()
+        return [False] * len(labels)
+    raise ValueError(f"unknown label output: {output}")
+
+
+def get_label_name(label: label_t, path: str, output: str = "png") -> str:
+    """
+    生成的标签的名称
+    :param label: 标签
+    :param path: 输出位置
+    :param output: 输出方式
+    :return: png 为标签文件的完整路径, 其余为标签在输出文件 (path) 中的名称 (zip 中的文件名, pdf/tiff 中的标签名)
+    """
+    if output == "png":
+        return os.path.join(path, label[-1])
+    return label[-1]
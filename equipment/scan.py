@@ -1,7 +1,10 @@
 import time
 import threading
+import traceback
+import collections
+import multiprocessing
 import cv2.cv2 as cv2
-from PIL.Image import Image, FLIP_LEFT_RIGHT, fromarray
+from PIL.Image import Image, fromarray
 import io
 import numpy as np
 
@@ -9,8 +12,180 @@ from conf import Config
 import qrcode
 from tool.typing import *
 
+try:
+    from multiprocessing.shared_memory import SharedMemory
+except ImportError:  # Python 3.8 以下没有共享内存, 只能在本进程中识别二维码
+    SharedMemory = None
+
+
+class HGSFrame:
+    """
+    摄像头的一帧
+    只保存摄像头读取到的原始数组, 灰度图、镜像图像、预览图像等在第一次使用时生成, 并缓存在该帧中
+    界面和二维码识别使用同一帧时, 每种转换只执行一次
+    """
+
+    def __init__(self, frame_id: int, frame_time: time_t, raw: np.ndarray, bgr: bool):
+        """
+        :param frame_id: 帧序号
+        :param frame_time: 读取的时间
+        :param raw: 摄像头读取到的数组 (不会被修改)
+        :param bgr: 数组是否为 BGR 格式 (OpenCV), 否则为 RGB 格式 (picamera)
+        """
+        self.frame_id = frame_id
+        self.time = frame_time
+        self._raw = raw
+        self._bgr = bgr
+        self._cache: Dict[tuple, any] = {}
+
+    def get_raw(self) -> np.ndarray:
+        return self._raw
+
+    def get_gray(self, width: Optional[int] = None) -> np.ndarray:
+        """
+        获取灰度图 (不是镜像的)
+        :param width: 宽度大于该值时等比例缩小到该宽度
+        :return:
+        """
+        key = ("gray", width)
+        gray = self._cache.get(key)
+        if gray is None:
+            gray = cv2.cvtColor(self._raw, cv2.COLOR_BGR2GRAY if self._bgr else cv2.COLOR_RGB2GRAY)
+            height, raw_width = gray.shape
+            if width is not None and raw_width > width:
+                gray = cv2.resize(gray, (width, int(height * width / raw_width)), interpolation=cv2.INTER_AREA)
+            self._cache[key] = gray
+        return gray
+
+    def __to_image(self, array: np.ndarray) -> Image:
+        """ 转换为镜像的 RGB 图像 (会修改 array, array 必须是新生成的数组) """
+        if self._bgr:
+            cv2.cvtColor(array, cv2.COLOR_BGR2RGB, dst=array)
+        cv2.flip(array, 1, dst=array)
+        return fromarray(array)
+
+    def get_image(self) -> Image:
+        """ 获取镜像的 RGB 图像 (原始大小) """
+        key = ("image",)
+        image = self._cache.get(key)
+        if image is None:
+            image = self.__to_image(self._raw.copy())
+            self._cache[key] = image
+        return image
+
+    def get_preview(self, width: int, height: int) -> Image:
+        """
+        获取预览图像 (镜像)
+        按比例缩放到刚好覆盖 width * height 后居中裁剪
+        先在原始数组上裁剪 (不复制), 再直接缩放到目标大小, 颜色转换和镜像都在缩放后的小图上原地完成
+        :param width: 宽度
+        :param height: 高度
+        :return:
+        """
+        key = ("preview", width, height)
+        image = self._cache.get(key)
+        if image is None:
+            raw_height, raw_width = self._raw.shape[:2]
+            proportion = max(width / raw_width, height / raw_height)  # 缩放倍数, 取较大的那个
+            crop_width = min(int(round(width / proportion)), raw_width)
+            crop_height = min(int(round(height / proportion)), raw_height)
+            left = (raw_width - crop_width) // 2
+            top = (raw_height - crop_height) // 2
+            crop = self._raw[top:top + crop_height, left:left + crop_width]
+            interpolation = cv2.INTER_AREA if proportion < 1 else cv2.INTER_LINEAR
+            image = self.__to_image(cv2.resize(crop, (width, height), interpolation=interpolation))
+            self._cache[key] = image
+        return image
+
+
+class HGSCaptureBase:
+    """
+    摄像头
+    后台线程持续读取摄像头图像, 写入只保留最近若干帧的环形缓冲区
+    界面和二维码识别只读取最新的一帧, 不会因为摄像头读取缓慢或卡顿而阻塞
+    """
+    bgr = True  # 摄像头读取到的数组是否为 BGR 格式
+
+    def __init__(self, buffer_size: int = Config.capture_buffer):
+        self._buffer: Deque[HGSFrame] = collections.deque(maxlen=max(buffer_size, 1))
+        self._lock = threading.Lock()
+        self._frame_id = 0  # 已读取的帧数
+        self._last_id = 0  # 最近一次被读取的帧序号
+        self._dropped = 0  # 未被读取就被覆盖的帧数
+        self._error = 0  # 读取摄像头失败的次数
+        self._running = True
+        self._thread = threading.Thread(target=self.__run, name="HGSCapture", daemon=True)
+        self._thread.start()
+
+    def _read(self) -> Optional[any]:
+        """ 读取一帧 (在后台线程中调用), 失败返回 None """
+        ...
+
+    def _close(self):
+        """ 关闭摄像头 (在后台线程中调用) """
+        ...
+
+    def __run(self):
+        try:
+            while self._running:
+                try:
+                    frame = self._read()
+                except Exception:
+                    traceback.print_exc()
+                    frame = None
+
+                if frame is None:
+                    with self._lock:
+                        self._error += 1
+                    time.sleep(Config.capture_retry)  # 摄像头异常时稍后再试
+                    continue
+
+                now = time.time()
+                with self._lock:
+                    self._frame_id += 1
+                    if len(self._buffer) == self._buffer.maxlen and self._buffer[0].frame_id > self._last_id:
+                        self._dropped += 1
+                    self._buffer.append(HGSFrame(self._frame_id, now, frame, self.bgr))
+        finally:
+            self._close()
+
+    def stop(self):
+        """ 停止读取摄像头 """
+        self._running = False
+        if self._thread is not threading.current_thread():
+            self._thread.join(Config.capture_retry + 1)
+
+    def get_image(self) -> bool:
+        """
+        是否有新的图像 (不阻塞)
+        :return: 上次读取后是否读取到了新的一帧
+        """
+        with self._lock:
+            return self._frame_id > self._last_id
+
+    def get_frame(self) -> Optional[HGSFrame]:
+        """
+        获取最新的一帧 (不阻塞)
+        :return: 帧, 还没有读取到图像时返回 None
+        """
+        with self._lock:
+            if len(self._buffer) == 0:
+                return None
+            latest = self._buffer[-1]
+            self._last_id = latest.frame_id
+        return latest
+
+    def get_stats(self) -> Dict[str, float]:
+        """
+        :return: frames 读取的帧数, dropped 未被读取就被覆盖的帧数, error 读取失败的次数, age 最新一帧距今的秒数
+        """
+        with self._lock:
+            age = time.time() - self._buffer[-1].time if len(self._buffer) != 0 else -1
+            return {"frames": self._frame_id, "dropped": self._dropped, "error": self._error, "age": age}
+
+
 if Config.use_opencv:
-    class HGSCapture:
+    class HGSCapture(HGSCaptureBase):
         """ 摄像头扫描 """
 
         def __init__(self, capnum: int = Config.capture_num, *args, **kwargs):
@@ -18,65 +193,57 @@ if Config.use_opencv:
             if cv2.CAP_DSHOW not in args:
                 args = *args, cv2.CAP_DSHOW
             self._capture = cv2.VideoCapture(int(capnum), *args, **kwargs)
-            self._frame = None
-            self._lock = threading.RLock()
+            super(HGSCapture, self).__init__()
 
-        def get_image(self) -> bool:
-            """ 获取摄像头图像 """
-            try:
-                self._lock.acquire()
-                ret, frame = self._capture.read()
-                if ret:
-                    self._frame = frame
-            finally:
-                self._lock.release()
-            return ret
-
-        def get_frame(self) -> Image:
-            """ 获取 frame """
-            try:
-                self._lock.acquire()
-                frame = fromarray(cv2.cvtColor(self._frame, cv2.COLOR_BGR2RGB)).transpose(FLIP_LEFT_RIGHT)
-            finally:
-                self._lock.release()
-            return frame
+        def _read(self):
+            ret, frame = self._capture.read()
+            return frame if ret else None
+
+        def _close(self):
+            self._capture.release()
 else:
     import picamera
 
 
-    class HGSCapture:
-        """ 摄像头扫描 """
+    class HGSCapture(HGSCaptureBase):
+        """
+        摄像头扫描 (picamera)
+        摄像头只打开一次, 通过视频端口连续捕获 RGB 图像到同一个 numpy 数组, 不需要每帧重新打开摄像头和解码 JPEG
+        """
+        bgr = False  # format="rgb"
 
-        def __init__(self):
-            self._frame = None
-            self._lock = threading.RLock()
+        def __init__(self, width: int = Config.capture_width, height: int = Config.capture_height,
+                     framerate: int = Config.capture_framerate):
+            self._resolution = (width // 32 * 32, height // 16 * 16)  # RGB 输出要求的对齐
+            self._framerate = framerate
+            self._camera: Optional[picamera.PiCamera] = None
+            self._stream = None
+            self._array = np.empty((self._resolution[1], self._resolution[0], 3), dtype=np.uint8)
+            super(HGSCapture, self).__init__()
 
-        def get_image(self) -> bool:
-            """ 获取摄像头图像 """
-            try:
-                self._lock.acquire()
-                stream = io.BytesIO()
-                with picamera.PiCamera() as camera:
-                    camera.start_preview()
-                    time.sleep(2)
-                    camera.capture(stream, format='jpeg')
-                # 将指针指向流的开始
-                stream.seek(0)
-                self._frame = Image.open(stream)
-            except:
-                return False
-            finally:
-                self._lock.release()
-            return True
+        def __open(self):
+            self._camera = picamera.PiCamera(resolution=self._resolution, framerate=self._framerate)
+            time.sleep(2)  # 等待摄像头自动调整曝光 (只在打开时等待一次)
+            self._stream = self._camera.capture_continuous(self._array, format="rgb", use_video_port=True)
 
-        def get_frame(self) -> Image:
-            """ 获取 frame """
+        def _read(self):
             try:
-                self._lock.acquire()
-                frame = self._frame
-            finally:
-                self._lock.release()
-            return frame
+                if self._camera is None:
+                    self.__open()
+                next(self._stream)
+            except Exception:
+                self._close()  # 下次读取时重新打开摄像头
+                raise
+            return self._array.copy()  # 数组会被下一帧覆盖
+
+        def _close(self):
+            if self._camera is not None:
+                try:
+                    self._camera.close()
+                except Exception:
+                    traceback.print_exc()
+            self._camera = None
+            self._stream = None
 
 
 class QRCode:
@@ -116,13 +283,207 @@ class QRCode:
         return qr.make_image()
 
 
+box_t = Tuple[int, int, int, int]  # 二维码在灰度图中的位置 (x0, y0, x1, y1)
+
+
+class QRDecoder:
+    """
+    二维码识别
+    复用同一个 QRCodeDetector, 识别到二维码后记录其位置, 之后先在该位置附近识别, 失败时再识别整幅图像
+    """
+
+    def __init__(self):
+        self._detector = cv2.QRCodeDetector()
+        self._roi: Optional[box_t] = None  # 上一个二维码附近的区域
+
+    def __detect(self, gray: np.ndarray, shape: Tuple[int, int], x: int = 0, y: int = 0) -> Tuple[str, Optional[box_t]]:
+        """
+        识别二维码, 识别成功时记录二维码附近的区域
+        :param gray: 灰度图 (可以是整幅图像的一部分)
+        :param shape: 整幅图像的大小
+        :param x: gray 在整幅图像中的位置
+        :param y: gray 在整幅图像中的位置
+        :return: 二维码的内容, 二维码的位置
+        """
+        try:
+            data, points, _ = self._detector.detectAndDecode(gray)
+        except cv2.error:
+            return "", None
+        if len(data) == 0 or points is None:
+            return "", None
+
+        points = points.reshape(-1, 2) + (x, y)
+        (x0, y0), (x1, y1) = points.min(axis=0), points.max(axis=0)
+        margin_x, margin_y = (x1 - x0) * Config.qr_roi_margin, (y1 - y0) * Config.qr_roi_margin
+        height, width = shape
+        self._roi = (max(int(x0 - margin_x), 0), max(int(y0 - margin_y), 0),
+                     min(int(x1 + margin_x), width), min(int(y1 + margin_y), height))
+        return data, (int(x0), int(y0), int(x1), int(y1))
+
+    def decode(self, gray: np.ndarray) -> Tuple[str, Optional[box_t]]:
+        """
+        :param gray: 灰度图
+        :return: 二维码的内容 (没有二维码时为空字符串), 二维码的位置
+        """
+        if self._roi is not None:
+            x0, y0, x1, y1 = self._roi
+            data, box = self.__detect(gray[y0:y1, x0:x1], gray.shape, x0, y0)
+            if len(data) > 0:
+                return data, box
+        data, box = self.__detect(gray, gray.shape)
+        if len(data) == 0:
+            self._roi = None
+        return data, box
+
+
+def qr_decode_worker(conn):
+    """
+    二维码识别进程
+    从管道接收 (共享内存名, 图像大小, 帧序号), 识别共享内存中的灰度图, 通过管道返回 (共享内存名, 帧序号, 内容, 位置)
+    收到 None 时退出
+    """
+    decoder = QRDecoder()
+    shm: Dict[str, SharedMemory] = {}
+    try:
+        while True:
+            msg = conn.recv()
+            if msg is None:
+                break
+            name, shape, frame_id = msg
+            if name not in shm:
+                if len(shm) >= 2:  # 共享内存被重新创建, 关闭最早打开的
+                    shm.pop(next(iter(shm))).close()
+                shm[name] = SharedMemory(name=name)
+            gray = np.ndarray(shape, dtype=np.uint8, buffer=shm[name].buf)
+            data, box = decoder.decode(gray)
+            del gray  # 关闭共享内存前需要释放对其的引用
+            conn.send((name, frame_id, data, box))
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        for i in shm.values():
+            i.close()
+
+
+class QRDecodeWorker:
+    """
+    二维码识别子进程 (多核CPU上识别二维码时不占用界面所在进程)
+    灰度图写入两块共享内存中的一块 (双缓冲), 通过管道通知子进程识别, 子进程通过管道返回识别结果
+    子进程识别期间到达的帧写入另一块共享内存, 只保留最新的一帧, 上一帧识别完成后再发送
+    """
+
+    def __init__(self):
+        context = multiprocessing.get_context("spawn")  # 不 fork 含有 Tk 和摄像头线程的进程
+        self._conn, child_conn = context.Pipe()
+        self._process = context.Process(target=qr_decode_worker, args=(child_conn,), name="HGSQRDecoder",
+                                        daemon=True)
+        self._process.start()
+        child_conn.close()
+        self._shm: List[Optional[SharedMemory]] = [None, None]
+        self._busy: Optional[int] = None  # 子进程正在识别的共享内存
+        self._next: Optional[Tuple[int, Tuple[int, int], int]] = None  # 等待发送的帧 (共享内存, 图像大小, 帧序号)
+
+    def __get_shm(self, index: int, size: int) -> SharedMemory:
+        shm = self._shm[index]
+        if shm is None or shm.size < size:  # 图像变大时重新创建 (该共享内存此时没有被子进程使用)
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+            shm = self._shm[index] = SharedMemory(create=True, size=size)
+        return shm
+
+    def __send(self):
+        if self._busy is not None or self._next is None:
+            return
+        index, shape, frame_id = self._next
+        self._conn.send((self._shm[index].name, shape, frame_id))
+        self._busy = index
+        self._next = None
+
+    def is_busy(self) -> bool:
+        return self._busy is not None
+
+    def submit(self, gray: np.ndarray, frame_id: int):
+        """
+        提交需要识别的灰度图 (不阻塞)
+        :param gray: 灰度图
+        :param frame_id: 帧序号
+        :return:
+        """
+        index = 0 if self._busy != 0 else 1
+        shm = self.__get_shm(index, gray.nbytes)
+        np.ndarray(gray.shape, dtype=np.uint8, buffer=shm.buf)[...] = gray
+        self._next = (index, gray.shape, frame_id)
+        self.__send()
+
+    def poll(self) -> Optional[Tuple[int, str, Optional[box_t]]]:
+        """
+        获取识别结果 (不阻塞)
+        :return: 最新的识别结果 (帧序号, 内容, 位置), 没有新的结果时返回 None
+        """
+        res = None
+        while self._conn.poll():
+            _, frame_id, data, box = self._conn.recv()
+            self._busy = None
+            res = frame_id, data, box
+            self.__send()
+        return res
+
+    def close(self):
+        try:
+            self._conn.send(None)
+        except OSError:
+            pass
+        self._process.join(1)
+        if self._process.is_alive():
+            self._process.terminate()
+        self._conn.close()
+        for shm in self._shm:
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+        self._shm = [None, None]
+
+
 class HGSQRCoder:
-    """ 二维码扫描仪 """
+    """
+    二维码扫描仪
+    在缩小后的灰度图上识别, 图像与上一次识别到二维码时几乎相同时不再识别, 直接沿用上一次的结果
+    启用 Config.qr_worker 时在子进程中识别, 本进程只提交图像和读取结果
+    """
 
-    def __init__(self, cap: HGSCapture):
+    def __init__(self, cap: HGSCapture, worker: bool = Config.qr_worker):
         self._cap = cap
         self._last_qr: Optional[QRCode] = None
         self._lock = threading.RLock()
+        self._decoder = QRDecoder()
+        self._worker: Optional[QRDecodeWorker] = None
+        if worker and SharedMemory is not None:
+            try:
+                self._worker = QRDecodeWorker()
+            except OSError:
+                traceback.print_exc()
+        self._thumb: Optional[np.ndarray] = None  # 上一次得到识别结果的帧的缩略图
+        self._thumb_time: float = 0  # 上一次得到识别结果的时间
+        self._pending: Dict[int, np.ndarray] = {}  # 已提交给识别进程、尚未返回结果的帧的缩略图
+        self._last_data: str = ""  # 上一次识别的结果
+        self._last_box: Optional[box_t] = None  # 上一次识别到的二维码的位置
+
+    def stop(self):
+        """ 停止识别进程 """
+        with self._lock:
+            if self._worker is not None:
+                self._worker.close()
+                self._worker = None
+
+    def is_waiting(self) -> bool:
+        """ 是否在等待识别进程的结果 """
+        with self._lock:
+            return self._worker is not None and self._worker.is_busy()
+
+    def get_box(self) -> Optional[box_t]:
+        """ 上一次识别到的二维码在灰度图 (宽为 Config.qr_scan_width) 中的位置 """
+        return self._last_box
 
     def get_qr_code(self) -> Optional[QRCode]:
         try:
@@ -136,19 +497,75 @@ class HGSQRCoder:
             return last_qr
         return None
 
+    def __is_changed(self, thumb: np.ndarray) -> bool:
+        """
+        是否需要重新识别
+        图像与上一次得到识别结果时几乎相同, 且上一次识别到了二维码时, 沿用上一次的结果
+        上一次没有识别到二维码时 (例如二维码模糊或不完整), 即使图像几乎不变也每隔 Config.qr_scan_refresh 秒重新识别
+        """
+        if self._thumb is None or np.abs(thumb - self._thumb).mean() >= Config.qr_scan_diff:
+            return True
+        return len(self._last_data) == 0 and time.time() - self._thumb_time >= Config.qr_scan_refresh
+
+    def __set_result(self, thumb: np.ndarray, data: str, box: Optional[box_t]):
+        """ 得到识别结果后才记录该帧的缩略图 """
+        self._thumb = thumb
+        self._thumb_time = time.time()
+        self._last_data, self._last_box = data, box
+
+    def __worker_error(self):
+        """ 识别进程异常, 改为在本进程中识别 """
+        traceback.print_exc()
+        self._worker.close()
+        self._worker = None
+        self._thumb = None
+        self._pending.clear()
+
+    def __decode(self, frame: HGSFrame):
+        gray = frame.get_gray(Config.qr_scan_width)
+        thumb = cv2.resize(gray, (32, 24), interpolation=cv2.INTER_AREA).astype(np.int16)
+        if not self.__is_changed(thumb):
+            return
+
+        if self._worker is not None:
+            try:
+                self._worker.submit(gray, frame.frame_id)
+                self._pending[frame.frame_id] = thumb
+                return
+            except OSError:
+                self.__worker_error()
+        self.__set_result(thumb, *self._decoder.decode(gray))
+
+    def __poll(self):
+        try:
+            res = self._worker.poll()
+        except (OSError, EOFError):
+            self.__worker_error()
+            return
+        if res is None:
+            return
+        frame_id, data, box = res
+        thumb = self._pending.pop(frame_id, None)
+        for i in [i for i in self._pending if i < frame_id]:  # 被新的帧替换而没有识别的帧
+            del self._pending[i]
+        if thumb is not None:
+            self.__set_result(thumb, data, box)
+        else:
+            self._last_data, self._last_box = data, box
+
     def is_qr_code(self) -> bool:
         try:
             self._lock.acquire()
 
-            frame: Image = self._cap.get_frame().transpose(FLIP_LEFT_RIGHT)
-            gray = cv2.cvtColor(cv2.cvtColor(np.asarray(frame), cv2.COLOR_RGB2BGR), cv2.COLOR_BGR2GRAY)
-            coder = cv2.QRCodeDetector()
-
-            try:
-                data, points, straight_qrcode = coder.detectAndDecode(gray)
-            except cv2.error:
+            frame: Optional[HGSFrame] = self._cap.get_frame()
+            if frame is None:
                 return False
 
+            self.__decode(frame)
+            if self._worker is not None:
+                self.__poll()
+            data = self._last_data
+
             old_qr: Optional[QRCode] = self._last_qr
 
             if len(data) > 0:
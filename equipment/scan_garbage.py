@@ -1,6 +1,5 @@
 import re
 import os.path
-from PIL import Image, ImageDraw, ImageFont
 
 from conf import Config
 from core.garbage import GarbageBag
@@ -8,12 +7,9 @@ from sql.db import DB
 from sql.garbage import find_garbage
 from tool.typing import *
 from .scan import QRCode
+from .label import make_label, make_labels, get_label_name, label_t, label_progress_t
 
 qr_user_pattern = re.compile(r'HGSSystem-QR-GARBAGE:([a-z0-9]+)-END', re.I)
-qr_img_title_font = ImageFont.truetype(font=Config.font_d["noto-bold"], size=35, encoding="unic")
-qr_img_title_b_font = ImageFont.truetype(font=Config.font_d["noto-medium"], size=30, encoding="unic")
-qr_img_info_font = ImageFont.truetype(font=Config.font_d["noto"], size=30, encoding="unic")
-qr_Watermark = ImageFont.truetype(font=Config.font_d["noto-black"], size=55, encoding="unic")
 
 
 def scan_gid(code: QRCode) -> gid_t:
@@ -32,68 +28,75 @@ def scan_garbage(code: QRCode, db: DB) -> Optional[GarbageBag]:
     return find_garbage(gid, db)
 
 
+def __get_gid_qr_name(gid: gid_t):
+    return f"gar-{gid}.png"
+
+
 def __get_gid_qr_file_name(gid: gid_t, path: str):
-    path = os.path.join(path, f"gar-{gid}.png")
+    path = os.path.join(path, __get_gid_qr_name(gid))
     dir_ = os.path.split(path)[0]
     if len(dir_) > 0:
         os.makedirs(dir_, exist_ok=True)  # 生成输出目录
     return path
 
 
-def make_gid_image(gid: gid_t, path: str):
-    qr = QRCode(f"HGSSystem-QR-GARBAGE:{gid}-END")
-    qr_img = qr.make_img().convert("RGB").resize((500, 500))
-    if not qr_img:
-        return False
-
-    title = f"HGSSystem 垃圾袋ID"
-    loc = f"垃圾站: {Config.base_location}"
-    title_width, title_height = qr_img_title_font.getsize(title)
-    loc_width, loc_height = qr_img_title_b_font.getsize(loc)
-    if len(str(gid)) > Config.show_gid_len:
-        gid = gid[-Config.show_gid_len:]
-    gid_width, gid_height = qr_img_info_font.getsize(gid)
-
-    if loc_width > 510:
-        loc_width = 510
-
-    image = Image.new('RGB', (510, 500 + title_height + loc_height + 110), (255, 255, 255))
-    logo_image = Image.open(Config.picture_d['logo']).resize((64, 64))
+def get_gid_label(gid: gid_t, path: str) -> label_t:
+    info = str(gid)
+    if len(info) > Config.show_gid_len:
+        info = info[-Config.show_gid_len:]
+    return (f"HGSSystem-QR-GARBAGE:{gid}-END", "HGSSystem 垃圾袋ID", f"垃圾站: {Config.base_location}", True, info,
+            (0, 0, 0), path)
 
-    draw = ImageDraw.Draw(image)
-    draw.text((((510 - title_width) / 2), 5), title, (0, 0, 0), font=qr_img_title_font)
-    draw.text((((510 - loc_width) / 2), title_height + 5), loc, (0, 0, 0), font=qr_img_title_b_font)
 
-    qr_img.paste(logo_image, (int((500 - 64) / 2), int((500 - 64) / 2)))
-    image.paste(qr_img, (5, title_height + loc_height + 10))
-
-    draw.text((((510 - gid_width) / 2), 500 + title_height + loc_height + 10), gid, (0, 0, 0), font=qr_img_info_font)
-
-    image.save(path)
-    return True
+def make_gid_image(gid: gid_t, path: str):
+    return make_label(*get_gid_label(gid, path))
 
 
 def write_gid_qr(gid: gid_t, path: str, db: DB) -> Tuple[str, Optional[GarbageBag]]:
     garbage = find_garbage(gid, db)
     if garbage is None:
         return "", None
+    return write_garbage_qr(garbage, path)
 
+
+def write_garbage_qr(garbage: GarbageBag, path: str) -> Tuple[str, Optional[GarbageBag]]:
+    """ 为已知存在的垃圾袋生成二维码 (不再查询数据库) """
+    gid = garbage.get_gid()
     path = __get_gid_qr_file_name(gid, path)
     if make_gid_image(gid, path):
         return path, garbage
     return "", None
 
 
-def write_all_gid_qr(path: str, db: DB, where: str = "") -> List[Tuple[str]]:
-    cur = db.search(columns=["GarbageID"], table="garbage", where=where)
-    if cur is None:
-        return []
-
-    re_list = []
-    for _ in range(cur.rowcount):
-        res = cur.fetchone()
-        assert len(res) == 1
-        path_ = __get_gid_qr_file_name(res[0], path)
-        if make_gid_image(str(res[0]), path_):
-            re_list.append((path_,))
-    return re_list
+def write_garbage_qr_batch(garbage: List[GarbageBag], path: str, progress: label_progress_t = None,
+                           output: str = "png") -> List[Tuple[str, Optional[GarbageBag]]]:
+    """
+    为已知存在的垃圾袋批量生成二维码 (并行生成)
+    :param garbage: 垃圾袋
+    :param path: 保存位置 (output 为 png 时是目录, 否则为文件)
+    :param progress: 进度回调
+    :param output: 输出方式 (png, pdf, tiff, zip)
+    :return: [(标签名, 垃圾袋), ...], 生成失败时为 ("", None), 标签名见 get_label_name
+    """
+    labels = [get_gid_label(gar.get_gid(), __get_gid_qr_name(gar.get_gid())) for gar in garbage]
+    return [(get_label_name(label, path, output), gar) if ok else ("", None)
+            for gar, label, ok in zip(garbage, labels, make_labels(labels, path, output, progress))]
+
+
+def write_all_gid_qr(path: str, db: DB, where: str = "", progress: label_progress_t = None,
+                     output: str = "png") -> List[Tuple[str]]:
+    """
+    导出垃圾袋二维码 (并行生成)
+    :param path: 保存位置 (output 为 png 时是目录, 否则为文件)
+    :param db: 数据库
+    :param where: 条件
+    :param progress: 进度回调
+    :param output: 输出方式 (png, pdf, tiff, zip)
+    :return: 已生成的标签 (png 为文件的完整路径, 其余为标签在输出文件中的名称)
+    """
+    labels = []
+    for rows in db.search_iter(columns=["GarbageID"], table="garbage", where=where):
+        for res in rows:
+            assert len(res) == 1
+            labels.append(get_gid_label(str(res[0]), __get_gid_qr_name(res[0])))
+    return [(get_label_name(label, path, output),) for label, ok in zip(labels, make_labels(labels, path, output, progress)) if ok]
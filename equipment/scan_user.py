@@ -1,6 +1,5 @@
 import re
 import os.path
-from PIL import Image, ImageDraw, ImageFont
 
 from conf import Config
 from core.user import User
@@ -9,11 +8,9 @@ from sql.db import DB
 from sql.user import find_user_by_id
 from tool.typing import *
 from .scan import QRCode
+from .label import make_label, make_labels, get_label_name, label_t, label_progress_t
 
 qr_user_pattern = re.compile(r'HGSSystem-QR-USER:([a-z0-9]{32})-END', re.I)
-qr_img_title_font = ImageFont.truetype(font=Config.font_d["noto-bold"], size=35, encoding="unic")
-qr_img_title_b_font = ImageFont.truetype(font=Config.font_d["noto-medium"], size=30, encoding="unic")
-qr_img_info_font = ImageFont.truetype(font=Config.font_d["noto"], size=30, encoding="unic")
 
 
 def scan_uid(code: QRCode) -> uid_t:
@@ -25,49 +22,30 @@ def scan_uid(code: QRCode) -> uid_t:
         return res.group(1)
 
 
-def __get_uid_qr_file_name(uid: uid_t, name: str, path: str, name_type="nu"):
+def __get_uid_qr_name(uid: uid_t, name: str, name_type="nu"):
     if name_type == "nu":
-        path = os.path.join(path, f"{name}-f{uid}.png")
+        return f"{name}-f{uid}.png"
     elif name_type == "n":
-        path = os.path.join(path, f"{name}.png")
-    else:
-        path = os.path.join(path, f"{uid}.png")
+        return f"{name}.png"
+    return f"{uid}.png"
+
 
+def __get_uid_qr_file_name(uid: uid_t, name: str, path: str, name_type="nu"):
+    path = os.path.join(path, __get_uid_qr_name(uid, name, name_type))
     dir_ = os.path.split(path)[0]
     if len(dir_) > 0:
         os.makedirs(dir_, exist_ok=True)  # 生成输出目录
     return path
 
 
-def make_uid_image(uid: uid_t, name: uname_t, is_manager: bool, path: str):
-    qr = QRCode(f"HGSSystem-QR-USER:{uid}-END")
-    qr_img = qr.make_img().convert("RGB").resize((500, 500))
-    if qr_img is None:
-        return False
-
-    title = f"HGSSystem 用户ID"
-    title_width, title_height = qr_img_title_font.getsize(title)
-    name_width, name_height = qr_img_title_b_font.getsize(name)
-    uid_width, uid_height = qr_img_info_font.getsize(uid[:Config.show_uid_len])
+def get_uid_label(uid: uid_t, name: uname_t, is_manager: bool, path: str) -> label_t:
     uid_color = (220, 20, 60) if is_manager else (0, 0, 0)
+    return (f"HGSSystem-QR-USER:{uid}-END", "HGSSystem 用户ID", name, False, uid[:Config.show_uid_len], uid_color,
+            path)
 
-    if name_width > 510:
-        name_width = 510
 
-    image = Image.new('RGB', (510, 500 + title_height + name_height + 110), (255, 255, 255))
-    logo_image = Image.open(Config.picture_d['logo']).resize((64, 64))
-
-    draw = ImageDraw.Draw(image)
-    draw.text((((510 - title_width) / 2), 5), title, (0, 0, 0), font=qr_img_title_font)
-    draw.text((((510 - name_width) / 2), title_height + 5), name, (0, 0, 0), font=qr_img_title_b_font)
-
-    qr_img.paste(logo_image, (int((500 - 64) / 2), int((500 - 64) / 2)))
-    image.paste(qr_img, (5, title_height + name_height + 10))
-    draw.text((((510 - uid_width) / 2), 500 + title_height + name_height + 10), uid[:Config.show_uid_len],
-              uid_color, font=qr_img_info_font)
-
-    image.save(path)
-    return True
+def make_uid_image(uid: uid_t, name: uname_t, is_manager: bool, path: str):
+    return make_label(*get_uid_label(uid, name, is_manager, path))
 
 
 def write_uid_qr(uid: uid_t, path: str, db: DB, name="nu") -> Tuple[str, Optional[User]]:
@@ -83,16 +61,21 @@ def write_uid_qr(uid: uid_t, path: str, db: DB, name="nu") -> Tuple[str, Optiona
     return "", None
 
 
-def write_all_uid_qr(path: str, db: DB, name="nu", where: str = "") -> List[str]:
-    cur = db.search(columns=["UserID", "Name", "IsManager"], table="user", where=where)
-    if cur is None:
-        return []
-
-    re_list = []
-    for _ in range(cur.rowcount):
-        res = cur.fetchone()
-        assert len(res) == 3
-        path_ = __get_uid_qr_file_name(res[0], res[1], path, name)
-        if make_uid_image(res[0], res[1], res[2] == DBBit.BIT_1, path_):
-            re_list.append(path_)
-    return re_list
+def write_all_uid_qr(path: str, db: DB, name="nu", where: str = "", progress: label_progress_t = None,
+                     output: str = "png") -> List[str]:
+    """
+    导出用户二维码 (并行生成)
+    :param path: 保存位置 (output 为 png 时是目录, 否则为文件)
+    :param db: 数据库
+    :param name: 文件名格式
+    :param where: 条件
+    :param progress: 进度回调
+    :param output: 输出方式 (png, pdf, tiff, zip)
+    :return: 已生成的标签 (png 为文件的完整路径, 其余为标签在输出文件中的名称)
+    """
+    labels = []
+    for rows in db.search_iter(columns=["UserID", "Name", "IsManager"], table="user", where=where):
+        for res in rows:
+            assert len(res) == 3
+            labels.append(get_uid_label(res[0], res[1], res[2] == DBBit.BIT_1, __get_uid_qr_name(res[0], res[1], name)))
+    return [get_label_name(label, path, output) for label, ok in zip(labels, make_labels(labels, path, output, progress)) if ok]
@@ -85,38 +85,80 @@ except ImportError:
 import pymysql
 from conf import Config
 
-mysql_url = Config.mysql_url
-mysql_name = Config.mysql_name
-mysql_passwd = Config.mysql_passwd
-mysql_port = Config.mysql_port
+is_sqlite = Config.database.upper() == 'SQLITE'
 
-try:
-    print(f"MySQL -h {mysql_url} -u {mysql_name} -P {mysql_port} -p{mysql_passwd}")
-    if mysql_port is None:
-        mysql_port = 0
-    else:
-        mysql_port = int(mysql_port)
-    sql = pymysql.connect(user=mysql_name, password=mysql_passwd, host=mysql_url, port=mysql_port)
-    cursor = sql.cursor()
-except pymysql.err.Error:
-    print("请提供正确的MySQL信息", file=sys.stderr)
-    sys.exit(1)
+
+def connect_sqlite():
+    import sqlite3
+    from sql.sqlite_db import SqliteDB  # SqliteDB 负责建表并注册 from_unixtime 等函数
+
+    try:
+        print(f"SQLite {Config.sqlite_path}")
+        conn = SqliteDB().get_cursor().connection
+    except sqlite3.Error:
+        print("请提供正确的SQLite路径", file=sys.stderr)
+        sys.exit(1)
+    return conn, conn.cursor()
+
+
+if is_sqlite:
+    sql, cursor = connect_sqlite()
 else:
-    cursor.execute("USE hgssystem")
+    mysql_url = Config.mysql_url
+    mysql_name = Config.mysql_name
+    mysql_passwd = Config.mysql_passwd
+    mysql_port = Config.mysql_port
+
+    try:
+        print(f"MySQL -h {mysql_url} -u {mysql_name} -P {mysql_port} -p{mysql_passwd}")
+        if mysql_port is None:
+            mysql_port = 0
+        else:
+            mysql_port = int(mysql_port)
+        sql = pymysql.connect(user=mysql_name, password=mysql_passwd, host=mysql_url, port=mysql_port)
+        cursor = sql.cursor()
+    except pymysql.err.Error:
+        print("请提供正确的MySQL信息", file=sys.stderr)
+        sys.exit(1)
+    else:
+        cursor.execute("USE hgssystem")
 
 from tool.login import create_uid
 from tool.time import mysql_time
 
+
+def migrate_mysql():
+    from sql.mysql_db import MysqlDB
+    from sql.migrate import migrate
+
+    db = MysqlDB()
+    version = migrate(db)
+    db.close()
+    if version == -1:
+        print("数据库迁移失败", file=sys.stderr)
+        sys.exit(1)
+    print(f"数据库结构版本: {version}")
+
+
 print("是否执行数据库初始化程序?\n执行初始化程序会令你丢失所有数据.")
 res = input("[Y/n]")
 if res == 'Y' or res == 'y':
-    with open(os.path.join(__setup, "init.sql"), "r", encoding='utf-8') as f:
-        all_sql = f.read().split(';\n')  # 使用 `;` 作为分隔符是不够的, 因为函数中可能会使用`;`表示语句
-        for s in all_sql:
-            if s.strip() == "":
-                continue
-            cursor.execute(f"{s};")
-        sql.commit()
+    if is_sqlite:
+        cursor.close()
+        sql.close()
+        for suffix in ("", "-wal", "-shm"):  # 删除数据库文件后重新建表
+            if os.path.exists(Config.sqlite_path + suffix):
+                os.remove(Config.sqlite_path + suffix)
+        sql, cursor = connect_sqlite()
+    else:
+        with open(os.path.join(__setup, "init.sql"), "r", encoding='utf-8') as f:
+            all_sql = f.read().split(';\n')  # 使用 `;` 作为分隔符是不够的, 因为函数中可能会使用`;`表示语句
+            for s in all_sql:
+                if s.strip() == "":
+                    continue
+                cursor.execute(f"{s};")
+            sql.commit()
+        migrate_mysql()
 
     admin_passwd = input("创建 'admin' 管理员的密码: ")
     admin_phone = ""
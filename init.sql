@@ -154,36 +154,6 @@ SELECT garbage_user.GarbageID       AS GarbageID,
 FROM garbage_user
          LEFT JOIN garbage_checker on garbage_user.GarbageID = garbage_checker.GarbageID;
 
-DROP VIEW IF EXISTS garbage_7d;
-CREATE VIEW garbage_7d AS
-SELECT (TO_DAYS(NOW()) - TO_DAYS(UseTime)) AS days,
-       GarbageID,
-       CreateTime,
-       Flat,
-       UserID,
-       UseTime,
-       GarbageType,
-       Location,
-       CheckResult,
-       CheckerID
-FROM garbage
-WHERE TO_DAYS(NOW()) - TO_DAYS(UseTime) < 7;
-
-DROP VIEW IF EXISTS garbage_30d;
-CREATE VIEW garbage_30d AS
-SELECT (TO_DAYS(NOW()) - TO_DAYS(UseTime)) AS days,
-       GarbageID,
-       CreateTime,
-       Flat,
-       UserID,
-       UseTime,
-       GarbageType,
-       Location,
-       CheckResult,
-       CheckerID
-FROM garbage
-WHERE TO_DAYS(NOW()) - TO_DAYS(UseTime) < 30;
-
 DROP VIEW IF EXISTS order_goods_view;
 CREATE VIEW order_goods_view AS
 SELECT ordergoods.OrderID AS OrderID, ordergoods.GoodsID AS GoodsID, ordergoods.Quantity AS Quantity, goods.Name AS Name
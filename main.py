@@ -27,7 +27,8 @@ def main():
         print("运行程序出错", file=sys.stderr)
         exit(1)
 
-    if Config.mysql_url is None or Config.mysql_name is None:
+    is_mysql = Config.database.upper() == 'MYSQL'
+    if is_mysql and (Config.mysql_url is None or Config.mysql_name is None):
         print("请提供MySQL信息")
         sys.exit(1)
 
@@ -49,15 +50,41 @@ def main():
             sys.exit(1)
         sys.exit(0)
 
-    import pymysql  # 下面才需要使用 pymysql
+    if is_mysql:
+        import pymysql  # 下面才需要使用 pymysql
+        db_error = pymysql.Error
+    else:
+        import sqlite3
+        db_error = sqlite3.Error
+
     try:
         from sql.db import DB
         mysql = DB()
-    except pymysql.Error:
-        print("无法连接到 MySQL")
+    except db_error:
+        print(f"无法连接到 {Config.database}")
         sys.exit(1)
 
-    if program_name == "garbage":
+    if program_name != "migrate":  # 其他程序都需要最新的数据库结构
+        from sql.migrate import check_schema_version
+        if not check_schema_version(mysql):
+            sys.exit(1)
+
+    if program_name == "migrate":  # 升级已有数据库的结构
+        from sql.migrate import migrate
+        version = migrate(mysql)
+        if version == -1:
+            print("数据库迁移失败", file=sys.stderr)
+            sys.exit(1)
+        print(f"数据库结构版本: {version}")
+        sys.exit(0)
+    elif program_name == "rollup":  # 从 garbage 表重建统计汇总表
+        from sql.rollup import rebuild_garbage_rollup
+        if not rebuild_garbage_rollup(mysql):
+            print("重建统计汇总表失败", file=sys.stderr)
+            sys.exit(1)
+        print("统计汇总表已重建")
+        sys.exit(0)
+    elif program_name == "garbage":
         from equipment.aliyun import Aliyun
         if Config.aliyun_key is None or Config.aliyun_secret is None:
             print("请提供Aliyun key信息")
@@ -75,6 +102,8 @@ def main():
         qr = HGSQRCoder(cap)
         station = garbage_station.GarbageStation(mysql, cap, qr, aliyun)
         station.mainloop()
+        qr.stop()
+        cap.stop()
     elif program_name == "ranking":
         try:
             import tk_ui.ranking as ranking_station
@@ -115,4 +144,5 @@ def main():
         sys.exit(1)
 
 
-main()
+if __name__ != "__mp_main__":  # 进程池的子进程 (spawn) 导入主模块时不运行程序
+    main()
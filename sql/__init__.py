@@ -1 +1 @@
-from .base_db import DBBit, DBCloseException  # 导入必要的内容
+from .base_db import DBBit, DBCloseException, DBTransaction  # 导入必要的内容
@@ -1,5 +1,13 @@
 import abc
-from tool.typing import List, Union, Optional, Tuple, Dict
+import os
+import time
+import logging
+import logging.handlers
+import threading
+from collections import OrderedDict
+
+from conf import Config
+from tool.typing import List, Union, Optional, Tuple, Dict, Callable
 
 
 class DBException(Exception):
@@ -19,9 +27,398 @@ class DBBit:
     BIT_1 = b'\x01'
 
 
+class StatementCache:
+    """
+    SQL 语句缓存
+    以语句结构 (表, 列, 条件模板等) 为键缓存生成好的 SQL 文本
+    条件中的值使用占位符 `%s` 并通过 params 绑定, 因此不同的值共用同一条语句
+    """
+
+    def __init__(self, size: int = 256):
+        self._size = size
+        self._cache: "OrderedDict[tuple, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple, build: Callable[[], str]) -> str:
+        """
+        获取语句, 不存在时调用 build 生成
+        :param key: 语句结构
+        :param build: 生成语句的函数
+        :return: SQL 语句
+        """
+        with self._lock:
+            sql = self._cache.get(key)
+            if sql is not None:
+                self._cache.move_to_end(key)
+                return sql
+
+        sql = build()
+        with self._lock:
+            self._cache[key] = sql
+            if len(self._cache) > self._size:
+                self._cache.popitem(last=False)
+        return sql
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+
+class QueryStats:
+    """
+    SQL 语句耗时统计
+    按语句结构 (即 SQL 文本, 值通过 params 绑定) 汇总执行次数, 耗时, 返回行数和等待连接的时间
+    超过 slow_time 的语句写入慢查询日志 (按大小轮转)
+    """
+
+    def __init__(self,
+                 slow_time: float = Config.slow_query_time,
+                 log_path: Optional[str] = Config.slow_query_log,
+                 top: int = Config.query_stats_top,
+                 size: int = 1024):
+        self._slow_time = slow_time
+        self._top = top
+        self._size = size
+        self._stats: Dict[str, List] = {}  # sql -> [次数, 总耗时, 最大耗时, 总行数, 总等待时间]
+        self._lock = threading.Lock()
+        self._logger = self.__get_logger(log_path)
+
+    @staticmethod
+    def __get_logger(log_path: Optional[str]) -> Optional[logging.Logger]:
+        if log_path is None or len(log_path) == 0:
+            return None
+
+        logger = logging.getLogger(f"hgssystem.slow_query.{log_path}")
+        if len(logger.handlers) == 0:  # 同一文件只添加一次 handler
+            dir_ = os.path.dirname(log_path)
+            if len(dir_) > 0:
+                os.makedirs(dir_, exist_ok=True)
+            handler = logging.handlers.RotatingFileHandler(log_path,
+                                                           maxBytes=Config.slow_query_log_size,
+                                                           backupCount=Config.slow_query_log_count,
+                                                           encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+            logger.addHandler(handler)
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+        return logger
+
+    def record(self, sql: str, params: Optional[tuple], cost: float, wait: float, rows: int):
+        """
+        记录一次语句执行
+        :param sql: SQL 语句
+        :param params: 绑定的参数
+        :param cost: 总耗时 (秒, 包括等待连接的时间)
+        :param wait: 等待连接的时间 (秒)
+        :param rows: 返回或影响的行数
+        """
+        rows = max(rows, 0)
+        with self._lock:
+            stats = self._stats.get(sql)
+            if stats is None:
+                if len(self._stats) >= self._size:  # 丢弃总耗时最少的语句
+                    del self._stats[min(self._stats, key=lambda k: self._stats[k][1])]
+                stats = self._stats[sql] = [0, 0.0, 0.0, 0, 0.0]
+            stats[0] += 1
+            stats[1] += cost
+            stats[2] = max(stats[2], cost)
+            stats[3] += rows
+            stats[4] += wait
+
+        if self._logger is not None and cost >= self._slow_time:
+            self._logger.info(f"cost={cost:.4f}s wait={wait:.4f}s rows={rows} sql='{sql.strip()}' params={params}")
+
+    def get_top(self, n: Optional[int] = None) -> List[Tuple[str, int, float, float, float, int, float]]:
+        """
+        获取总耗时最多的语句
+        :param n: 个数 (默认为配置中的 query_stats_top)
+        :return: [(SQL, 次数, 总耗时, 平均耗时, 最大耗时, 总行数, 总等待时间), ...]
+        """
+        if n is None:
+            n = self._top
+        with self._lock:
+            res = [(sql, s[0], s[1], s[1] / s[0], s[2], s[3], s[4]) for sql, s in self._stats.items()]
+        res.sort(key=lambda i: i[2], reverse=True)
+        return res[:n]
+
+    def clear(self):
+        with self._lock:
+            self._stats.clear()
+
+
+class QueryTimer:
+    """
+    语句计时
+    在获取连接前创建, 获取连接后调用 connected (两者之差为等待连接的时间), 执行结束后调用 done
+    """
+
+    def __init__(self):
+        self._start = time.perf_counter()
+        self._wait = 0.0
+
+    def connected(self):
+        self._wait = time.perf_counter() - self._start
+
+    def skip(self, sec: float):
+        """ 扣除不属于语句执行的时间 (例如 search_iter 中调用者处理数据的时间) """
+        self._start += sec
+
+    def done(self, stats: QueryStats, sql: str, params: Optional[tuple], rows: int):
+        stats.record(sql, params, time.perf_counter() - self._start, self._wait, rows)
+
+
+view_tables: Dict[str, Tuple[str, ...]] = {  # 视图依赖的表, 用于让查询缓存失效
+    "garbage_n": ("garbage",),
+    "garbage_c": ("garbage",),
+    "garbage_u": ("garbage",),
+    "garbage_time": ("garbage",),
+    "garbage_user": ("garbage", "user"),
+    "garbage_checker": ("garbage", "user"),
+    "garbage_checker_user": ("garbage", "user"),
+    "order_goods_view": ("ordergoods", "goods"),
+    "context_user": ("context", "user"),
+}
+
+
+def get_tables(table: str) -> Tuple[str, ...]:
+    """ 获取表 (或视图) 实际对应的表 """
+    return view_tables.get(table, (table,))
+
+
+class BufferedCursor:
+    """
+    缓冲游标
+    保存已经读取的结果, 提供与 pymysql 缓冲游标相同的读取接口
+    """
+
+    def __init__(self, rows: Union[list, tuple, None], rowcount: Optional[int] = None,
+                 lastrowid: Optional[int] = None, description=None):
+        self._rows = rows
+        self._index = 0
+        self.rowcount = len(rows) if rowcount is None and rows is not None else rowcount
+        self.lastrowid = lastrowid
+        self.description = description
+
+    def fetchone(self):
+        if self._rows is None or self._index >= len(self._rows):
+            return None
+        res = self._rows[self._index]
+        self._index += 1
+        return res
+
+    def fetchmany(self, size: int = 1):
+        if self._rows is None:
+            return tuple()
+        res = self._rows[self._index: self._index + size]
+        self._index += len(res)
+        return tuple(res)
+
+    def fetchall(self):
+        if self._rows is None:
+            return tuple()
+        res = self._rows[self._index:]
+        self._index = len(self._rows)
+        return tuple(res)
+
+    def __iter__(self):
+        while True:
+            res = self.fetchone()
+            if res is None:
+                return
+            yield res
+
+    def close(self):
+        self._rows = None
+
+
+class QueryCache:
+    """
+    查询结果缓存
+    以 (SQL 语句, 参数) 为键, 结果在 ttl 秒后过期, 超过 size 条时淘汰最久未使用的结果
+    写入某个表时, 所有读取了该表 (包括依赖该表的视图) 的结果都会失效
+    """
+
+    def __init__(self, ttl: float = Config.query_cache_ttl, size: int = Config.query_cache_size):
+        self._ttl = ttl
+        self._size = size
+        self._cache: "OrderedDict[tuple, Tuple[float, Tuple[str, ...], tuple, any]]" = OrderedDict()
+        self._generation: Dict[str, int] = {}  # 表的版本, 每次写入加一
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> Optional[Tuple[tuple, any]]:
+        """
+        :param key: 键
+        :return: 结果 (行, 游标 description), 不存在或已过期时返回 None
+        """
+        with self._lock:
+            res = self._cache.get(key)
+            if res is None:
+                return None
+            if res[0] < time.time():
+                del self._cache[key]
+                return None
+            self._cache.move_to_end(key)
+            return res[2], res[3]
+
+    def generation(self, tables: Tuple[str, ...]) -> tuple:
+        """ 查询前获取表的版本, 写入缓存时用于判断查询期间表是否被修改 """
+        with self._lock:
+            return tuple(self._generation.get(t, 0) for t in tables)
+
+    def put(self, key: tuple, tables: Tuple[str, ...], generation: tuple, rows: tuple, description):
+        with self._lock:
+            if generation != tuple(self._generation.get(t, 0) for t in tables):
+                return  # 查询期间表已被修改, 结果可能是旧的
+            self._cache[key] = (time.time() + self._ttl, tables, rows, description)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self._size:
+                self._cache.popitem(last=False)
+
+    def invalidate(self, table: str):
+        """ 使读取了 table 的结果失效 """
+        tables = get_tables(table)
+        with self._lock:
+            for t in tables:
+                self._generation[t] = self._generation.get(t, 0) + 1
+            for key in [k for k, v in self._cache.items() if any(t in v[1] for t in tables)]:
+                del self._cache[key]
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+
+def make_key(obj) -> any:
+    """ 把 list/dict 转换为可哈希的 tuple, 作为 StatementCache 的键 """
+    if type(obj) is list or type(obj) is tuple:
+        return tuple(make_key(i) for i in obj)
+    if type(obj) is dict:
+        return tuple((k, make_key(v)) for k, v in obj.items())
+    return obj
+
+
+def where_sql(where: Union[str, List[str], None]) -> str:
+    if type(where) is list and len(where) > 0:
+        return " AND ".join(f"({w})" for w in where)
+    elif type(where) is str and len(where) > 0:
+        return where
+    return ""
+
+
+def keyset_where(columns: List[str], values: Union[list, tuple], order_by: str = "ASC") -> Tuple[str, tuple]:
+    """
+    键集分页 (seek) 的条件: 按 columns 排序时位于 values 之后的行
+    展开为 a > x OR (a = x AND b > y) ..., MySQL 和 SQLite 都能用索引定位, 不需要像 OFFSET 一样逐行跳过
+    :param columns: 排序的列 (最后一列需唯一)
+    :param values: 上一页最后一行对应的值
+    :param order_by: 排序方向 ASC 或 DESC
+    :return: 条件, 绑定到占位符的参数
+    """
+    op = "<" if order_by.upper() == "DESC" else ">"
+    where = []
+    params = []
+    for i, column in enumerate(columns):
+        where.append(" AND ".join([f"{c} = %s" for c in columns[:i]] + [f"{column} {op} %s"]))
+        params += [*values[:i], values[i]]
+    return " OR ".join(f"({w})" for w in where), tuple(params)
+
+
+def search_sql(columns: List[str], table: str,
+               where: Union[str, List[str]] = None,
+               limit: Optional[int] = None,
+               offset: Optional[int] = None,
+               order_by: Optional[List[Tuple[str, str]]] = None,
+               group_by: Optional[List[str]] = None,
+               for_update: bool = False) -> str:
+    where = where_sql(where)
+    if len(where) > 0:
+        where = " WHERE " + where
+
+    if order_by is None:
+        order_by: str = ""
+    else:
+        by = [f" {i[0]} {i[1]} " for i in order_by]
+        order_by: str = " ORDER BY" + ", ".join(by)
+
+    if limit is None or limit == 0:
+        limit: str = ""
+    else:
+        limit = f" LIMIT {int(limit)}"
+
+    if offset is None:
+        offset: str = ""
+    else:
+        offset = f" OFFSET {int(offset)}"
+
+    if group_by is None:
+        group_by: str = ""
+    else:
+        group_by = "GROUP BY " + ", ".join(group_by)
+
+    columns: str = ", ".join(columns)
+    if for_update:
+        for_update = "FOR UPDATE"
+    else:
+        for_update = ""
+    return f"SELECT {columns} FROM {table} {where} {group_by} {order_by} {limit} {offset} {for_update};"
+
+
+def insert_sql(table: str, columns: list, values: Union[str, List[str], None] = None) -> str:
+    if values is None:
+        values = ", ".join(["%s"] * len(columns))
+    columns: str = ", ".join(columns)
+    if type(values) is str:
+        values: str = f"({values})"
+    else:
+        values: str = ", ".join(f"{v}" for v in values)
+    return f"INSERT INTO {table}({columns}) VALUES {values};"
+
+
+def insert_many_sql(table: str, columns: list, values: Optional[str], count: int) -> str:
+    if values is None:
+        values = ", ".join(["%s"] * len(columns))
+    return insert_sql(table, columns, [f"({values})"] * count)
+
+
+def insert_select_sql(table: str, columns: list, select: str) -> str:
+    """
+    :param select: 查询语句 (search_sql 生成)
+    """
+    return f"INSERT INTO {table}({', '.join(columns)}) {select}"
+
+
+def insert_or_add_sql(table: str, columns: list, values: Union[str, None], on_conflict: str) -> str:
+    """
+    :param on_conflict: 键冲突时的子句 (MySQL 与 SQLite 语法不同, 由各数据库提供)
+    """
+    return f"{insert_sql(table, columns, values)[:-1]} {on_conflict};"
+
+
+def delete_sql(table: str, where: Union[str, List[str]] = None) -> Optional[str]:
+    where = where_sql(where)
+    if len(where) == 0:  # 必须指定条件
+        return None
+    return f"DELETE FROM {table} WHERE {where};"
+
+
+def update_sql(table: str, kw: "Dict[str:str]", where: Union[str, List[str]] = None) -> Optional[str]:
+    where = where_sql(where)
+    if len(kw) == 0 or len(where) == 0:  # 必须指定条件
+        return None
+    kw_str = ", ".join(f"{key} = {kw[key]}" for key in kw)
+    return f"UPDATE {table} SET {kw_str} WHERE {where};"
+
+
 class HGSDatabase(metaclass=abc.ABCMeta):
+    dialect: str = ""  # 数据库类型: MySQL 或 SQLite
+    max_variable: Optional[int] = None  # 单条语句最多绑定的参数个数 (None 为不限制)
+
     @abc.abstractmethod
     def __init__(self, host: str, name: str, passwd: str, port: str):
+        self._stats = QueryStats()
+        self._cache = QueryCache() if Config.query_cache else None
+        self._cache_local = threading.local()  # 当前线程未提交的写入涉及的表
+        self._commit_local = threading.local()  # 当前线程的事务提交后需要调用的函数
         self._host = str(host)
         self._name = str(name)
         self._passwd = str(passwd)
@@ -30,6 +427,90 @@ class HGSDatabase(metaclass=abc.ABCMeta):
         else:
             self._port = int(port)
 
+    def _cached_search(self, sql: str, params: Optional[tuple], table: str,
+                       search: Callable[[], any]) -> Optional[BufferedCursor]:
+        """
+        通过查询缓存执行查询
+        :param sql: SQL 语句 (与 params 一起作为缓存的键)
+        :param params: 参数
+        :param table: 查询的表或视图
+        :param search: 实际执行查询的函数, 返回游标
+        :return: 游标
+        """
+        if self._cache is None:
+            return search()
+
+        key = (sql, make_key(params))
+        res = self._cache.get(key)
+        if res is not None:
+            return BufferedCursor(res[0], description=res[1])
+
+        tables = get_tables(table)
+        generation = self._cache.generation(tables)
+        cur = search()
+        if cur is None:
+            return None
+        rows = tuple(cur.fetchall())
+        self._cache.put(key, tables, generation, rows, cur.description)
+        return BufferedCursor(rows, description=cur.description)
+
+    def _written(self, table: str, not_commit: bool):
+        """ 写入 table 后调用, 使相关的查询缓存失效 """
+        if self._cache is None:
+            return
+        self._cache.invalidate(table)
+        if not_commit:  # 提交后再次失效, 避免其他线程在提交前缓存旧数据
+            pending = getattr(self._cache_local, "tables", None)
+            if pending is None:
+                pending = self._cache_local.tables = set()
+            pending.add(table)
+
+    def _committed(self, commit: bool = True):
+        """
+        提交或回滚后调用 (当前线程可能已经缓存了未提交的数据)
+        :param commit: 是否为提交 (提交时调用 after_commit 登记的函数, 回滚时丢弃)
+        """
+        hooks = getattr(self._commit_local, "hooks", None)
+        if hooks:
+            self._commit_local.hooks = []
+            if commit:
+                for func in hooks:
+                    func()
+
+        pending = getattr(self._cache_local, "tables", None)
+        if self._cache is None or not pending:
+            return
+        for table in pending:
+            self._cache.invalidate(table)
+        pending.clear()
+
+    def after_commit(self, func: Callable[[], None], not_commit: bool = True):
+        """
+        当前线程的事务提交后调用 func, 回滚时不调用 (用于更新内存中的数据, 例如排行榜)
+        :param func: 函数
+        :param not_commit: 写入是否尚未提交 (为 False 时立即调用)
+        :return:
+        """
+        if not not_commit:
+            func()
+            return
+        hooks = getattr(self._commit_local, "hooks", None)
+        if hooks is None:
+            hooks = self._commit_local.hooks = []
+        hooks.append(func)
+
+    def get_query_cache(self) -> Optional[QueryCache]:
+        """
+        :return: 查询缓存 (未启用时返回 None)
+        """
+        return self._cache
+
+    def get_query_stats(self) -> QueryStats:
+        """
+        :return: SQL 语句耗时统计
+        """
+        return self._stats
+
     @abc.abstractmethod
     def close(self):
         """
@@ -57,47 +538,174 @@ class HGSDatabase(metaclass=abc.ABCMeta):
                where: Union[str, List[str]] = None,
                limit: Optional[int] = None,
                offset: Optional[int] = None,
-               order_by: Optional[List[Tuple[str, str]]] = None):
+               order_by: Optional[List[Tuple[str, str]]] = None,
+               params: Optional[tuple] = None,
+               cache: bool = False):
         """
         执行 查询 SQL语句
         :param columns: 列名称
         :param table: 表
-        :param where: 条件
+        :param where: 条件 (可使用占位符 `%s`)
         :param limit: 限制行数
         :param offset: 偏移
         :param order_by: 排序方式
+        :param params: 绑定到占位符的参数 (提供参数时, 语句中的 `%` 需写作 `%%`)
+        :param cache: 使用查询缓存 (用于频繁读取且允许短暂过期的数据)
         :return:
         """
         ...
 
     @abc.abstractmethod
-    def insert(self, table: str, columns: list, values: Union[str, List[str]]):
+    def search_iter(self, columns: List[str], table: str,
+                    where: Union[str, List[str]] = None,
+                    order_by: Optional[List[Tuple[str, str]]] = None,
+                    params: Optional[tuple] = None,
+                    chunk_size: Optional[int] = None):
+        """
+        执行 查询 SQL语句, 分块返回结果 (用于导出等结果集很大的场景)
+        结果不会一次性读入内存, 遍历结束 (或生成器被关闭) 前当前线程不应执行其他数据库操作
+        :param columns: 列名称
+        :param table: 表
+        :param where: 条件 (可使用占位符 `%s`)
+        :param order_by: 排序方式
+        :param params: 绑定到占位符的参数
+        :param chunk_size: 每块的行数
+        :return: 生成器, 每次返回一块数据 (行的元组)
+        """
+        ...
+
+    @abc.abstractmethod
+    def insert(self, table: str, columns: list, values: Union[str, List[str]] = None, params: Optional[tuple] = None):
         """
         执行 插入 SQL语句, 并提交
         :param table: 表
         :param columns: 列名称
-        :param values: 数据
+        :param values: 数据 (为 None 时每一列都使用占位符)
+        :param params: 绑定到占位符的参数
+        :return:
+        """
+        ...
+
+    @abc.abstractmethod
+    def insert_many(self, table: str, columns: list, rows: List[tuple], values: Optional[str] = None,
+                    not_commit: bool = False, chunk_size: Optional[int] = None) -> Optional[List[Tuple[int, int]]]:
+        """
+        批量插入, 每条语句插入多行, 全部插入后只提交一次
+        :param table: 表
+        :param columns: 列名称
+        :param rows: 每一行绑定到占位符的参数
+        :param values: 单行数据的模板 (为 None 时每一列都使用占位符)
+        :param not_commit: 不提交
+        :param chunk_size: 每条语句插入的行数
+        :return: 每条语句生成的 ID 范围 [(首个ID, 最后的ID), ...], 失败时返回 None (所有插入均回滚)
+        """
+        ...
+
+    @abc.abstractmethod
+    def insert_select(self, table: str, columns: list, select: str, not_commit: bool = False,
+                      params: Optional[tuple] = None):
+        """
+        执行 INSERT ... SELECT 语句 (数据不经过本程序)
+        :param table: 表
+        :param columns: 列名称
+        :param select: 查询语句 (search_sql 生成)
+        :param not_commit: 不提交
+        :param params: 绑定到占位符的参数
         :return:
         """
         ...
 
     @abc.abstractmethod
-    def delete(self, table: str, where: Union[str, List[str]] = None):
+    def insert_or_add(self, table: str, columns: list, keys: List[str], add_column: str,
+                      values: Optional[str] = None, not_commit: bool = False, params: Optional[tuple] = None):
+        """
+        插入一行, 若 keys (主键或唯一键) 对应的行已存在, 则把 add_column 的值累加到已有的行上
+        用于增量维护计数表
+        :param table: 表
+        :param columns: 列名称 (包括 keys 和 add_column)
+        :param keys: 唯一键的列
+        :param add_column: 累加的列
+        :param values: 数据 (为 None 时每一列都使用占位符)
+        :param not_commit: 不提交
+        :param params: 绑定到占位符的参数
+        :return:
+        """
+        ...
+
+    @abc.abstractmethod
+    def delete(self, table: str, where: Union[str, List[str]] = None, params: Optional[tuple] = None):
         """
         执行 删除 SQL语句, 并提交
         :param table: 表
         :param where: 条件
+        :param params: 绑定到占位符的参数
         :return:
         """
         ...
 
     @abc.abstractmethod
-    def update(self, table: str, kw: "Dict[str:str]", where: Union[str, List[str]] = None):
+    def update(self, table: str, kw: "Dict[str:str]", where: Union[str, List[str]] = None,
+               params: Optional[tuple] = None):
         """
         执行 更新 SQL语句, 并提交
         :param table: 表
         :param kw: 键值对
         :param where: 条件
+        :param params: 绑定到占位符的参数 (先 kw 后 where, 按出现顺序)
+        :return:
+        """
+        ...
+
+    @abc.abstractmethod
+    def commit(self):
+        """
+        提交当前线程的事务
+        :return:
+        """
+        ...
+
+    @abc.abstractmethod
+    def rollback(self):
+        """
+        回滚当前线程的事务
         :return:
         """
         ...
+
+    def transaction(self) -> "DBTransaction":
+        """
+        事务 (上下文管理器)
+        事务中的写操作需使用 not_commit=True, 离开 with 语句时统一提交
+        出现异常或调用 DBTransaction.rollback 时回滚
+        :return: 事务
+        """
+        return DBTransaction(self)
+
+
+class DBTransaction:
+    """
+    事务
+    用法:
+        with db.transaction() as tran:
+            if not update_xxx(..., db, not_commit=True):
+                tran.rollback()
+                return
+    """
+
+    def __init__(self, db: HGSDatabase):
+        self._db = db
+        self._rollback = False
+
+    def rollback(self):
+        """ 标记事务失败, 离开 with 语句时回滚 """
+        self._rollback = True
+
+    def __enter__(self) -> "DBTransaction":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is not None or self._rollback:
+            self._db.rollback()
+        else:
+            self._db.commit()
+        return False
@@ -9,6 +9,14 @@ if Config.database.upper() == 'MYSQL':
         raise
     else:
         DB = MysqlDB
+elif Config.database.upper() == 'SQLITE':
+    try:
+        from .sqlite_db import SqliteDB
+    except ImportError:
+        print("无法导入SqliteDB程序")
+        raise
+    else:
+        DB = SqliteDB
 else:
     print(f"不支持的数据库类型: {Config.database}")
     raise Exception
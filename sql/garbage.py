@@ -1,8 +1,11 @@
 import time
 from . import DBBit
 from .db import DB
+from .base_db import keyset_where
+from .rollup import (add_garbage_rollup, add_user_rollup, sub_garbage_rollup, change_garbage_rollup,
+                     clear_garbage_rollup, count_user_garbage)
 from tool.typing import *
-from tool.time import mysql_time, time_from_mysql
+from tool.time import time_from_mysql
 from core.garbage import GarbageBag, GarbageType
 
 
@@ -17,7 +20,9 @@ def update_garbage_type(where: str, type_: int, db: DB) -> int:
     if len(where) == 0:
         return -1
 
-    cur = db.update(table="garbage", kw={"GarbageType": str(type_)}, where=where)
+    if not change_garbage_rollup(where, "GarbageType", int(type_), db):  # 在同一事务中修改汇总表
+        return -1
+    cur = db.update(table="garbage", kw={"GarbageType": str(int(type_))}, where=where)
     if cur is None:
         return -1
     return cur.rowcount
@@ -35,6 +40,8 @@ def update_garbage_check(where: str, result: bool, db: DB) -> int:
         return -1
 
     i: str = '1' if result else '0'
+    if not change_garbage_rollup(where, "CheckResult", int(result), db):  # 在同一事务中修改汇总表
+        return -1
     cur = db.update(table="garbage", kw={"CheckResult": i}, where=where)
     if cur is None:
         return -1
@@ -63,9 +70,9 @@ def __get_time_diff(time_str: str) -> float:
     return float(time_str)
 
 
-def __search_fields_time(time_: str, time_name: str) -> str:
+def __search_fields_time(time_: str, time_name: str) -> Tuple[str, tuple]:
     if time_ == '<=now':
-        return f"{time_name}<={mysql_time()} AND"
+        return f"{time_name}<=from_unixtime(%s) AND ", (time.time(),)
     sp = time_.split(',')
     if len(sp) == 2:
         try:
@@ -73,9 +80,9 @@ def __search_fields_time(time_: str, time_name: str) -> str:
             a = min(time_list)
             b = max(time_list)
         except (TypeError, ValueError):
-            return ""
+            return "", tuple()
         else:
-            return f"({time_name} BETWEEN {mysql_time(a)} AND {mysql_time(b)}) AND"
+            return f"({time_name} BETWEEN from_unixtime(%s) AND from_unixtime(%s)) AND ", (a, b)
     sp = time_.split(';')
     if len(sp) == 2:
         try:
@@ -83,36 +90,45 @@ def __search_fields_time(time_: str, time_name: str) -> str:
             a = time_list[0] - time_list[1]
             b = time_list[0] + time_list[1]
         except (TypeError, ValueError):
-            return ""
+            return "", tuple()
         else:
-            return f"({time_name} BETWEEN {mysql_time(a)} AND {mysql_time(b)}) AND"
+            return f"({time_name} BETWEEN from_unixtime(%s) AND from_unixtime(%s)) AND ", (a, b)
     try:
         t = __get_time(time_)
     except (TypeError, ValueError):
-        return ""
+        return "", tuple()
     else:
-        return f"({time_name}={mysql_time(t)} AND"
+        return f"({time_name}=from_unixtime(%s)) AND ", (t,)
 
 
-def set_where_(ex: Optional[str], column: str):
+def set_where_(ex: Optional[str], column: str) -> Tuple[str, tuple]:
+    """
+    生成搜索条件
+    :param ex: 搜索值 (支持 `IS NULL`, `LIKE xxx`, `REGEXP xxx`)
+    :param column: 列
+    :return: 条件模板, 参数
+    """
     if ex is None:
-        return ""
+        return "", tuple()
 
     if ex.strip() == "IS NULL":
-        where = f"{column} IS NULL AND "
+        return f"{column} IS NULL AND ", tuple()
     elif ex.startswith("LIKE ") or ex.startswith("REGEXP "):
-        where = f"{column} {ex} AND "
-    else:
-        where = f"{column}='{ex}' AND "
-    return where
+        op, pattern = ex.split(" ", 1)
+        pattern = pattern.strip()
+        if len(pattern) >= 2 and pattern[0] == pattern[-1] and pattern[0] in ("'", '"'):
+            pattern = pattern[1:-1]  # 去除引号
+        return f"{column} {op} %s AND ", (pattern,)
+    return f"{column}=%s AND ", (ex,)
 
 
 def search_garbage_by_fields(columns, gid, uid, cuid, create_time, use_time, loc, type_, check, db: DB):
     where = ""
-    where += set_where_(gid, "GarbageID")
-    where += set_where_(uid, "UserID")
-    where += set_where_(cuid, "CheckerID")
-    where += set_where_(loc, "Location")
+    params = tuple()
+    for ex, column in ((gid, "GarbageID"), (uid, "UserID"), (cuid, "CheckerID"), (loc, "Location")):
+        w, p = set_where_(ex, column)
+        where += w
+        params += p
 
     if check is not None:
         if check == 'IS NULL':
@@ -133,19 +149,23 @@ def search_garbage_by_fields(columns, gid, uid, cuid, create_time, use_time, loc
             where += f"GarbageType={res} AND "
 
     if create_time is not None:
-        where += __search_fields_time(create_time, "CreateTime")
+        w, p = __search_fields_time(create_time, "CreateTime")
+        where += w
+        params += p
 
     if use_time is not None:
-        where += __search_fields_time(use_time, "UseTime")
+        w, p = __search_fields_time(use_time, "UseTime")
+        where += w
+        params += p
 
     if len(where) != 0:
-        where = where[0:-4]  # 去除末尾的AND
+        where = where[0:-5]  # 去除末尾的AND
 
-    return search_from_garbage_view(columns, where, db)
+    return search_from_garbage_view(columns, where, db, params)
 
 
-def search_from_garbage_view(columns, where: str, db: DB):
-    cur = db.search(columns=columns, table="garbage", where=where)
+def search_from_garbage_view(columns, where: str, db: DB, params: Optional[tuple] = None):
+    cur = db.search(columns=columns, table="garbage", where=where, params=params)
     if cur is None:
         return None
     res = cur.fetchall()
@@ -153,36 +173,42 @@ def search_from_garbage_view(columns, where: str, db: DB):
 
 
 def count_garbage_by_uid(uid: uid_t, db: DB, time_limit: bool = True):
-    if time_limit:
-        ti: time_t = time.time()
-        start = ti - 3.5 * 24 * 60 * 60  # 前后3.5天
-        end = ti + 3.5 * 24 * 60 * 60
-        where = [f"UserID = '{uid}'", f"UseTime BETWEEN {mysql_time(start)} AND {mysql_time(end)}"]
-    else:
-        where = [f"UserID = '{uid}'"]
-    cur = db.search(columns=["Count(GarbageID)"],
-                    table="garbage_time",
-                    where=where)
-    if cur is None:
-        return -1
-    assert cur.rowcount == 1
-    return int(cur.fetchone()[0])
+    """
+    统计用户投放的垃圾袋 (读取用户汇总表, 不需要扫描用户的所有垃圾袋)
+    :param uid: 用户ID
+    :param db: 数据库
+    :param time_limit: 只统计一周内 (前后3.5天) 的垃圾袋
+    :return: 数量, 出错返回 -1
+    """
+    return count_user_garbage(uid, db, time_limit)
 
 
-def get_garbage_by_uid(uid: uid_t, columns, limit, db: DB, offset: int = 0):
+def get_garbage_by_uid(uid: uid_t, columns, limit, db: DB, offset: int = 0, after: Optional[tuple] = None):
+    """
+    按投放时间倒序获取用户的垃圾袋
+    :param after: 上一页最后一行的 (UseTime, GarbageID), 指定时使用键集分页
+    """
+    where = ["UserID = %s"]
+    params = (uid,)
+    if after is not None:
+        key_where, key_params = keyset_where(["UseTime", "GarbageID"], after, "DESC")
+        where.append(key_where)
+        params += key_params
+        offset = None
     cur = db.search(columns=columns,
                     table="garbage",
-                    where=f"UserID='{uid}'",
+                    where=where,
                     limit=limit,
                     offset=offset,
-                    order_by=[("UseTime", "DESC")])
+                    order_by=[("UseTime", "DESC"), ("GarbageID", "DESC")],
+                    params=params)
     if cur is None:
         return None
     return cur.fetchall()
 
 
-def __find_garbage(columns: List[str], table: str, where: str, db: DB):
-    cur = db.search(columns=columns, table=table, where=where)
+def __find_garbage(columns: List[str], table: str, gid: gid_t, db: DB):
+    cur = db.search(columns=columns, table=table, where="GarbageID = %s", params=(gid,))
     if cur is None or cur.rowcount == 0:
         return None, tuple()
     assert cur.rowcount == 1
@@ -194,26 +220,35 @@ def __find_garbage(columns: List[str], table: str, where: str, db: DB):
 def find_not_use_garbage(gid: gid_t, db: DB) -> Union[GarbageBag, None]:
     return __find_garbage(columns=["GarbageID"],
                           table="garbage_n",
-                          where=f"GarbageID = {gid}",
+                          gid=gid,
                           db=db)[0]
 
 
+def __config_garbage(gb: GarbageBag, res: tuple, check: bool):
+    """
+    根据查询结果设置垃圾袋的投放 (和检测) 信息
+    :param res: (GarbageType, UseTime, UserID, Location, CheckResult, CheckerID)
+    :param check: 是否已检测
+    """
+    garbage_type: enum = int(res[0].decode())
+    use_time: time_t = time_from_mysql(res[1])
+    uid: uid_t = res[2]
+    loc: location_t = res[3]
+    gb.config_use(garbage_type, use_time, uid, loc)
+    if check:
+        gb.config_check(res[4] == DBBit.BIT_1, res[5])
+
+
 def find_wait_garbage(gid: gid_t, db: DB) -> Union[GarbageBag, None]:
     res: Tuple[int, bytes, str, str, str]
     gb: GarbageBag
     gb, res = __find_garbage(columns=["GarbageID", "GarbageType", "UseTime", "UserID", "Location"],
                              table="garbage_c",
-                             where=f"GarbageID = {gid}",
+                             gid=gid,
                              db=db)
     if gb is None:
         return None
-
-    garbage_type: enum = int(res[1].decode())
-    use_time: time_t = time_from_mysql(res[2])
-    uid: uid_t = res[3]
-    loc: location_t = res[4]
-
-    gb.config_use(garbage_type, use_time, uid, loc)
+    __config_garbage(gb, res[1:], False)
     return gb
 
 
@@ -223,43 +258,40 @@ def find_use_garbage(gid: gid_t, db: DB) -> Union[GarbageBag, None]:
     gb, res = __find_garbage(columns=["GarbageID", "GarbageType", "UseTime", "UserID", "Location",
                                       "CheckResult", "CheckerID"],
                              table="garbage_u",
-                             where=f"GarbageID = {gid}",
+                             gid=gid,
                              db=db)
     if gb is None:
         return None
-
-    garbage_type: enum = int(res[1].decode())
-    use_time: time_t = time_from_mysql(res[2])
-    uid: uid_t = res[3]
-    loc: location_t = res[4]
-    check: bool = res[5] == DBBit.BIT_1
-    check_uid: uid_t = res[6]
-
-    gb.config_use(garbage_type, use_time, uid, loc)
-    gb.config_check(check, check_uid)
+    __config_garbage(gb, res[1:], True)
     return gb
 
 
 def find_garbage(gid: gid_t, db: DB) -> Union[GarbageBag, None]:
-    res: Tuple[bool, int] = is_garbage_exists(gid, db)
-    if not res[0]:
+    """
+    一次查询读出所有列, 再根据 Flat 构造垃圾袋
+    """
+    res: Tuple[int, int, bytes, str, str, str, bytes, str]
+    gb: GarbageBag
+    gb, res = __find_garbage(columns=["GarbageID", "Flat", "GarbageType", "UseTime", "UserID", "Location",
+                                      "CheckResult", "CheckerID"],
+                             table="garbage",
+                             gid=gid,
+                             db=db)
+    if gb is None:
         return None
-    elif res[1] == 0:
-        re = find_not_use_garbage(gid, db)
-    elif res[1] == 1:
-        re = find_wait_garbage(gid, db)
-    elif res[1] == 2:
-        re = find_use_garbage(gid, db)
-    else:
-        re = None
-    assert re is not None
-    return re
+
+    flat = int(res[1])
+    if flat == 1 or flat == 2:
+        __config_garbage(gb, res[2:], flat == 2)
+    return gb
 
 
-def is_garbage_exists(gid: gid_t, db: DB) -> Tuple[bool, int]:
+def is_garbage_exists(gid: gid_t, db: DB, for_update: bool = False) -> Tuple[bool, int]:
     cur = db.search(columns=["GarbageID", "Flat"],
                     table="garbage",
-                    where=f"GarbageID = {gid}")
+                    where="GarbageID = %s",
+                    for_update=for_update,
+                    params=(gid,))
     if cur is None or cur.rowcount == 0:
         return False, 0
     assert cur.rowcount == 1
@@ -267,48 +299,90 @@ def is_garbage_exists(gid: gid_t, db: DB) -> Tuple[bool, int]:
     return True, res[1]
 
 
-def update_garbage(garbage: GarbageBag, db: DB) -> bool:
-    re = find_garbage(garbage.get_gid(), db)
-    if re is None:
-        return False
-
-    if re.is_use() and not garbage.is_use() or re.is_check()[0] and not garbage.is_check()[0]:
-        return False
-
+def update_garbage(garbage: GarbageBag, db: DB, not_commit: bool = False) -> bool:
+    """
+    更新垃圾袋
+    先按正常的状态变化 (投放: 0 -> 1, 检测: 1 -> 2) 执行带 Flat 条件的 UPDATE, 不需要先读取垃圾袋
+    条件不满足时 (例如重复写入) 再读取实际状态并检查
+    :param garbage: 垃圾袋
+    :param db: 数据库
+    :param not_commit: 不提交
+    :return:
+    """
+    gid = garbage.get_gid()
     if not garbage.is_use() and not garbage.is_check()[0]:
-        return True  # 不做任何修改
+        exists, flat = is_garbage_exists(gid, db)
+        return exists and flat == 0  # 不做任何修改 (不允许回退状态)
 
-    gid = garbage.get_gid()
     info = garbage.get_info()
 
     update_kw = {
-        "Flat": "0",
-        "UserID": "NULL",
-        "UseTime": "NULL",
-        "GarbageType": "NULL",
-        "Location": "NULL",
-        "CheckResult": "NULL",
-        "CheckerID": "NULL"
+        "Flat": "%s",
+        "UserID": "%s",
+        "UseTime": "from_unixtime(%s)",
+        "GarbageType": "%s",
+        "Location": "%s",
+        "CheckResult": "%s",
+        "CheckerID": "%s"
+    }
+    update_value = {
+        "Flat": 0,
+        "UserID": None,
+        "UseTime": None,
+        "GarbageType": None,
+        "Location": None,
+        "CheckResult": None,
+        "CheckerID": None
     }
 
     if garbage.is_use():
-        update_kw['Flat'] = "1"
-        update_kw['UserID'] = f"'{info['user']}'"
-        update_kw['UseTime'] = f"{mysql_time(info['use_time'])}"
-        update_kw['GarbageType'] = f"{info['type']}"
-        update_kw['Location'] = f"'{info['loc']}'"
+        update_value['Flat'] = 1
+        update_value['UserID'] = info['user']
+        update_value['UseTime'] = float(info['use_time'])
+        update_value['GarbageType'] = int(info['type'])
+        update_value['Location'] = info['loc']
 
     if garbage.is_check()[0]:
-        update_kw['Flat'] = "2"
-        update_kw['CheckResult'] = f"{info['check']}"
-        update_kw['CheckerID'] = f"'{info['checker']}'"
+        update_value['Flat'] = 2
+        update_value['CheckResult'] = int(info['check'])
+        update_value['CheckerID'] = info['checker']
+
+    flat = update_value['Flat'] - 1
+    res = db.update("garbage", kw=update_kw, where=["GarbageID = %s", "Flat = %s"], not_commit=True,
+                    params=(*update_value.values(), gid, flat))
+    if res is None:
+        return False
 
-    res = db.update("garbage", kw=update_kw, where=f"GarbageID = {gid}")
-    return res is not None
+    if res.rowcount == 0:  # 垃圾袋不存在或不是预期的状态
+        exists, flat = is_garbage_exists(gid, db, for_update=True)  # 锁定该行
+        if not exists or flat >= 1 and not garbage.is_use() or flat == 2 and not garbage.is_check()[0]:
+            if not not_commit:
+                db.rollback()
+            return False  # 不允许回退状态
+
+        res = db.update("garbage", kw=update_kw, where=["GarbageID = %s", "Flat = %s"], not_commit=True,
+                        params=(*update_value.values(), gid, flat))
+        if res is None:
+            return False
+
+    if flat != update_value['Flat']:  # 状态改变时在同一事务中更新汇总表
+        args = (update_value['UseTime'], update_value['GarbageType'], update_value['Location'])
+        check = bool(update_value['CheckResult']) if update_value['Flat'] == 2 else None
+        if ((flat == 1 and not add_garbage_rollup(*args, None, -1, db, not_commit=True)) or
+                not add_garbage_rollup(*args, check, 1, db, not_commit=True)):
+            return False  # 出错时已回滚
+        if flat == 0 and not add_user_rollup(update_value['UserID'], update_value['UseTime'], 1, db,
+                                             not_commit=True):
+            return False
+
+    if not not_commit:
+        db.commit()
+    return True
 
 
 def create_new_garbage(db: DB) -> Optional[GarbageBag]:
-    cur = db.insert(table="garbage", columns=["CreateTime", "Flat"], values=f"{mysql_time()}, 0")
+    cur = db.insert(table="garbage", columns=["CreateTime", "Flat"], values="from_unixtime(%s), 0",
+                    params=(time.time(),))
     if cur is None:
         return None
     assert cur.rowcount == 1
@@ -316,8 +390,29 @@ def create_new_garbage(db: DB) -> Optional[GarbageBag]:
     return GarbageBag(str(gid))
 
 
+def create_new_garbage_batch(num: int, db: DB) -> Optional[List[GarbageBag]]:
+    """
+    批量创建垃圾袋 (多行 INSERT, 只提交一次)
+    :param num: 垃圾袋个数
+    :param db: 数据库
+    :return: 新垃圾袋, 失败时返回 None
+    """
+    now = time.time()
+    res = db.insert_many(table="garbage", columns=["CreateTime", "Flat"], values="from_unixtime(%s), 0",
+                         rows=[(now,)] * num)
+    if res is None:
+        return None
+
+    re = []
+    for first, last in res:
+        re += [GarbageBag(str(gid)) for gid in range(first, last + 1)]
+    assert len(re) == num
+    return re
+
+
 def del_garbage_not_use(gid: gid_t, db: DB) -> bool:
-    cur = db.delete(table="garbage_n", where=f"GarbageID = {gid}")
+    where = ["GarbageID = %s", "Flat = 0"]  # 即 garbage_n 视图中的行 (SQLite 不能删除视图中的行)
+    cur = db.delete(table="garbage", where=where, params=(gid,))
     if cur is None or cur.rowcount == 0:
         return False
     assert cur.rowcount == 1
@@ -325,45 +420,69 @@ def del_garbage_not_use(gid: gid_t, db: DB) -> bool:
 
 
 def del_garbage_wait_check(gid: gid_t, db: DB) -> bool:
-    cur = db.delete(table="garbage_c", where=f"GarbageID = {gid}")
-    if cur is None or cur.rowcount == 0:
+    where = ["GarbageID = %s", "Flat = 1"]  # 即 garbage_c 视图中的行 (SQLite 不能删除视图中的行)
+    if not sub_garbage_rollup(where, db, params=(gid,)):  # 在同一事务中修改汇总表
+        return False
+    cur = db.delete(table="garbage", where=where, params=(gid,))
+    if cur is None:
+        return False
+    if cur.rowcount == 0:
+        db.rollback()
         return False
     assert cur.rowcount == 1
     return True
 
 
 def del_garbage_has_check(gid: gid_t, db: DB) -> bool:
-    cur = db.delete(table="garbage_u", where=f"GarbageID = {gid}")
-    if cur is None or cur.rowcount == 0:
+    where = ["GarbageID = %s", "Flat = 2"]  # 即 garbage_u 视图中的行 (SQLite 不能删除视图中的行)
+    if not sub_garbage_rollup(where, db, params=(gid,)):  # 在同一事务中修改汇总表
+        return False
+    cur = db.delete(table="garbage", where=where, params=(gid,))
+    if cur is None:
+        return False
+    if cur.rowcount == 0:
+        db.rollback()
         return False
     assert cur.rowcount == 1
     return True
 
 
 def del_garbage(gid, db: DB):
-    cur = db.delete(table="garbage", where=f"GarbageID = {gid}")
-    if cur is None or cur.rowcount == 0:
+    if not sub_garbage_rollup("GarbageID = %s", db, params=(gid,)):  # 在同一事务中修改汇总表
+        return False
+    cur = db.delete(table="garbage", where="GarbageID = %s", params=(gid,))
+    if cur is None:
+        return False
+    if cur.rowcount == 0:
+        db.rollback()
         return False
     assert cur.rowcount == 1
     return True
 
 
 def del_garbage_where_not_use(where: str, db: DB) -> int:
-    cur = db.delete(table="garbage_n", where=where)
+    where = [where, "Flat = 0"]  # 即 garbage_n 视图中的行 (SQLite 不能删除视图中的行)
+    cur = db.delete(table="garbage", where=where)
     if cur is None:
         return -1
     return cur.rowcount
 
 
 def del_garbage_where_wait_check(where: str, db: DB) -> int:
-    cur = db.delete(table="garbage_c", where=where)
+    where = [where, "Flat = 1"]  # 即 garbage_c 视图中的行 (SQLite 不能删除视图中的行)
+    if not sub_garbage_rollup(where, db):  # 在同一事务中修改汇总表
+        return -1
+    cur = db.delete(table="garbage", where=where)
     if cur is None:
         return -1
     return cur.rowcount
 
 
 def del_garbage_where_has_check(where: str, db: DB) -> int:
-    cur = db.delete(table="garbage_u", where=where)
+    where = [where, "Flat = 2"]  # 即 garbage_u 视图中的行 (SQLite 不能删除视图中的行)
+    if not sub_garbage_rollup(where, db):  # 在同一事务中修改汇总表
+        return -1
+    cur = db.delete(table="garbage", where=where)
     if cur is None:
         return -1
     return cur.rowcount
@@ -397,6 +516,8 @@ def del_garbage_where_scan_has_check(where, db: DB) -> int:
 
 
 def del_all_garbage(db: DB) -> int:
+    if not clear_garbage_rollup(db):  # 在同一事务中清空汇总表
+        return -1
     cur = db.delete(table="garbage", where='1')
     if cur is None:
         return -1
@@ -0,0 +1,217 @@
+"""
+内存排行榜
+从数据库加载一次普通用户, 按 (Reputation, Score, UserID) 保存在有序表中, 之后随用户更新增量修改
+分页、查询名次、查询相邻用户都只需 O(log n), 不需要每次都对 user 表排序
+
+其他程序 (例如垃圾站) 对数据库的修改不会通知到本程序, 因此每隔 Config.leaderboard_reload 秒从数据库重新加载
+"""
+
+import time
+import bisect
+import threading
+
+from conf import Config
+from .db import DB
+from tool.typing import *
+
+try:
+    from sortedcontainers import SortedList
+except ImportError:
+    class SortedList:
+        """ 没有安装 sortedcontainers 时使用的有序表 (插入和删除为 O(n)) """
+
+        def __init__(self, iterable=None):
+            self._list = sorted(iterable) if iterable is not None else []
+
+        def add(self, value):
+            bisect.insort(self._list, value)
+
+        def remove(self, value):
+            del self._list[self.index(value)]
+
+        def bisect_left(self, value):
+            return bisect.bisect_left(self._list, value)
+
+        def bisect_right(self, value):
+            return bisect.bisect_right(self._list, value)
+
+        def index(self, value):
+            i = bisect.bisect_left(self._list, value)
+            if i == len(self._list) or self._list[i] != value:
+                raise ValueError
+            return i
+
+        def __getitem__(self, item):
+            return self._list[item]
+
+        def __len__(self):
+            return len(self._list)
+
+
+class Leaderboard:
+    """
+    排行榜
+    排行榜中的行与 SELECT UserID, Name, Score, Reputation 一致
+    """
+
+    def __init__(self, db: DB, reload_time: float = Config.leaderboard_reload):
+        self._db = db
+        self._reload_time = reload_time
+        self._lock = threading.RLock()
+        self._sorted = SortedList()  # (Reputation, Score, UserID)
+        self._user: Dict[str, Tuple[str, str, int, int]] = {}  # UserID -> (UserID, Name, Score, Reputation)
+        self._load_time: Optional[float] = None
+
+    def load(self) -> bool:
+        """
+        从数据库加载排行榜
+        :return:
+        """
+        cur = self._db.search(columns=['UserID', 'Name', 'Score', 'Reputation'],
+                              table='user',
+                              where='IsManager=0')
+        if cur is None:
+            return False
+        user = {i[0]: (i[0], i[1], int(i[2]), int(i[3])) for i in cur.fetchall()}
+
+        with self._lock:
+            self._user = user
+            self._sorted = SortedList((i[3], i[2], i[0]) for i in user.values())
+            self._load_time = time.time()
+        return True
+
+    def set_stale(self):
+        """ 无法得知具体修改的用户时 (例如按条件批量修改), 在下次读取前重新加载 """
+        with self._lock:
+            self._load_time = None
+
+    def __check_load(self) -> bool:
+        if self._load_time is None or time.time() - self._load_time > self._reload_time:
+            return self.load()
+        return True
+
+    def update(self, uid: uid_t, name: Optional[uname_t] = None, score: Optional[int] = None,
+               reputation: Optional[int] = None):
+        """
+        新增或更新用户
+        :param uid: 用户ID
+        :param name: 用户名 (为 None 时不修改)
+        :param score: 积分 (为 None 时不修改)
+        :param reputation: 垃圾分类信用 (为 None 时不修改)
+        :return:
+        """
+        with self._lock:
+            old = self._user.get(uid)
+            if old is None:
+                if name is None or score is None or reputation is None:
+                    self._load_time = None  # 信息不完整, 重新加载
+                    return
+                old = (uid, name, score, reputation)
+            else:
+                self._sorted.remove((old[3], old[2], old[0]))
+            new = (uid,
+                   old[1] if name is None else name,
+                   old[2] if score is None else int(score),
+                   old[3] if reputation is None else int(reputation))
+            self._user[uid] = new
+            self._sorted.add((new[3], new[2], new[0]))
+
+    def remove(self, uid: uid_t):
+        """
+        删除用户 (或用户成为管理员)
+        :param uid: 用户ID
+        :return:
+        """
+        with self._lock:
+            old = self._user.pop(uid, None)
+            if old is not None:
+                self._sorted.remove((old[3], old[2], old[0]))
+
+    def __row(self, key: tuple):
+        return self._user[key[2]]
+
+    def get_page(self, limit: int, offset: int = 0, order_by: str = "DESC",
+                 after: Optional[tuple] = None) -> Optional[List[tuple]]:
+        """
+        获取排行榜的一页
+        :param limit: 每页行数
+        :param offset: 位移 (after 为 None 时使用)
+        :param order_by: 排序方向
+        :param after: 上一页最后一行的 (Reputation, Score, UserID)
+        :return: [(UserID, Name, Score, Reputation), ...]
+        """
+        with self._lock:
+            if not self.__check_load():
+                return None
+            size = len(self._sorted)
+            if order_by.upper() == "DESC":
+                start = size - 1 - offset if after is None else self._sorted.bisect_left(tuple(after)) - 1
+                stop = max(start - limit, -1) if limit else -1
+                return [self.__row(self._sorted[i]) for i in range(start, stop, -1)]
+            start = offset if after is None else self._sorted.bisect_right(tuple(after))
+            stop = min(start + limit, size) if limit else size
+            return [self.__row(self._sorted[i]) for i in range(start, stop)]
+
+    def get_rank(self, uid: uid_t) -> Optional[int]:
+        """
+        :param uid: 用户ID
+        :return: 用户的名次 (从 1 开始), 用户不在排行榜中时返回 None
+        """
+        with self._lock:
+            if not self.__check_load():
+                return None
+            user = self._user.get(uid)
+            if user is None:
+                return None
+            return len(self._sorted) - self._sorted.index((user[3], user[2], user[0]))
+
+    def get_neighbors(self, uid: uid_t, n: int) -> Optional[List[Tuple[int, tuple]]]:
+        """
+        获取用户及其前后各 n 名的用户
+        :param uid: 用户ID
+        :param n: 前后的人数
+        :return: [(名次, (UserID, Name, Score, Reputation)), ...]
+        """
+        rank = self.get_rank(uid)
+        if rank is None:
+            return None
+        with self._lock:
+            size = len(self._sorted)
+            start = max(rank - n, 1)
+            stop = min(rank + n, size)
+            return [(r, self.__row(self._sorted[size - r])) for r in range(start, stop + 1)]
+
+    def count(self) -> int:
+        with self._lock:
+            if not self.__check_load():
+                return 0
+            return len(self._sorted)
+
+
+__leaderboard: "Dict[DB, Leaderboard]" = {}
+__leaderboard_lock = threading.Lock()
+
+
+def get_leaderboard(db: DB) -> Optional[Leaderboard]:
+    """
+    获取数据库对应的排行榜 (同一个数据库共用一个排行榜)
+    :param db: 数据库
+    :return: 排行榜, 未启用时返回 None
+    """
+    if not Config.leaderboard:
+        return None
+    with __leaderboard_lock:
+        board = __leaderboard.get(db)
+        if board is None:
+            board = Leaderboard(db)
+            __leaderboard[db] = board
+    return board
+
+
+def find_leaderboard(db: DB) -> Optional[Leaderboard]:
+    """
+    获取已经创建的排行榜 (用于增量更新, 尚未使用排行榜时不需要创建)
+    :param db: 数据库
+    :return:
+    """
+    return __leaderboard.get(db)
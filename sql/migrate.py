@@ -0,0 +1,206 @@
+"""
+数据库结构迁移
+init.sql (sqlite_init.sql) 为版本 0 的结构, 之后对结构的修改都以迁移的形式写在 migrations 中
+已执行的迁移记录在 schema_version 表, 因此已有的数据库可以直接升级, 不需要重建
+"""
+
+import time
+import traceback
+
+from .base_db import HGSDatabase, DBException
+from .rollup import rebuild_garbage_rollup, rebuild_user_rollup, garbage_daily, garbage_hourly
+from tool.typing import *
+
+
+class MigrationStep:
+    """ 迁移步骤 """
+
+    def apply(self, db: HGSDatabase, cursor):
+        """
+        执行步骤
+        :param db: 数据库
+        :param cursor: 数据库游标 (用于执行 DDL)
+        :return:
+        """
+        ...
+
+
+class RunSQL(MigrationStep):
+    """ 执行 SQL 语句 (MySQL 与 SQLite 语法不同时分别提供) """
+
+    def __init__(self, mysql: Union[str, List[str], None], sqlite: Union[str, List[str], None] = None):
+        if sqlite is None:
+            sqlite = mysql
+        self._sql = {"MySQL": mysql, "SQLite": sqlite}
+
+    def apply(self, db: HGSDatabase, cursor):
+        sql = self._sql.get(db.dialect)
+        if sql is None:
+            return
+        if type(sql) is str:
+            sql = [sql]
+        for s in sql:
+            cursor.execute(s)
+
+
+class RunPython(MigrationStep):
+    """ 执行 Python 函数 (例如回填数据) """
+
+    def __init__(self, func: Callable[[HGSDatabase], bool]):
+        self._func = func
+
+    def apply(self, db: HGSDatabase, cursor):
+        if not self._func(db):
+            raise DBException
+
+
+class AddIndex(MigrationStep):
+    """
+    创建索引 (索引已存在时跳过)
+    MySQL 使用 ALGORITHM=INPLACE, LOCK=NONE 在线创建, 建立索引期间表仍可读写
+    """
+
+    def __init__(self, table: str, name: str, columns: List[str], mysql_columns: Optional[List[str]] = None):
+        """
+        :param table: 表
+        :param name: 索引名
+        :param columns: 列
+        :param mysql_columns: MySQL 使用的列 (例如 BLOB 类型需要指定前缀长度)
+        """
+        self._table = table
+        self._name = name
+        self._columns = columns
+        self._mysql_columns = mysql_columns if mysql_columns is not None else columns
+
+    def apply(self, db: HGSDatabase, cursor):
+        if db.dialect == "SQLite":
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {self._name} ON {self._table}({', '.join(self._columns)});")
+            return
+
+        cursor.execute("SELECT COUNT(*) FROM information_schema.STATISTICS "
+                       "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s;",
+                       (self._table, self._name))
+        if int(cursor.fetchone()[0]) != 0:
+            return
+        cursor.execute(f"ALTER TABLE {self._table} ADD INDEX {self._name}({', '.join(self._mysql_columns)}), "
+                       f"ALGORITHM=INPLACE, LOCK=NONE;")
+
+
+class Migration:
+    def __init__(self, version: int, name: str, steps: List[MigrationStep]):
+        self.version = version
+        self.name = name
+        self.steps = steps
+
+
+migrations: List[Migration] = [
+    Migration(1, "add indexes for hot queries", [
+        AddIndex("garbage", "idx_garbage_user_time", ["UserID", "UseTime"]),  # count_garbage_by_uid 等
+        AddIndex("garbage", "idx_garbage_flat", ["Flat"]),  # garbage_n/c/u 视图
+        AddIndex("garbage", "idx_garbage_check_type", ["CheckResult", "GarbageType"],
+                 mysql_columns=["CheckResult", "GarbageType(1)"]),  # 通过率统计 (TINYBLOB 需要前缀长度)
+        AddIndex("user", "idx_user_rank", ["IsManager", "Reputation", "Score", "UserID"]),  # 排行榜
+        AddIndex("orders", "idx_orders_user_status", ["UserID", "Status"]),  # get_order_id
+    ]),
+    Migration(2, "add garbage daily rollup", [
+        RunSQL("CREATE TABLE IF NOT EXISTS garbage_daily "
+               "(Day DATE NOT NULL, GarbageType TINYINT NOT NULL, Location VARCHAR(50) NOT NULL DEFAULT '', "
+               "CheckResult TINYINT NOT NULL DEFAULT -1, Count INT NOT NULL DEFAULT 0, "
+               "PRIMARY KEY (Day, GarbageType, Location, CheckResult));"),
+        RunPython(lambda db: rebuild_garbage_rollup(db, [garbage_daily])),
+        RunSQL(["DROP VIEW IF EXISTS garbage_7d;", "DROP VIEW IF EXISTS garbage_30d;"]),  # 由汇总表代替
+    ]),
+    Migration(3, "add garbage hourly rollup", [
+        RunSQL("CREATE TABLE IF NOT EXISTS garbage_hourly "
+               "(Hour TINYINT NOT NULL, GarbageType TINYINT NOT NULL, Location VARCHAR(50) NOT NULL DEFAULT '', "
+               "CheckResult TINYINT NOT NULL DEFAULT -1, Count INT NOT NULL DEFAULT 0, "
+               "PRIMARY KEY (Hour, GarbageType, Location, CheckResult));"),
+        RunPython(lambda db: rebuild_garbage_rollup(db, [garbage_hourly])),
+    ]),
+    Migration(4, "add user lease", [
+        RunSQL(["ALTER TABLE user ADD COLUMN LockOwner VARCHAR(64);",
+                "ALTER TABLE user ADD COLUMN LockExpire DATETIME;",
+                "UPDATE user SET UserLock = 0;"]),  # UserLock 不再使用
+    ]),
+    Migration(5, "add garbage user daily rollup", [
+        RunSQL("CREATE TABLE IF NOT EXISTS garbage_user_daily "
+               "(UserID CHAR(32) NOT NULL, Day DATE NOT NULL, Count INT NOT NULL DEFAULT 0, "
+               "PRIMARY KEY (UserID, Day));"),
+        RunPython(rebuild_user_rollup),
+    ]),
+]
+
+schema_version_sql = ("CREATE TABLE IF NOT EXISTS schema_version "
+                      "(Version INT PRIMARY KEY, Name VARCHAR(100) NOT NULL, ApplyTime DATETIME NOT NULL);")
+migrate_lock = "hgssystem_migrate"
+
+
+def get_schema_version(db: HGSDatabase) -> int:
+    """
+    :param db: 数据库
+    :return: 当前数据库结构的版本 (从未执行过迁移时为 0)
+    """
+    cursor = db.get_cursor()
+    cursor.execute(schema_version_sql)
+    db.commit()
+
+    cur = db.search(columns=["MAX(Version)"], table="schema_version")
+    if cur is None or cur.rowcount == 0:
+        return 0
+    res = cur.fetchone()[0]
+    return 0 if res is None else int(res)
+
+
+def migrate(db: HGSDatabase, target: Optional[int] = None) -> int:
+    """
+    执行尚未执行的迁移
+    MySQL 使用 GET_LOCK 保证同一时间只有一个程序在执行迁移
+    :param db: 数据库
+    :param target: 目标版本 (默认为最新版本)
+    :return: 迁移后的版本, 失败返回 -1
+    """
+    cursor = db.get_cursor()
+    if db.dialect == "MySQL":
+        cursor.execute("SELECT GET_LOCK(%s, 60);", (migrate_lock,))
+        if cursor.fetchone()[0] != 1:
+            print("无法获取数据库迁移锁")
+            return -1
+
+    try:
+        version = get_schema_version(db)
+        for migration in migrations:
+            if migration.version <= version or (target is not None and migration.version > target):
+                continue
+            print(f"数据库迁移: {migration.version} {migration.name}")
+            for step in migration.steps:
+                step.apply(db, cursor)
+            cur = db.insert(table="schema_version", columns=["Version", "Name", "ApplyTime"],
+                            values="%s, %s, from_unixtime(%s)",
+                            params=(migration.version, migration.name, time.time()))
+            if cur is None:
+                return -1
+            version = migration.version
+    except Exception:
+        db.rollback()
+        traceback.print_exc()
+        return -1
+    finally:
+        if db.dialect == "MySQL":
+            cursor.execute("SELECT RELEASE_LOCK(%s);", (migrate_lock,))
+            cursor.fetchall()
+    return version
+
+
+def check_schema_version(db: HGSDatabase) -> bool:
+    """
+    检查数据库结构是否为最新版本
+    SQLite 打开时已自动迁移, MySQL 需要先运行 --program migrate
+    :param db: 数据库
+    :return:
+    """
+    version = get_schema_version(db)
+    latest = migrations[-1].version
+    if version >= latest:
+        return True
+    print(f"数据库结构版本为 {version}, 当前程序需要版本 {latest}, 请先运行 --program migrate 升级数据库")
+    return False
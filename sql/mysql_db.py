@@ -1,13 +1,181 @@
 import pymysql
 import threading
 import traceback
+import time
 
 from conf import Config
-from .base_db import HGSDatabase, DBException, DBCloseException
+from .base_db import (HGSDatabase, DBException, DBCloseException, StatementCache, QueryTimer, make_key,
+                      search_sql, insert_sql, insert_many_sql, insert_select_sql, insert_or_add_sql, delete_sql,
+                      update_sql)
 from tool.typing import *
 
+mysql_connection_lost = (2006, 2013)  # MySQL server has gone away, Lost connection to MySQL server during query
+
+
+class MysqlPool:
+    """
+    MySQL 连接池
+    每个线程独占一个连接 (线程内的多次操作使用同一个连接, 保证 not_commit 和 commit 在同一个事务中)
+    连接使用自动提交, 只读查询不会一直停留在同一个一致性快照中 (事务由 MysqlDB 显式开启)
+    线程结束后其连接会被回收, 供其他线程使用
+    """
+
+    def __init__(self, host: str, name: str, passwd: str, port: int,
+                 min_size: int = Config.mysql_pool_min,
+                 max_size: int = Config.mysql_pool_max,
+                 ping_time: float = Config.mysql_pool_ping,
+                 timeout: float = Config.mysql_pool_timeout):
+        self._host = host
+        self._name = name
+        self._passwd = passwd
+        self._port = port
+
+        self._max_size = max(int(max_size), 1)
+        self._min_size = min(max(int(min_size), 0), self._max_size)
+        self._ping_time = ping_time
+        self._timeout = timeout
+
+        self._idle: List[Tuple[pymysql.connections.Connection, time_t]] = []  # 空闲连接, 最后使用时间
+        self._owner: Dict[int, Tuple[threading.Thread, pymysql.connections.Connection]] = {}  # 线程占用的连接
+        self._size = 0  # 已创建的连接数
+        self._cond = threading.Condition(threading.Lock())
+        self._local = threading.local()
+        self._closed = False
+
+        for _ in range(self._min_size):
+            self._idle.append((self.__connect(), time.time()))
+            self._size += 1
+
+    def __connect(self) -> pymysql.connections.Connection:
+        return pymysql.connect(user=self._name,
+                               password=self._passwd,
+                               host=self._host,
+                               port=self._port,
+                               database="hgssystem",
+                               autocommit=True)
+
+    def __reclaim(self):
+        """ 回收已结束线程占用的连接, 调用时需持有 self._cond """
+        for ident, (thread, conn) in list(self._owner.items()):
+            if thread.is_alive():
+                continue
+            del self._owner[ident]
+            try:
+                conn.rollback()  # 丢弃线程未提交的内容
+            except pymysql.MySQLError:
+                self.__drop(conn)
+            else:
+                self._idle.append((conn, time.time()))
+
+    def __drop(self, conn: pymysql.connections.Connection):
+        """ 丢弃连接, 调用时需持有 self._cond """
+        self._size -= 1
+        try:
+            conn.close()
+        except pymysql.MySQLError:
+            pass
+
+    def __checkout(self) -> Tuple[pymysql.connections.Connection, time_t]:
+        deadline = time.time() + self._timeout
+        new_conn = False
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise DBCloseException
+                self.__reclaim()
+                if len(self._idle) > 0:
+                    conn, last = self._idle.pop()
+                    break
+                if self._size < self._max_size:
+                    self._size += 1  # 先占位, 在锁外建立连接
+                    conn, last = None, time.time()
+                    new_conn = True
+                    break
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise DBException("连接池中没有空闲连接")
+                self._cond.wait(min(remaining, 0.5))  # 定时醒来, 以便回收已结束线程的连接
+
+        if new_conn:
+            try:
+                conn = self.__connect()
+            except pymysql.MySQLError:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+        return conn, last
+
+    def get_conn(self, ping: bool = True) -> pymysql.connections.Connection:
+        """
+        获取当前线程的连接
+        同一线程多次调用返回同一个连接, 空闲过久的连接会先 ping (断开则自动重连)
+        :param ping: 是否 ping (事务中不能自动重连, 否则会丢失之前的写入)
+        :return: 连接
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn, last = self.__checkout()
+            thread = threading.current_thread()
+            with self._cond:
+                self._owner[thread.ident] = thread, conn
+            self._local.conn = conn
+        else:
+            last = self._local.last
+
+        if ping and time.time() - last > self._ping_time:
+            conn.ping(reconnect=True)
+        self._local.last = time.time()
+        return conn
+
+    def reconnect(self) -> pymysql.connections.Connection:
+        """ 重新建立当前线程的连接 (连接断开时使用) """
+        conn = self.get_conn()
+        conn.ping(reconnect=True)
+        return conn
+
+    def release_conn(self):
+        """
+        当前线程主动归还连接
+        未提交的内容会被回滚
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            return
+        self._local.conn = None
+        with self._cond:
+            self._owner.pop(threading.get_ident(), None)
+            try:
+                conn.rollback()
+            except pymysql.MySQLError:
+                self.__drop(conn)
+            else:
+                self._idle.append((conn, time.time()))
+            self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            for conn, _ in self._idle:
+                self.__drop(conn)
+            for _, conn in self._owner.values():
+                self.__drop(conn)
+            self._idle = []
+            self._owner = {}
+            self._cond.notify_all()
+
+    def is_closed(self) -> bool:
+        return self._closed
+
 
 class MysqlDB(HGSDatabase):
+    """
+    MySQL 数据库
+    连接使用自动提交, not_commit 的写入、FOR UPDATE 查询和批量插入会显式开启事务, 直到 commit 或 rollback
+    """
+
+    dialect = "MySQL"
+
     def __init__(self,
                  host: Optional[str] = Config.mysql_url,
                  name: Optional[str] = Config.mysql_name,
@@ -17,34 +185,64 @@ class MysqlDB(HGSDatabase):
             raise DBException
         super(MysqlDB, self).__init__(host, name, passwd, port)
         try:
-            self._db = pymysql.connect(user=self._name,
-                                       password=self._passwd,
-                                       host=self._host,
-                                       port=self._port,
-                                       database="hgssystem")
+            self._pool = MysqlPool(self._host, self._name, self._passwd, self._port)
         except pymysql.err.OperationalError:
             raise
-        self._cursor = self._db.cursor()
-        self._lock = threading.RLock()
+        self._statement = StatementCache()
+        self._txn = threading.local()  # 当前线程是否处于显式开启的事务中
+
+    def __in_transaction(self) -> bool:
+        return getattr(self._txn, "active", False)
+
+    def __begin(self, conn: pymysql.connections.Connection):
+        """ 开启事务 (已处于事务中时不做任何操作) """
+        if not self.__in_transaction():
+            conn.begin()
+            self._txn.active = True
+
+    def __end(self, conn: pymysql.connections.Connection, commit: bool):
+        """ 结束事务 """
+        self._txn.active = False
+        if commit:
+            conn.commit()
+            return
+        try:
+            conn.rollback()
+        except pymysql.MySQLError:  # 连接已断开, 事务已被服务器丢弃
+            pass
+
+    def __can_retry(self, e: pymysql.MySQLError) -> bool:
+        """
+        是否可以重连后重新执行语句
+        只有连接断开且不在事务中时才能重试 (事务中断开连接会丢失之前的写入, 死锁和锁等待超时也不能重试)
+        """
+        if self.__in_transaction():
+            return False
+        if isinstance(e, pymysql.err.InterfaceError):
+            return True
+        return isinstance(e, pymysql.err.OperationalError) and e.args[0] in mysql_connection_lost
 
     def close(self):
-        if self._cursor is not None:
-            self._cursor.close()
-        if self._db is not None:
-            self._db.close()
-        self._db = None
-        self._cursor = None
-        self._lock = None
+        if self._pool is not None:
+            self._pool.close()
+        self._pool = None
 
     def is_connect(self) -> bool:
-        if self._cursor is None or self._db is None:
+        if self._pool is None or self._pool.is_closed():
             return False
         return True
 
     def get_cursor(self) -> pymysql.cursors.Cursor:
-        if self._cursor is None or self._db is None:
+        if self._pool is None:
             raise DBCloseException
-        return self._cursor
+        return self._pool.get_conn().cursor()
+
+    def release(self):
+        """ 当前线程归还数据库连接 """
+        if self._pool is not None:
+            self._pool.release_conn()
+        self._txn.active = False
+        self._committed(commit=False)
 
     def search(self, columns: List[str], table: str,
                where: Union[str, List[str]] = None,
@@ -52,109 +250,216 @@ class MysqlDB(HGSDatabase):
                offset: Optional[int] = None,
                order_by: Optional[List[Tuple[str, str]]] = None,
                group_by: Optional[List[str]] = None,
-               for_update: bool = False):
-        if type(where) is list and len(where) > 0:
-            where: str = " WHERE " + " AND ".join(f"({w})" for w in where)
-        elif type(where) is str and len(where) > 0:
-            where = " WHERE " + where
-        else:
-            where: str = ""
+               for_update: bool = False,
+               params: Optional[tuple] = None,
+               cache: bool = False):
+        sql = self.__search_sql(columns, table, where, limit, offset, order_by, group_by, for_update)
+        if cache and not for_update:
+            return self._cached_search(sql, params, table, lambda: self.__search(sql, params))
+        return self.__search(sql, params, for_update)
 
-        if order_by is None:
-            order_by: str = ""
-        else:
-            by = [f" {i[0]} {i[1]} " for i in order_by]
-            order_by: str = " ORDER BY" + ", ".join(by)
+    def search_iter(self, columns: List[str], table: str,
+                    where: Union[str, List[str]] = None,
+                    order_by: Optional[List[Tuple[str, str]]] = None,
+                    params: Optional[tuple] = None,
+                    chunk_size: Optional[int] = None):
+        """
+        使用无缓冲游标 (SSCursor) 查询, 数据由服务器分块发送
+        遍历期间连接被该游标占用, 因此不能在同一线程中执行其他数据库操作
+        """
+        if chunk_size is None:
+            chunk_size = Config.search_iter_chunk
+        chunk_size = max(int(chunk_size), 1)
+        sql = self.__search_sql(columns, table, where, None, None, order_by, None, False)
 
-        if limit is None or limit == 0:
-            limit: str = ""
-        else:
-            limit = f" LIMIT {limit}"
+        cursor = None
+        count = 0
+        timer = QueryTimer()
+        try:
+            conn = self.__get_conn()
+            timer.connected()
+            cursor = conn.cursor(pymysql.cursors.SSCursor)
+            try:
+                cursor.execute(sql, params)
+            except (pymysql.err.OperationalError, pymysql.err.InterfaceError) as e:
+                if not self.__can_retry(e):
+                    raise
+                conn = self._pool.reconnect()  # 连接断开, 重连后再试一次
+                cursor = conn.cursor(pymysql.cursors.SSCursor)
+                cursor.execute(sql, params)
 
-        if offset is None:
-            offset: str = ""
-        else:
-            offset = f" OFFSET {offset}"
+            while True:
+                res = cursor.fetchmany(chunk_size)
+                if len(res) == 0:
+                    break
+                count += len(res)
+                yield_start = time.perf_counter()
+                yield tuple(res)
+                timer.skip(time.perf_counter() - yield_start)
+            timer.done(self._stats, sql, params, count)
+        except pymysql.MySQLError:
+            print(f"sql='{sql}' params={params}")
+            traceback.print_exc()
+        finally:
+            if cursor is not None:
+                try:
+                    cursor.close()  # 读取并丢弃剩余数据, 使连接可以继续使用
+                except pymysql.MySQLError:
+                    pass
 
-        if group_by is None:
-            group_by: str = ""
-        else:
-            group_by = "GROUP BY " + ", ".join(group_by)
+    def __search_sql(self, columns, table, where, limit, offset, order_by, group_by, for_update) -> str:
+        key = ("SELECT", make_key(columns), table, make_key(where), limit, offset,
+               make_key(order_by), make_key(group_by), for_update)
+        return self._statement.get(key, lambda: search_sql(columns, table, where, limit, offset,
+                                                           order_by, group_by, for_update))
 
-        columns: str = ", ".join(columns)
-        if for_update:
-            for_update = "FOR UPDATE"
-        else:
-            for_update = ""
-        return self.__search(f"SELECT {columns} "
-                             f"FROM {table} "
-                             f"{where} {group_by} {order_by} {limit} {offset} {for_update};")
-
-    def insert(self, table: str, columns: list, values: Union[str, List[str]], not_commit: bool = False):
-        columns: str = ", ".join(columns)
-        if type(values) is str:
-            values: str = f"({values})"
-        else:
-            values: str = ", ".join(f"{v}" for v in values)
-        return self.__done(f"INSERT INTO {table}({columns}) VALUES {values};", not_commit=not_commit)
+    def insert(self, table: str, columns: list, values: Union[str, List[str]] = None, not_commit: bool = False,
+               params: Optional[tuple] = None):
+        key = ("INSERT", table, make_key(columns), make_key(values))
+        sql = self._statement.get(key, lambda: insert_sql(table, columns, values))
+        return self.__done(sql, params, table, not_commit=not_commit)
 
-    def delete(self, table: str, where: Union[str, List[str]] = None, not_commit: bool = False):
-        if type(where) is list and len(where) > 0:
-            where: str = " AND ".join(f"({w})" for w in where)
-        elif type(where) is not str or len(where) == 0:  # 必须指定条件
-            return None
+    def insert_many(self, table: str, columns: list, rows: List[tuple], values: Optional[str] = None,
+                    not_commit: bool = False, chunk_size: Optional[int] = None) -> Optional[List[Tuple[int, int]]]:
+        """
+        多行 INSERT 中自增 ID 是连续的 (simple insert 在任意 innodb_autoinc_lock_mode 下都不会出现间隔, 要求 auto_increment_increment=1)
+        因此可以由 lastrowid 和 rowcount 得到每条语句的 ID 范围
+        """
+        if chunk_size is None:
+            chunk_size = Config.insert_many_chunk
+        chunk_size = max(int(chunk_size), 1)
 
-        return self.__done(f"DELETE FROM {table} WHERE {where};", not_commit=not_commit)
+        timer = QueryTimer()
+        try:
+            conn = self.__get_conn()
+        except pymysql.MySQLError:
+            traceback.print_exc()
+            return None
+        timer.connected()
 
-    def update(self, table: str, kw: "Dict[str:str]", where: Union[str, List[str]] = None, not_commit: bool = False):
-        if len(kw) == 0:
+        res = []
+        sql = None
+        shape = insert_many_sql(table, columns, values, 1)
+        cursor = conn.cursor()
+        try:
+            self.__begin(conn)  # 多条语句在同一个事务中
+            for i in range(0, len(rows), chunk_size):
+                chunk = rows[i: i + chunk_size]
+                key = ("INSERT MANY", table, make_key(columns), values, len(chunk))
+                sql = self._statement.get(key, lambda: insert_many_sql(table, columns, values, len(chunk)))
+                cursor.execute(sql, tuple(p for row in chunk for p in row))
+                res.append((cursor.lastrowid, cursor.lastrowid + cursor.rowcount - 1))
+                timer.done(self._stats, shape, None, cursor.rowcount)  # 按单行语句统计, 参数过多不写入日志
+                timer = QueryTimer()
+            if not not_commit:
+                self.__end(conn, True)
+        except pymysql.MySQLError:
+            self.__end(conn, False)
+            self._committed(commit=False)
+            print(f"sql={sql} rows={len(rows)}")
+            traceback.print_exc()
             return None
+        finally:
+            cursor.close()
+
+        self._written(table, not_commit)
+        if not not_commit:
+            self._committed()
+        return res
+
+    def insert_select(self, table: str, columns: list, select: str, not_commit: bool = False,
+                      params: Optional[tuple] = None):
+        key = ("INSERT SELECT", table, make_key(columns), select)
+        sql = self._statement.get(key, lambda: insert_select_sql(table, columns, select))
+        return self.__done(sql, params, table, not_commit=not_commit)
+
+    def insert_or_add(self, table: str, columns: list, keys: List[str], add_column: str,
+                      values: Optional[str] = None, not_commit: bool = False, params: Optional[tuple] = None):
+        """ MySQL 根据表上的唯一键判断冲突, 不需要 keys """
+        key = ("INSERT OR ADD", table, make_key(columns), add_column, values)
+        sql = self._statement.get(key, lambda: insert_or_add_sql(
+            table, columns, values, f"ON DUPLICATE KEY UPDATE {add_column} = {add_column} + VALUES({add_column})"))
+        return self.__done(sql, params, table, not_commit=not_commit)
 
-        if type(where) is list and len(where) > 0:
-            where: str = " AND ".join(f"({w})" for w in where)
-        elif type(where) is not str or len(where) == 0:  # 必须指定条件
+    def delete(self, table: str, where: Union[str, List[str]] = None, not_commit: bool = False,
+               params: Optional[tuple] = None):
+        key = ("DELETE", table, make_key(where))
+        sql = self._statement.get(key, lambda: delete_sql(table, where))
+        if sql is None:  # 必须指定条件
             return None
+        return self.__done(sql, params, table, not_commit=not_commit)
 
-        kw_list = [f"{key} = {kw[key]}" for key in kw]
-        kw_str = ", ".join(kw_list)
-        return self.__done(f"UPDATE {table} SET {kw_str} WHERE {where};", not_commit=not_commit)
+    def update(self, table: str, kw: "Dict[str:str]", where: Union[str, List[str]] = None, not_commit: bool = False,
+               params: Optional[tuple] = None):
+        key = ("UPDATE", table, make_key(kw), make_key(where))
+        sql = self._statement.get(key, lambda: update_sql(table, kw, where))
+        if sql is None:  # 必须指定条件
+            return None
+        return self.__done(sql, params, table, not_commit=not_commit)
 
-    def __search(self, sql) -> Union[None, pymysql.cursors.Cursor]:
-        if self._cursor is None or self._db is None:
+    def __get_conn(self) -> pymysql.connections.Connection:
+        if self._pool is None:
             raise DBCloseException
+        return self._pool.get_conn(ping=not self.__in_transaction())
 
+    def __search(self, sql, params: Optional[tuple] = None,
+                 for_update: bool = False) -> Union[None, pymysql.cursors.Cursor]:
+        timer = QueryTimer()
         try:
-            self._lock.acquire()  # 上锁
-            self._cursor.execute(sql)
+            conn = self.__get_conn()
+            timer.connected()
+            if for_update:
+                self.__begin(conn)  # 锁保持到事务结束
+            cursor = conn.cursor()
+            try:
+                cursor.execute(sql, params)
+            except (pymysql.err.OperationalError, pymysql.err.InterfaceError) as e:
+                if not self.__can_retry(e):
+                    raise
+                conn = self._pool.reconnect()  # 连接断开, 重连后再试一次
+                cursor = conn.cursor()
+                cursor.execute(sql, params)
         except pymysql.MySQLError:
-            print(f"sql='{sql}'")
+            print(f"sql='{sql}' params={params}")
             traceback.print_exc()
             return None
-        finally:
-            self._lock.release()  # 释放锁
-        return self._cursor
+        timer.done(self._stats, sql, params, cursor.rowcount)
+        return cursor
 
-    def __done(self, sql, not_commit: bool = False) -> Union[None, pymysql.cursors.Cursor]:
-        if self._cursor is None or self._db is None:
-            raise DBCloseException
+    def __done(self, sql, params: Optional[tuple], table: str,
+               not_commit: bool = False) -> Union[None, pymysql.cursors.Cursor]:
+        timer = QueryTimer()
+        try:
+            conn = self.__get_conn()
+        except pymysql.MySQLError:
+            print(f"sql={sql} params={params}")
+            traceback.print_exc()
+            return None
+        timer.connected()
 
+        cursor = conn.cursor()
         try:
-            self._lock.acquire()
-            self._cursor.execute(sql)
+            if not_commit:
+                self.__begin(conn)
+            cursor.execute(sql, params)
+            if not not_commit and self.__in_transaction():  # 不在事务中时语句已自动提交
+                self.__end(conn, True)
         except pymysql.MySQLError:
-            self._db.rollback()
-            print(f"sql={sql}")
+            self.__end(conn, False)
+            self._committed(commit=False)
+            print(f"sql={sql} params={params}")
             traceback.print_exc()
             return None
-        finally:
-            if not not_commit:
-                self._db.commit()
-            self._lock.release()
-        return self._cursor
+        timer.done(self._stats, sql, params, cursor.rowcount)  # 包括提交的时间
+        self._written(table, not_commit)
+        if not not_commit:
+            self._committed()
+        return cursor
 
     def commit(self):
-        try:
-            self._lock.acquire()
-            self._db.commit()
-        finally:
-            self._lock.release()
+        self.__end(self.__get_conn(), True)
+        self._committed()
+
+    def rollback(self):
+        self.__end(self.__get_conn(), False)
+        self._committed(commit=False)
@@ -1,39 +1,52 @@
 import datetime
 
 from sql.db import DB
+from sql.base_db import keyset_where
 from tool.typing import *
-from tool.string import mysql_str
 
 
 def write_news(text, uid: uid_t, db: DB):
-    text = mysql_str(text)
     cur = db.insert(table="context",
                     columns=["Context", "Author"],
-                    values=f"'{text}', '{uid}'")
+                    params=(text, uid))
     if cur is None:
         return False
     assert cur.rowcount == 1
     return True
 
 
-def get_news(db: DB, limit: Optional[int] = None, offset: Optional[int] = None):
+def get_news(db: DB, limit: Optional[int] = None, offset: Optional[int] = None, after: Optional[tuple] = None):
+    """
+    :param after: 上一页最后一条的 (Time, ContextID), 指定时使用键集分页
+    :return: 是否成功, 内容, 最后一条的键 (用于获取下一页)
+    """
+    where = None
+    params = None
+    if after is not None:
+        where, params = keyset_where(["Time", "ContextID"], after, "DESC")
+        offset = None
     cur = db.search(columns=["ContextID", "Context", "Name", "Time"],
                     table="context_user",
+                    where=where,
                     limit=limit,
                     offset=offset,
-                    order_by=[("Time", "DESC")])
+                    order_by=[("Time", "DESC"), ("ContextID", "DESC")],
+                    params=params,
+                    cache=True)
     if cur is None:
-        return False, None
+        return False, None, None
     res = []
+    last = None
     for i in range(cur.rowcount):
         re = cur.fetchone()
         time: datetime.datetime = re[3]
         res.append((re[0], re[1], re[2], time.strftime("%Y-%m-%d %H:%M")))
-    return True, res
+        last = (time.strftime("%Y-%m-%d %H:%M:%S"), re[0])
+    return True, res, last
 
 
 def get_news_count(db: DB):
-    cur = db.search(columns=["count(ContextID)"], table="context_user")
+    cur = db.search(columns=["count(ContextID)"], table="context_user", cache=True)
     if cur is None:
         return 0
     assert cur.rowcount == 1
@@ -42,7 +55,8 @@ def get_news_count(db: DB):
 
 def delete_news(context_id: str, db: DB):
     cur = db.delete(table="context",
-                    where=f"ContextID={context_id}")
+                    where="ContextID = %s",
+                    params=(context_id,))
     if cur is None or cur.rowcount == 0:
         return False
     assert cur.rowcount == 1
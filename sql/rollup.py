@@ -0,0 +1,373 @@
+"""
+垃圾统计汇总表
+按 (时间, 垃圾类型, 地点, 检测结果) 汇总已投放的垃圾袋数量
+garbage_daily 的时间为日期, garbage_hourly 的时间为一天中的小时 (0-23, 不区分日期)
+投放和检测垃圾袋时在同一事务中增量更新, 统计图表只需读取汇总表, 不需要扫描整个 garbage 表
+
+汇总表的主键列不能为 NULL: 未检测的垃圾袋 CheckResult 记为 -1, 没有地点时 Location 记为 ''
+管理员直接修改或删除 garbage 表时, 先按条件读取受影响的行的汇总值, 在同一事务中从汇总表中减去 (见 sub_garbage_rollup)
+rebuild_garbage_rollup 从 garbage 表完整重建汇总表, 只在迁移和 --program rollup 中使用
+
+garbage_user_daily 按 (用户, 日期) 汇总用户投放的垃圾袋数量, 用于统计用户一周内投放的垃圾袋 (按日分桶, 最多读取 8 行)
+"""
+
+import time
+
+from .base_db import HGSDatabase, DBBit, search_sql
+from tool.typing import *
+
+
+class Rollup:
+    def __init__(self, table: str, key: str, key_sql: str, get_key: Callable[[float], any]):
+        """
+        :param table: 汇总表
+        :param key: 时间列
+        :param key_sql: 从 garbage 表的 UseTime 计算时间列的 SQL 表达式 (重建时使用)
+        :param get_key: 从投放时间的时间戳计算时间列
+        """
+        self.table = table
+        self.key = key
+        self.key_sql = key_sql
+        self.get_key = get_key
+
+
+garbage_daily = Rollup("garbage_daily", "Day", "DATE(UseTime)",
+                       lambda t: time.strftime("%Y-%m-%d", time.localtime(t)))
+garbage_hourly = Rollup("garbage_hourly", "Hour", "DATE_FORMAT(UseTime, '%H') + 0",
+                        lambda t: time.localtime(t).tm_hour)
+rollups: List[Rollup] = [garbage_daily, garbage_hourly]
+
+rollup_columns = ["GarbageType", "Location", "CheckResult", "Count"]
+rollup_not_check = -1
+rollup_aggregate = ("count", "passing", "not_passing")  # 统计值 (不参与分组)
+
+
+def add_garbage_rollup(use_time: float, type_: int, loc: str, check: Optional[bool], count: int, db: HGSDatabase,
+                       not_commit: bool = False) -> bool:
+    """
+    增量更新所有汇总表
+    :param use_time: 投放时间
+    :param type_: 垃圾类型
+    :param loc: 地点
+    :param check: 检测结果 (None 表示未检测)
+    :param count: 增加的数量 (可以为负数)
+    :param db: 数据库
+    :param not_commit: 不提交 (与修改 garbage 表在同一个事务中)
+    :return:
+    """
+    check = rollup_not_check if check is None else int(check)
+    for rollup in rollups:
+        cur = db.insert_or_add(table=rollup.table,
+                               columns=[rollup.key, *rollup_columns],
+                               keys=[rollup.key, *rollup_columns[:-1]],
+                               add_column="Count",
+                               not_commit=not_commit,
+                               params=(rollup.get_key(use_time), int(type_), loc or '', check, count))
+        if cur is None:
+            return False
+    return True
+
+
+def add_user_rollup(uid: uid_t, use_time: float, count: int, db: HGSDatabase, not_commit: bool = False) -> bool:
+    """
+    增量更新用户汇总表
+    :param uid: 用户ID
+    :param use_time: 投放时间
+    :param count: 增加的数量 (可以为负数)
+    :param db: 数据库
+    :param not_commit: 不提交 (与修改 garbage 表在同一个事务中)
+    :return:
+    """
+    cur = db.insert_or_add(table="garbage_user_daily",
+                           columns=["UserID", "Day", "Count"],
+                           keys=["UserID", "Day"],
+                           add_column="Count",
+                           not_commit=not_commit,
+                           params=(uid, garbage_daily.get_key(use_time), count))
+    return cur is not None
+
+
+def __rebuild(table: str, columns: List[str], select_columns: List[str], db: HGSDatabase) -> bool:
+    """
+    在一个事务中清空汇总表, 再用 INSERT ... SELECT 从 garbage 表重建
+    MySQL 先锁定 garbage 表的所有行, 重建期间投放和检测垃圾袋的事务会等待, 不会丢失其增量更新
+    SQLite 在清空汇总表时取得写锁, 之后的 INSERT ... SELECT 读取的 garbage 表不会再被修改
+    :param table: 汇总表
+    :param columns: 汇总表的列
+    :param select_columns: 从 garbage 表计算各列的表达式 (除最后的计数列外均用于分组)
+    :param db: 数据库
+    :return:
+    """
+    if db.search(columns=["COUNT(*)"], table="garbage", for_update=True) is None:
+        db.rollback()
+        return False
+    if db.delete(table=table, where="1", not_commit=True) is None:
+        return False  # 出错时已回滚
+    select = search_sql(columns=select_columns,
+                        table="garbage",
+                        where="UseTime IS NOT NULL",
+                        group_by=[f"RollupColumn{i}" for i in range(len(select_columns) - 1)])
+    if db.insert_select(table=table, columns=columns, select=select, not_commit=True) is None:
+        return False
+    db.commit()
+    return True
+
+
+def __select_columns(columns: List[str]) -> List[str]:
+    """ 为分组的列添加别名 """
+    return [f"{c} AS RollupColumn{i}" for i, c in enumerate(columns[:-1])] + [columns[-1]]
+
+
+def rebuild_user_rollup(db: HGSDatabase) -> bool:
+    """
+    从 garbage 表重建用户汇总表
+    :param db: 数据库
+    :return:
+    """
+    return __rebuild("garbage_user_daily", ["UserID", "Day", "Count"],
+                     __select_columns(["UserID", garbage_daily.key_sql, "count(GarbageID)"]), db)
+
+
+def user_week_range() -> Tuple[str, str]:
+    """
+    :return: 统计用户一周内 (前后3.5天) 投放的垃圾袋时的日期范围
+    """
+    now = time.time()
+    return (garbage_daily.get_key(now - 3.5 * 24 * 60 * 60),
+            garbage_daily.get_key(now + 3.5 * 24 * 60 * 60))
+
+
+def count_user_garbage(uid: uid_t, db: HGSDatabase, time_limit: bool = True) -> int:
+    """
+    从用户汇总表统计用户投放的垃圾袋
+    :param uid: 用户ID
+    :param db: 数据库
+    :param time_limit: 只统计一周内 (前后3.5天) 的垃圾袋
+    :return: 数量, 出错返回 -1
+    """
+    if time_limit:
+        where = ["UserID = %s", "Day BETWEEN %s AND %s"]
+        params = (uid, *user_week_range())
+    else:
+        where = "UserID = %s"
+        params = (uid,)
+    cur = db.search(columns=["COALESCE(SUM(Count), 0)"],
+                    table="garbage_user_daily",
+                    where=where,
+                    params=params)
+    if cur is None:
+        return -1
+    assert cur.rowcount == 1
+    return int(cur.fetchone()[0])
+
+
+def rebuild_garbage_rollup(db: HGSDatabase, rollup_list: Optional[List[Rollup]] = None) -> bool:
+    """
+    从 garbage 表重建汇总表 (回填历史数据)
+    需要扫描整个 garbage 表, 只在迁移和 --program rollup 中使用
+    :param db: 数据库
+    :param rollup_list: 需要重建的汇总表 (默认为全部, 包括用户汇总表)
+    :return:
+    """
+    if rollup_list is None:
+        if not rebuild_user_rollup(db):
+            return False
+        rollup_list = rollups
+    for rollup in rollup_list:
+        if not __rebuild(rollup.table, [rollup.key, *rollup_columns],
+                         __select_columns([rollup.key_sql,
+                                           "GarbageType + 0",
+                                           "COALESCE(Location, '')",
+                                           f"COALESCE(CheckResult + 0, {rollup_not_check})",
+                                           "count(GarbageID)"]), db):
+            return False
+    return True
+
+
+def __search_garbage_group(where: Union[str, List[str]], params: Optional[tuple],
+                           db: HGSDatabase) -> Optional[List[tuple]]:
+    """
+    按汇总表的键统计 garbage 表中符合条件的已投放垃圾袋, 并锁定这些行 (MySQL)
+    :return: [(日期, 小时, 用户ID, 垃圾类型, 地点, 检测结果, 数量), ...]
+    """
+    if type(where) is str:
+        where = [where]
+    columns = [garbage_daily.key_sql, garbage_hourly.key_sql, "UserID", "GarbageType + 0",
+               "COALESCE(Location, '')", f"COALESCE(CheckResult + 0, {rollup_not_check})", "count(GarbageID)"]
+    columns = __select_columns(columns)
+    if params is not None:
+        columns = [c.replace("%", "%%") for c in columns]  # 绑定参数时语句中的 % 需写作 %%
+    cur = db.search(columns=columns,
+                    table="garbage",
+                    where=["UseTime IS NOT NULL", *where],
+                    group_by=[f"RollupColumn{i}" for i in range(len(columns) - 1)],
+                    for_update=True,
+                    params=params)
+    if cur is None:
+        return None
+    return [(i[0], int(i[1]), i[2], int(i[3]), i[4], int(i[5]), int(i[6])) for i in cur.fetchall()]
+
+
+def __add_garbage_group(group: List[tuple], sign: int, db: HGSDatabase, user: bool = True) -> bool:
+    """
+    把 __search_garbage_group 的结果累加到汇总表 (不提交)
+    :param group: 统计结果
+    :param sign: 1 为增加, -1 为减少
+    :param db: 数据库
+    :param user: 是否更新用户汇总表
+    :return:
+    """
+    count: Dict[Tuple[str, tuple], int] = {}  # (汇总表, 键) -> 数量
+    for day, hour, uid, type_, loc, check, n in group:
+        keys = [(garbage_daily.table, (day, type_, loc, check)), (garbage_hourly.table, (hour, type_, loc, check))]
+        if user and uid is not None:
+            keys.append(("garbage_user_daily", (uid, day)))
+        for key in keys:
+            count[key] = count.get(key, 0) + n
+
+    table_columns = {rollup.table: ([rollup.key, *rollup_columns], [rollup.key, *rollup_columns[:-1]])
+                     for rollup in rollups}
+    table_columns["garbage_user_daily"] = (["UserID", "Day", "Count"], ["UserID", "Day"])
+    for (table, key), n in count.items():
+        if n == 0:
+            continue
+        columns, keys = table_columns[table]
+        cur = db.insert_or_add(table=table, columns=columns, keys=keys, add_column="Count", not_commit=True,
+                               params=(*key, sign * n))
+        if cur is None:
+            return False  # 出错时已回滚
+    return True
+
+
+def sub_garbage_rollup(where: Union[str, List[str]], db: HGSDatabase, params: Optional[tuple] = None) -> bool:
+    """
+    删除 garbage 表中的行之前调用: 从汇总表中减去这些行 (不提交, 与删除在同一事务中)
+    :param where: 删除的条件 (garbage 表的列)
+    :param db: 数据库
+    :param params: 绑定到占位符的参数
+    :return:
+    """
+    group = __search_garbage_group(where, params, db)
+    if group is None:
+        db.rollback()
+        return False
+    return __add_garbage_group(group, -1, db)
+
+
+def change_garbage_rollup(where: Union[str, List[str]], column: str, value: int, db: HGSDatabase,
+                          params: Optional[tuple] = None) -> bool:
+    """
+    修改 garbage 表的 GarbageType 或 CheckResult 之前调用: 把这些行从原来的键移到新的键 (不提交, 与修改在同一事务中)
+    :param where: 修改的条件 (garbage 表的列)
+    :param column: 修改的列 (GarbageType 或 CheckResult)
+    :param value: 修改后的值
+    :param db: 数据库
+    :param params: 绑定到占位符的参数
+    :return:
+    """
+    index = {"GarbageType": 3, "CheckResult": 5}[column]
+    group = __search_garbage_group(where, params, db)
+    if group is None:
+        db.rollback()
+        return False
+    new_group = [(*i[:index], int(value), *i[index + 1:]) for i in group]
+    return __add_garbage_group(group, -1, db, user=False) and __add_garbage_group(new_group, 1, db, user=False)
+
+
+def clear_garbage_rollup(db: HGSDatabase) -> bool:
+    """
+    删除 garbage 表的所有行之前调用: 清空所有汇总表 (不提交)
+    :param db: 数据库
+    :return:
+    """
+    for table in [*(rollup.table for rollup in rollups), "garbage_user_daily"]:
+        if db.delete(table=table, where="1", not_commit=True) is None:
+            return False
+    return True
+
+
+def __to_garbage_value(column: str, value):
+    """ 把汇总表中的值转换为 garbage 表中对应列的格式 (与原先直接查询 garbage 表的结果一致) """
+    if column == "GarbageType":
+        return str(int(value)).encode('utf-8')  # TINYBLOB
+    elif column == "CheckResult":
+        if int(value) == rollup_not_check:
+            return None
+        return DBBit.BIT_1 if int(value) else DBBit.BIT_0
+    elif column == "days" or column == "hour":
+        return int(value)
+    elif column in rollup_aggregate:
+        return 0 if value is None else int(value)  # 没有任何行时 SUM 为 NULL
+    return value
+
+
+def __search_rollup(rollup: Rollup, columns: List[str], column_sql: Dict[str, str], db: HGSDatabase,
+                    where: List[str], params: Optional[tuple], order_by: Optional[List[Tuple[str, str]]]):
+    group_by = [c for c in columns if c not in rollup_aggregate]
+    cur = db.search(columns=[column_sql.get(c, c) for c in columns],
+                    table=rollup.table,
+                    where=where + ["Count != 0"],
+                    group_by=group_by if len(group_by) != 0 else None,
+                    order_by=order_by if order_by else None,
+                    params=params)
+    if cur is None:
+        return None
+    return [tuple(__to_garbage_value(c, v) for c, v in zip(columns, row)) for row in cur.fetchall()]
+
+
+def search_garbage_daily(columns: List[str], days: int, db: HGSDatabase,
+                         order_by: Optional[List[Tuple[str, str]]] = None) -> Optional[List[tuple]]:
+    """
+    按日统计最近若干天投放的垃圾袋
+    :param columns: 列, 可以是 days (距今天数), count (数量), GarbageType, Location, CheckResult
+    :param days: 最近的天数
+    :param db: 数据库
+    :param order_by: 排序
+    :return: 按 columns 给出的各列, 除 count 外其余列均用于分组
+    """
+    column_sql = {"days": "TO_DAYS(NOW()) - TO_DAYS(Day) AS days", "count": "SUM(Count) AS count"}
+    start = garbage_daily.get_key(time.time() - (days - 1) * 24 * 60 * 60)
+    return __search_rollup(garbage_daily, columns, column_sql, db, ["Day >= %s"], (start,), order_by)
+
+
+def search_garbage_hourly(columns: List[str], db: HGSDatabase,
+                          order_by: Optional[List[Tuple[str, str]]] = None) -> Optional[List[tuple]]:
+    """
+    按时段 (小时) 统计所有投放的垃圾袋
+    :param columns: 列, 可以是 hour (小时), count (数量), GarbageType, Location, CheckResult
+    :param db: 数据库
+    :param order_by: 排序
+    :return: 按 columns 给出的各列, 除 count 外其余列均用于分组
+    """
+    column_sql = {"hour": "Hour AS hour", "count": "SUM(Count) AS count"}
+    return __search_rollup(garbage_hourly, columns, column_sql, db, [], None, order_by)
+
+
+def search_passing_rate(columns: List[str], db: HGSDatabase, loc: Optional[str] = None,
+                        order_by: Optional[List[Tuple[str, str]]] = None) -> Optional[List[tuple]]:
+    """
+    统计已检测垃圾袋的通过和不通过数量
+    从汇总表中用条件聚合一次读出, 不需要对每个分组执行子查询
+    :param columns: 列, 可以是 passing (通过数量), not_passing (不通过数量), GarbageType, Location
+    :param db: 数据库
+    :param loc: 只统计该区域 (默认为全局)
+    :param order_by: 排序
+    :return: 按 columns 给出的各列, 除 passing 和 not_passing 外其余列均用于分组
+    """
+    column_sql = {"passing": "SUM(CASE WHEN CheckResult = 1 THEN Count ELSE 0 END) AS passing",
+                  "not_passing": "SUM(CASE WHEN CheckResult = 0 THEN Count ELSE 0 END) AS not_passing"}
+    where = [f"CheckResult != {rollup_not_check}"]
+    params = None
+    if loc is not None:
+        where.append("Location = %s")
+        params = (loc,)
+    return __search_rollup(garbage_hourly, columns, column_sql, db, where, params, order_by)
+
+
+def get_passing_rate(passing: int, not_passing: int) -> float:
+    """
+    :return: 通过率 (没有检测数据时为 0)
+    """
+    if passing + not_passing == 0:
+        return 0
+    return round(passing / (passing + not_passing), 4)
@@ -0,0 +1,355 @@
+import os
+import re
+import math
+import time
+import sqlite3
+import datetime
+import threading
+import traceback
+
+from conf import Config
+from .base_db import (HGSDatabase, DBBit, DBCloseException, StatementCache, QueryTimer, BufferedCursor,
+                      make_key, search_sql, insert_sql, insert_many_sql, insert_select_sql, insert_or_add_sql,
+                      delete_sql, update_sql)
+from .migrate import migrate
+from tool.typing import *
+
+sqlite_init = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sqlite_init.sql")
+placeholder_pattern = re.compile(r"%([s%])")
+sqlite_max_variable = 999  # 旧版本 SQLite 单条语句最多绑定的参数个数
+mysql_date_format = {"Y": "%Y", "m": "%m", "d": "%d", "H": "%H", "i": "%M", "s": "%S", "S": "%S", "%": "%%"}
+
+
+def _datetime_str(t: datetime.datetime) -> str:
+    return t.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _to_datetime(t) -> Optional[datetime.datetime]:
+    if t is None:
+        return None
+    if isinstance(t, bytes):
+        t = t.decode("utf-8")
+    return datetime.datetime.fromisoformat(str(t))
+
+
+def _from_unixtime(t) -> Optional[str]:
+    if t is None:
+        return None
+    return _datetime_str(datetime.datetime.fromtimestamp(round(float(t))))  # DATETIME 精确到秒
+
+
+def _now() -> str:
+    return _datetime_str(datetime.datetime.now())
+
+
+def _to_days(t) -> Optional[int]:
+    t = _to_datetime(t)
+    if t is None:
+        return None
+    return t.toordinal() + 365  # 与 MySQL 的 TO_DAYS 一致 (从公元0年开始计算)
+
+
+def _date_format(t, fmt: str) -> Optional[str]:
+    t = _to_datetime(t)
+    if t is None:
+        return None
+    fmt = re.sub(r"%(.)", lambda m: mysql_date_format.get(m.group(1), m.group(0)), fmt)
+    return t.strftime(fmt)
+
+
+def _get_avg(num1, num2) -> float:
+    if not num1 or not num2:
+        return 0
+    return round(num1 / num2, 4)  # 与 MySQL 中 DECIMAL(5, 4) 的精度一致
+
+
+def _ceil(num) -> Optional[int]:
+    if num is None:
+        return None
+    return math.ceil(num)
+
+
+def _regexp(pattern: str, string) -> bool:
+    if string is None:
+        return False
+    return re.search(pattern, str(string)) is not None
+
+
+sqlite3.register_converter("BIT", lambda b: DBBit.BIT_1 if int(b) else DBBit.BIT_0)  # 与 pymysql 返回的 BIT 一致
+sqlite3.register_converter("TINYBLOB", lambda b: b)
+sqlite3.register_converter("DATETIME", _to_datetime)
+
+
+class SqliteCursor(BufferedCursor):
+    """
+    SQLite 游标
+    sqlite3 的 SELECT 不提供 rowcount, 此处缓存查询结果以模拟 pymysql 的缓冲游标
+    """
+
+    def __init__(self, cursor: sqlite3.Cursor, rows: Optional[list] = None):
+        super(SqliteCursor, self).__init__(rows,
+                                           rowcount=None if rows is not None else cursor.rowcount,
+                                           lastrowid=cursor.lastrowid,
+                                           description=cursor.description)
+
+
+class SqliteDB(HGSDatabase):
+    """
+    SQLite 数据库
+    用于单机垃圾站或测试, 没有网络开销
+    每个线程使用独立的连接, 数据库使用 WAL 模式以便读写并发
+    打开数据库时自动执行尚未执行的迁移
+    """
+
+    dialect = "SQLite"
+    max_variable = sqlite_max_variable
+
+    def __init__(self, path: Optional[str] = Config.sqlite_path):
+        super(SqliteDB, self).__init__(path, "", "", None)
+        self._path = str(path)
+        self._local = threading.local()
+        self._statement = StatementCache()
+        self._closed = False
+
+        conn = self.__get_conn()
+        with open(sqlite_init, "r", encoding='utf-8') as f:
+            conn.executescript(f.read())
+        conn.commit()
+        migrate(self)
+
+    def __connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self._path,
+                               timeout=Config.sqlite_timeout,
+                               detect_types=sqlite3.PARSE_DECLTYPES,
+                               cached_statements=256)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+
+        conn.create_function("get_avg", 2, _get_avg)
+        conn.create_function("from_unixtime", 1, _from_unixtime)
+        conn.create_function("NOW", 0, _now)
+        conn.create_function("TO_DAYS", 1, _to_days)
+        conn.create_function("DATE_FORMAT", 2, _date_format)
+        conn.create_function("ceil", 1, _ceil)
+        conn.create_function("REGEXP", 2, _regexp)
+        return conn
+
+    def __get_conn(self) -> sqlite3.Connection:
+        if self._closed:
+            raise DBCloseException
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self.__connect()
+            self._local.conn = conn
+        return conn
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+        self._local.conn = None
+        self._closed = True
+
+    def is_connect(self) -> bool:
+        return not self._closed
+
+    def get_cursor(self) -> sqlite3.Cursor:
+        return self.__get_conn().cursor()
+
+    def release(self):
+        """ 当前线程关闭数据库连接 """
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.rollback()
+            conn.close()
+        self._local.conn = None
+        self._committed(commit=False)
+
+    def search(self, columns: List[str], table: str,
+               where: Union[str, List[str]] = None,
+               limit: Optional[int] = None,
+               offset: Optional[int] = None,
+               order_by: Optional[List[Tuple[str, str]]] = None,
+               group_by: Optional[List[str]] = None,
+               for_update: bool = False,
+               params: Optional[tuple] = None,
+               cache: bool = False):
+        sql = self.__search_sql(columns, table, where, limit, offset, order_by, group_by, params)
+        if cache:
+            return self._cached_search(sql, params, table, lambda: self.__search(sql, params))
+        return self.__search(sql, params)
+
+    def search_iter(self, columns: List[str], table: str,
+                    where: Union[str, List[str]] = None,
+                    order_by: Optional[List[Tuple[str, str]]] = None,
+                    params: Optional[tuple] = None,
+                    chunk_size: Optional[int] = None):
+        """ sqlite3 的游标本身按需读取, 直接分块 fetchmany 即可 """
+        if chunk_size is None:
+            chunk_size = Config.search_iter_chunk
+        chunk_size = max(int(chunk_size), 1)
+        sql = self.__search_sql(columns, table, where, None, None, order_by, None, params)
+
+        cursor = None
+        count = 0
+        timer = QueryTimer()
+        try:
+            cursor = self.__get_conn().cursor()
+            timer.connected()
+            cursor.execute(sql, params or tuple())
+            while True:
+                res = cursor.fetchmany(chunk_size)
+                if len(res) == 0:
+                    break
+                count += len(res)
+                yield_start = time.perf_counter()
+                yield tuple(res)
+                timer.skip(time.perf_counter() - yield_start)
+            timer.done(self._stats, sql, params, count)
+        except sqlite3.Error:
+            print(f"sql='{sql}' params={params}")
+            traceback.print_exc()
+        finally:
+            if cursor is not None:
+                cursor.close()
+
+    def __search_sql(self, columns, table, where, limit, offset, order_by, group_by, params) -> str:
+        key = ("SELECT", make_key(columns), table, make_key(where), limit, offset,
+               make_key(order_by), make_key(group_by), params is None)
+        return self._statement.get(key, lambda: self.__placeholder(  # SQLite 不支持 FOR UPDATE
+            search_sql(columns, table, where, limit, offset, order_by, group_by), params))
+
+    def insert(self, table: str, columns: list, values: Union[str, List[str]] = None, not_commit: bool = False,
+               params: Optional[tuple] = None):
+        key = ("INSERT", table, make_key(columns), make_key(values), params is None)
+        sql = self._statement.get(key, lambda: self.__placeholder(insert_sql(table, columns, values), params))
+        return self.__done(sql, params, table, not_commit=not_commit)
+
+    def insert_many(self, table: str, columns: list, rows: List[tuple], values: Optional[str] = None,
+                    not_commit: bool = False, chunk_size: Optional[int] = None) -> Optional[List[Tuple[int, int]]]:
+        """
+        单条语句持有写锁, 其插入的行 ID 连续, lastrowid 为最后一行的 ID
+        """
+        if chunk_size is None:
+            chunk_size = Config.insert_many_chunk
+        if len(rows) > 0 and len(rows[0]) > 0:
+            chunk_size = min(int(chunk_size), sqlite_max_variable // len(rows[0]))
+        chunk_size = max(int(chunk_size), 1)
+
+        timer = QueryTimer()
+        conn = self.__get_conn()
+        timer.connected()
+        res = []
+        sql = None
+        shape = insert_many_sql(table, columns, values, 1)
+        cursor = conn.cursor()
+        try:
+            for i in range(0, len(rows), chunk_size):
+                chunk = rows[i: i + chunk_size]
+                key = ("INSERT MANY", table, make_key(columns), values, len(chunk))
+                sql = self._statement.get(key, lambda: self.__placeholder(
+                    insert_many_sql(table, columns, values, len(chunk)), tuple()))
+                cursor.execute(sql, tuple(p for row in chunk for p in row))
+                res.append((cursor.lastrowid - cursor.rowcount + 1, cursor.lastrowid))
+                timer.done(self._stats, shape, None, cursor.rowcount)  # 按单行语句统计, 参数过多不写入日志
+                timer = QueryTimer()
+        except sqlite3.Error:
+            conn.rollback()
+            self._committed(commit=False)
+            print(f"sql={sql} rows={len(rows)}")
+            traceback.print_exc()
+            return None
+        finally:
+            cursor.close()
+
+        if not not_commit:
+            conn.commit()
+        self._written(table, not_commit)
+        if not not_commit:
+            self._committed()
+        return res
+
+    def insert_select(self, table: str, columns: list, select: str, not_commit: bool = False,
+                      params: Optional[tuple] = None):
+        key = ("INSERT SELECT", table, make_key(columns), select, params is None)
+        sql = self._statement.get(key, lambda: self.__placeholder(insert_select_sql(table, columns, select), params))
+        return self.__done(sql, params, table, not_commit=not_commit)
+
+    def insert_or_add(self, table: str, columns: list, keys: List[str], add_column: str,
+                      values: Optional[str] = None, not_commit: bool = False, params: Optional[tuple] = None):
+        """ 需要 SQLite 3.24 及以上版本 (UPSERT 语法) """
+        key = ("INSERT OR ADD", table, make_key(columns), make_key(keys), add_column, values, params is None)
+        sql = self._statement.get(key, lambda: self.__placeholder(insert_or_add_sql(
+            table, columns, values,
+            f"ON CONFLICT({', '.join(keys)}) DO UPDATE SET {add_column} = {add_column} + excluded.{add_column}"), params))
+        return self.__done(sql, params, table, not_commit=not_commit)
+
+    def delete(self, table: str, where: Union[str, List[str]] = None, not_commit: bool = False,
+               params: Optional[tuple] = None):
+        key = ("DELETE", table, make_key(where), params is None)
+        sql = self._statement.get(key, lambda: self.__placeholder(delete_sql(table, where), params))
+        if sql is None:  # 必须指定条件
+            return None
+        return self.__done(sql, params, table, not_commit=not_commit)
+
+    def update(self, table: str, kw: "Dict[str:str]", where: Union[str, List[str]] = None, not_commit: bool = False,
+               params: Optional[tuple] = None):
+        key = ("UPDATE", table, make_key(kw), make_key(where), params is None)
+        sql = self._statement.get(key, lambda: self.__placeholder(update_sql(table, kw, where), params))
+        if sql is None:  # 必须指定条件
+            return None
+        return self.__done(sql, params, table, not_commit=not_commit)
+
+    @staticmethod
+    def __placeholder(sql: Optional[str], params: Optional[tuple]) -> Optional[str]:
+        """ 把 pymysql 风格的占位符 `%s` 转换为 SQLite 的 `?` """
+        if sql is None or params is None:
+            return sql
+        return placeholder_pattern.sub(lambda m: "?" if m.group(1) == "s" else "%", sql)
+
+    def __search(self, sql, params: Optional[tuple] = None) -> Optional[SqliteCursor]:
+        timer = QueryTimer()
+        try:
+            cursor = self.__get_conn().cursor()
+            timer.connected()
+            cursor.execute(sql, params or tuple())
+            res = SqliteCursor(cursor, cursor.fetchall())
+            cursor.close()
+        except sqlite3.Error:
+            print(f"sql='{sql}' params={params}")
+            traceback.print_exc()
+            return None
+        timer.done(self._stats, sql, params, res.rowcount)
+        return res
+
+    def __done(self, sql, params: Optional[tuple], table: str, not_commit: bool = False) -> Optional[SqliteCursor]:
+        timer = QueryTimer()
+        conn = self.__get_conn()
+        timer.connected()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql, params or tuple())
+            res = SqliteCursor(cursor)
+            cursor.close()
+            if not not_commit:
+                conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            self._committed(commit=False)
+            print(f"sql={sql} params={params}")
+            traceback.print_exc()
+            return None
+        timer.done(self._stats, sql, params, res.rowcount)  # 包括提交的时间
+        self._written(table, not_commit)
+        if not not_commit:
+            self._committed()
+        return res
+
+    def commit(self):
+        self.__get_conn().commit()
+        self._committed()
+
+    def rollback(self):
+        self.__get_conn().rollback()
+        self._committed(commit=False)
@@ -4,7 +4,8 @@ from tool.typing import *
 
 def get_store_item_list(db: DB) -> Optional[List]:
     cur = db.search(columns=["Name", "Score", "Quantity", "GoodsID"],
-                    table="goods")
+                    table="goods",
+                    cache=True)
     if cur is None or cur.rowcount == 0:
         return None
     return cur.fetchall()
@@ -13,7 +14,8 @@ def get_store_item_list(db: DB) -> Optional[List]:
 def get_store_item(goods_id: int, db: DB) -> Optional[List]:
     cur = db.search(columns=["Name", "Score", "Quantity", "GoodsID"],
                     table="goods",
-                    where=f"GoodsID={goods_id}")
+                    where="GoodsID = %s",
+                    params=(goods_id,))
     if cur is None:
         return None
     assert cur.rowcount == 1
@@ -21,16 +23,17 @@ def get_store_item(goods_id: int, db: DB) -> Optional[List]:
 
 
 def update_goods(goods_id: int, quantity: int, db: DB):
-    cur = db.update(table="goods", kw={"Quantity": f"{quantity}"}, where=f"GoodsID={goods_id}")
+    cur = db.update(table="goods", kw={"Quantity": "%s"}, where="GoodsID = %s", params=(quantity, goods_id))
     assert cur.rowcount == 1
 
 
 def get_order_id(uid: uid_t, db: DB):
     cur = db.search(columns=["OrderID"],
                     table="orders",
-                    where=f"UserID = '{uid}' and status=0")
+                    where="UserID = %s and status=0",
+                    params=(uid,))
     if cur is None or cur.rowcount == 0:
-        cur = db.insert(table="orders", columns=["UserID"], values=f"'{uid}'")
+        cur = db.insert(table="orders", columns=["UserID"], params=(uid,))
         if cur is None:
             return None
         return cur.lastrowid
@@ -41,7 +44,7 @@ def get_order_id(uid: uid_t, db: DB):
 def write_goods(goods_id: int, quantity: int, order_id: int, db: DB):
     cur = db.insert(table="ordergoods",
                     columns=["OrderID", "GoodsID", "Quantity"],
-                    values=f"{order_id}, {goods_id}, {quantity}")
+                    params=(order_id, goods_id, quantity))
     if cur is None:
         return False
     assert cur.rowcount == 1
@@ -51,7 +54,8 @@ def write_goods(goods_id: int, quantity: int, order_id: int, db: DB):
 def check_order(order: int, uid: uid_t, db: DB) -> bool:
     cur = db.search(columns=["UserID"],
                     table="orders",
-                    where=[f"OrderID='{order}'", f"UserID='{uid}'"])
+                    where=["OrderID = %s", "UserID = %s"],
+                    params=(order, uid))
     if cur is None or cur.rowcount != 1:
         return False
     uid = cur.fetchone()[0]
@@ -63,7 +67,8 @@ def check_order(order: int, uid: uid_t, db: DB) -> bool:
 def get_goods_from_order(order, db: DB) -> Optional[list]:
     cur = db.search(columns=["Name", "Quantity"],
                     table="order_goods_view",
-                    where=f"OrderID = '{order}'")
+                    where="OrderID = %s",
+                    params=(order,))
     if cur is None:
         return None
     return cur.fetchall()
@@ -72,13 +77,15 @@ def get_goods_from_order(order, db: DB) -> Optional[list]:
 def confirm_order(order: int, uid: uid_t, db: DB) -> bool:
     cur = db.search(columns=["OrderID"],
                     table="orders",
-                    where=[f"OrderID={order}", f"UserID='{uid}'", "Status=0"])
+                    where=["OrderID = %s", "UserID = %s", "Status=0"],
+                    params=(order, uid))
     if cur is None or cur.rowcount == 0:
         return False
     assert cur.rowcount == 1
     cur = db.update(table="orders",
                     kw={"Status": "1"},
-                    where=[f"OrderID={order}", f"UserID='{uid}'", "Status=0"])
+                    where=["OrderID = %s", "UserID = %s", "Status=0"],
+                    params=(order, uid))
     if cur is None:
         return False
     assert cur.rowcount == 1
@@ -87,8 +94,9 @@ def confirm_order(order: int, uid: uid_t, db: DB) -> bool:
 
 def set_goods_quantity(quantity: int, goods_id, db: DB):
     cur = db.update(table="goods",
-                    kw={"Quantity": f"{quantity}"},
-                    where=f"GoodsID={goods_id}")
+                    kw={"Quantity": "%s"},
+                    where="GoodsID = %s",
+                    params=(quantity, goods_id))
     if cur is None or cur.rowcount == 0:
         return False
     assert cur.rowcount == 1
@@ -97,8 +105,9 @@ def set_goods_quantity(quantity: int, goods_id, db: DB):
 
 def set_goods_score(score: score_t, goods_id, db: DB):
     cur = db.update(table="goods",
-                    kw={"Score": f"{score}"},
-                    where=f"GoodsID={goods_id}")
+                    kw={"Score": "%s"},
+                    where="GoodsID = %s",
+                    params=(score, goods_id))
     if cur is None or cur.rowcount == 0:
         return False
     assert cur.rowcount == 1
@@ -108,7 +117,7 @@ def set_goods_score(score: score_t, goods_id, db: DB):
 def add_new_goods(name: str, score: score_t, quantity: int, db: DB):
     cur = db.insert(table='goods',
                     columns=["Name", "Quantity", "Score"],
-                    values=f"'{name}', {quantity}, {score}")
+                    params=(name, quantity, score))
     if cur is None or cur.rowcount == 0:
         return False
     assert cur.rowcount == 1
@@ -1,39 +1,91 @@
+import os
 import csv
+import time
+import uuid
+import socket
 
 from . import DBBit
 from .db import DB
+from .base_db import keyset_where
+from .leaderboard import get_leaderboard, find_leaderboard
+from .rollup import user_week_range
 from tool.typing import *
 from tool.login import create_uid, randomPassword
-from tool.time import mysql_time
 from core.user import NormalUser, ManagerUser, User
 from conf import Config
-from . import garbage
 
 
-def get_rank_for_user(db: DB, limit, offset, order_by: str = "DESC"):
+lease_owner = f"{socket.gethostname()[:40]}-{os.getpid()}-{uuid.uuid4().hex[:8]}"  # 本程序持有用户锁时的标识
+lease_expire = "CASE WHEN LockOwner = %s THEN from_unixtime(%s) ELSE LockExpire END"  # 更新用户时顺带续期租约
+rank_key = ['Reputation', 'Score', 'UserID']  # 排行榜的排序列
+
+
+def get_rank_page(db: DB, limit: int, order_by: str = "DESC", offset: int = 0,
+                  after: Optional[tuple] = None) -> Optional[List[tuple]]:
+    """
+    获取排行榜的一页 (启用内存排行榜时不需要查询数据库)
+    :param db: 数据库
+    :param limit: 每页行数
+    :param order_by: 排序方向
+    :param offset: 位移 (after 为 None 时使用)
+    :param after: 上一页最后一行的 (Reputation, Score, UserID), 指定时使用键集分页
+    :return: [(UserID, Name, Score, Reputation), ...]
+    """
+    board = get_leaderboard(db)
+    if board is not None:
+        res = board.get_page(limit, offset, order_by, after)
+        if res is not None:
+            return res
+
+    where = ['IsManager=0']
+    params = None
+    if after is not None:
+        key_where, params = keyset_where(rank_key, after, order_by)
+        where.append(key_where)
+        offset = None
     cur = db.search(columns=['UserID', 'Name', 'Score', 'Reputation'],
                     table='user',
-                    where='IsManager=0',
-                    order_by=[('Reputation', order_by), ('Score', order_by), ('UserID', order_by)],
+                    where=where,
+                    order_by=[(i, order_by) for i in rank_key],
                     limit=limit,
-                    offset=offset)
-
+                    offset=offset if offset else None,
+                    params=params,
+                    cache=True)
     if cur is None:
+        return None
+    return list(cur.fetchall())
+
+
+def get_rank_for_user(db: DB, limit, offset, order_by: str = "DESC", after: Optional[tuple] = None):
+    """
+    :param offset: 位移 (用于计算名次, after 为 None 时也用于分页)
+    :param after: 上一页最后一行的键
+    :return: 排行榜数据, 本页最后一行的键 (用于获取下一页)
+    """
+    rank = get_rank_page(db, limit, order_by, offset, after)
+    if rank is None:
         return None, None
     res = []
-    for index in range(cur.rowcount):
-        i = cur.fetchone()
+    for index, i in enumerate(rank):
         res.append((f"{offset + index + 1}", i[1], i[0][:Config.show_uid_len], str(i[3]), str(i[2])))
-    return res
+    last = (rank[-1][3], rank[-1][2], rank[-1][0]) if len(rank) != 0 else None
+    return res, last
+
+
+def __leaderboard_stale(db: DB):
+    board = find_leaderboard(db)
+    if board is not None:
+        board.set_stale()
 
 
 def update_user_score(where: str, score: score_t, db: DB) -> int:
     if len(where) == 0 or score < 0:
         return -1
 
-    cur = db.update(table="user", kw={"score": score}, where=where)
+    cur = db.update(table="user", kw={"score": int(score)}, where=where)
     if cur is None:
         return -1
+    __leaderboard_stale(db)
     return cur.rowcount
 
 
@@ -41,49 +93,81 @@ def update_user_reputation(where: str, reputation: score_t, db: DB) -> int:
     if len(where) == 0 or reputation <= 1 or reputation >= 1000:
         return -1
 
-    cur = db.update(table="user", kw={"Reputation": reputation}, where=where)
+    cur = db.update(table="user", kw={"Reputation": int(reputation)}, where=where)
     if cur is None:
         return -1
+    __leaderboard_stale(db)
     return cur.rowcount
 
 
-def set_where_(ex: Optional[str], column: str):
+def set_where_(ex: Optional[str], column: str) -> Tuple[str, tuple]:
+    """
+    生成搜索条件
+    :param ex: 搜索值 (支持 `LIKE xxx`, `REGEXP xxx`)
+    :param column: 列
+    :return: 条件模板, 参数
+    """
     if ex is None:
-        return ""
+        return "", tuple()
 
     if ex.startswith("LIKE ") or ex.startswith("REGEXP "):
-        where = f"{column} {ex} AND "
-    else:
-        where = f"{column}='{ex}' AND "
-    return where
+        op, pattern = ex.split(" ", 1)
+        pattern = pattern.strip()
+        if len(pattern) >= 2 and pattern[0] == pattern[-1] and pattern[0] in ("'", '"'):
+            pattern = pattern[1:-1]  # 去除引号
+        return f"{column} {op} %s AND ", (pattern,)
+    return f"{column}=%s AND ", (ex,)
 
 
 def search_user_by_fields(columns, uid: uid_t, name: uname_t, phone: phone_t, db: DB):
     where = ""
-    where += set_where_(uid, "UserID")
-    where += set_where_(name, "Name")
-    where += set_where_(phone, "Phone")
+    params = tuple()
+    for ex, column in ((uid, "UserID"), (name, "Name"), (phone, "Phone")):
+        w, p = set_where_(ex, column)
+        where += w
+        params += p
 
     if len(where) != 0:
-        where = where[0:-4]  # 去除末尾的AND
+        where = where[0:-5]  # 去除末尾的AND
 
-    return search_from_user_view(columns, where, db)
+    return search_from_user_view(columns, where, db, params)
 
 
-def search_from_user_view(columns, where: str, db: DB):
+def search_from_user_view(columns, where: str, db: DB, params: Optional[tuple] = None):
     cur = db.search(columns=columns,
                     table="user",
-                    where=where)
+                    where=where,
+                    params=params)
     if cur is None:
         return None
     return cur.fetchall()
 
 
 def find_user_by_id(uid: uid_t, db: DB) -> Optional[User]:
-    cur = db.search(columns=["UserID", "Name", "IsManager", "Score", "Reputation", "UserLock"],
+    """
+    获取用户并加锁
+    用户锁为带有效期的租约: 一条 UPDATE 语句在用户未被锁定或租约已过期时获取租约, 再用一条查询读取用户信息
+    程序异常退出时不会永久锁定用户, 租约过期后其他程序即可获取
+    :param uid: 用户ID
+    :param db: 数据库
+    :return: 用户, 用户不存在或被其他程序锁定时返回 None
+    """
+    now = time.time()
+    cur = db.update(table="user",
+                    kw={"LockOwner": "%s", "LockExpire": "from_unixtime(%s)"},
+                    where=["UserID = %s", "LockOwner IS NULL OR LockExpire < from_unixtime(%s)"],
+                    params=(lease_owner, now + Config.user_lease_time, uid, now))
+    if cur is None or cur.rowcount == 0:
+        return None
+
+    cur = db.search(columns=["UserID", "Name", "IsManager", "Score", "Reputation",
+                             "(SELECT COALESCE(SUM(Count), 0) FROM garbage_user_daily "
+                             "WHERE garbage_user_daily.UserID = user.UserID AND Day BETWEEN %s AND %s)"],
                     table="user",
-                    where=f"UserID = '{uid}'")
+                    where="UserID = %s",
+                    params=(*user_week_range(), uid))  # 一周内投放的垃圾袋从用户汇总表读取
     if cur is None or cur.rowcount == 0:
+        release_user_lease(uid, db)
         return None
     assert cur.rowcount == 1
     res = cur.fetchone()
@@ -92,33 +176,33 @@ def find_user_by_id(uid: uid_t, db: DB) -> Optional[User]:
     uid: uid_t = res[0]
     name: uname_t = str(res[1])
     manager: bool = res[2] == DBBit.BIT_1
-    lock: bool = res[5] == DBBit.BIT_1
-
-    if lock:
-        db.commit()
-        return None
-    else:
-        cur = db.update(table="user",
-                        kw={"UserLock": "1"},
-                        where=f"UserID = '{uid}'")
-        if cur is None or cur.rowcount == 0:
-            db.commit()
-            return None
 
     def user_destruct(*args, **kwargs):
-        db.update(table="user",
-                  kw={"UserLock": "0"},
-                  where=f"UserID = '{uid}'")
+        release_user_lease(uid, db)
 
     if manager:
         return ManagerUser(name, uid, user_destruct)
     else:
         score: score_t = res[3]
         reputation: score_t = res[4]
-        rubbish: count_t = garbage.count_garbage_by_uid(uid, db)
+        rubbish: count_t = int(res[5])
         return NormalUser(name, uid, reputation, rubbish, score, user_destruct)  # rubbish 实际计算
 
 
+def release_user_lease(uid: uid_t, db: DB) -> bool:
+    """
+    释放本程序持有的用户锁
+    :param uid: 用户ID
+    :param db: 数据库
+    :return:
+    """
+    cur = db.update(table="user",
+                    kw={"LockOwner": "NULL", "LockExpire": "NULL"},
+                    where=["UserID = %s", "LockOwner = %s"],
+                    params=(uid, lease_owner))
+    return cur is not None
+
+
 def find_user_by_name(name: uname_t, passwd: passwd_t, db: DB) -> Optional[User]:
     uid = create_uid(name, passwd)
     return find_user_by_id(uid, db)
@@ -127,7 +211,8 @@ def find_user_by_name(name: uname_t, passwd: passwd_t, db: DB) -> Optional[User]
 def is_user_exists(uid: uid_t, db: DB) -> bool:
     cur = db.search(columns=["UserID"],
                     table="user",
-                    where=f"UserID = '{uid}'")
+                    where="UserID = %s",
+                    params=(uid,))
     if cur is None or cur.rowcount == 0:
         return False
     assert cur.rowcount == 1
@@ -141,19 +226,34 @@ def update_user(user: User, db: DB, not_commit: bool = False) -> bool:
     uid = user.get_uid()
     info: Dict[str, str] = user.get_info()
     is_manager = info['manager']
+    expire = time.time() + Config.user_lease_time
     if is_manager == '1':
         cur = db.update(table="user",
-                        kw={"IsManager": is_manager},
-                        where=f"UserID = '{uid}'", not_commit=not_commit)
+                        kw={"IsManager": "%s",
+                            "LockExpire": lease_expire},
+                        where="UserID = %s", not_commit=not_commit,
+                        params=(int(is_manager), lease_owner, expire, uid))
     else:
         score = info['score']
         reputation = info['reputation']
         cur = db.update(table="user",
-                        kw={"IsManager": is_manager,
-                            "Score": f"{score}",
-                            "Reputation": f"{reputation}"},
-                        where=f"UserID = '{uid}'", not_commit=not_commit)
-    return cur is not None
+                        kw={"IsManager": "%s",
+                            "Score": "%s",
+                            "Reputation": "%s",
+                            "LockExpire": lease_expire},
+                        where="UserID = %s", not_commit=not_commit,
+                        params=(int(is_manager), int(score), int(reputation), lease_owner, expire, uid))
+    if cur is None:
+        return False
+
+    board = find_leaderboard(db)  # 事务提交后再增量更新内存排行榜
+    if board is not None:
+        if is_manager == '1':
+            db.after_commit(lambda: board.remove(uid), not_commit)
+        else:
+            score, reputation = int(info['score']), int(info['reputation'])
+            db.after_commit(lambda: board.update(uid, score=score, reputation=reputation), not_commit)
+    return True
 
 
 def create_new_user(name: Optional[uname_t], passwd: Optional[passwd_t], phone: phone_t,
@@ -170,26 +270,30 @@ def create_new_user(name: Optional[uname_t], passwd: Optional[passwd_t], phone:
     uid = create_uid(name, passwd)
     if is_user_exists(uid, db):
         return None
-    is_manager = '1' if manager else '0'
+    is_manager = 1 if manager else 0
     cur = db.insert(table="user",
-                    columns=["UserID", "Name", "IsManager", "Phone", "Score", "Reputation", "CreateTime", "UserLock"],
-                    values=f"'{uid}', '{name}', {is_manager}, '{phone}', {Config.default_score}, "
-                           f"{Config.default_reputation}, {mysql_time()}, 1")
+                    columns=["UserID", "Name", "IsManager", "Phone", "Score", "Reputation", "CreateTime",
+                             "LockOwner", "LockExpire"],
+                    values="%s, %s, %s, %s, %s, %s, from_unixtime(%s), %s, from_unixtime(%s)",
+                    params=(uid, name, is_manager, phone, Config.default_score,
+                            Config.default_reputation, time.time(), lease_owner, time.time() + Config.user_lease_time))
     if cur is None:
         return None
 
     def user_destruct(*args, **kwargs):
-        db.update(table="user",
-                  kw={"UserLock": "0"},
-                  where=f"UserID = '{uid}'")
+        release_user_lease(uid, db)
 
     if is_manager:
         return ManagerUser(name, uid, user_destruct)
+
+    board = find_leaderboard(db)
+    if board is not None:
+        board.update(uid, name, Config.default_score, Config.default_reputation)
     return NormalUser(name, uid, Config.default_reputation, 0, Config.default_score, user_destruct)
 
 
 def get_user_phone(uid: uid_t, db: DB) -> Optional[str]:
-    cur = db.search(columns=["Phone"], table="user", where=f"UserID = '{uid}'")
+    cur = db.search(columns=["Phone"], table="user", where="UserID = %s", params=(uid,))
     if cur is None or cur.rowcount == 0:
         return None
     assert cur.rowcount == 1
@@ -197,14 +301,17 @@ def get_user_phone(uid: uid_t, db: DB) -> Optional[str]:
 
 
 def del_user(uid: uid_t, db: DB) -> bool:
-    cur = db.search(columns=["GarbageID"], table="garbage_time", where=f"UserID = '{uid}'")  # 确保没有引用
+    cur = db.search(columns=["GarbageID"], table="garbage_time", where="UserID = %s", params=(uid,))  # 确保没有引用
     if cur is None or cur.rowcount == 0:
         return False
 
-    cur = db.delete(table="user", where=f"UserID = '{uid}'")
+    cur = db.delete(table="user", where="UserID = %s", params=(uid,))
     if cur is None or cur.rowcount == 0:
         return False
     assert cur.rowcount == 1
+    board = find_leaderboard(db)
+    if board is not None:
+        board.remove(uid)
     return True
 
 
@@ -222,67 +329,195 @@ def del_user_from_where(where: str, db: DB) -> int:
     cur = db.delete(table="user", where=where)
     if cur is None:
         return -1
+    __leaderboard_stale(db)
     return cur.rowcount
 
 
-def creat_user_from_csv(path, db: DB) -> List[User]:
-    res = []
-    with open(path, "r") as f:
-        reader = csv.reader(f)
-        first = True
-        name_index = 0
-        passwd_index = 0
-        phone_index = 0
-        manager_index = 0
+csv_progress_t = Optional[Callable[[int, float], None]]  # 导入进度回调: (已处理行数, 已读取的文件比例)
+csv_result_t = Tuple[List[uid_t], List[Tuple[int, str]]]  # 导入结果: (新用户ID, [(行号, 错误信息), ...])
+
+
+def __read_csv(path, columns: List[str], chunk_size: int):
+    """
+    流式读取CSV文件, 每次返回一块
+    :param path: 文件路径
+    :param columns: 必须的列
+    :param chunk_size: 每块的行数
+    :return: 迭代器 [(行号, [列值, ...]), ...], 文件读取比例; 缺少列时不返回任何块
+    """
+    size = max(os.path.getsize(path), 1)
+    read = 0
+
+    def lines(f):
+        nonlocal read
+        for line in f:
+            read += len(line)
+            yield line.decode('utf-8-sig')
+
+    with open(path, "rb") as f:
+        reader = csv.reader(lines(f))
+        try:
+            header = next(reader)
+            index = [header.index(c) for c in columns]
+        except (StopIteration, ValueError, TypeError):
+            return
+
+        chunk = []
         for item in reader:
-            if first:
-                try:
-                    name_index = item.index('Name')
-                    passwd_index = item.index('Passwd')
-                    phone_index = item.index('Phone')
-                    manager_index = item.index('Manager')
-                except (ValueError, TypeError):
-                    return []
-                first = False
-                continue
-            name = item[name_index]
-            passwd = item[passwd_index]
-            phone = item[phone_index]
-            if item[manager_index].upper() == "TRUE":
-                is_manager = True
-            elif item[manager_index].upper() == "FALSE":
-                is_manager = False
-            else:
+            if len(item) == 0:
                 continue
-            user = create_new_user(name, passwd, phone, is_manager, db)
-            if user is not None:
-                res.append(user)
+            try:
+                chunk.append((reader.line_num, [item[i] for i in index]))
+            except IndexError:
+                chunk.append((reader.line_num, None))  # 列数不足
+            if len(chunk) >= chunk_size:
+                yield chunk, read / size
+                chunk = []
+        if len(chunk) != 0:
+            yield chunk, read / size
+
+
+def __search_exists_uid(uid: List[uid_t], db: DB) -> Optional[Set[uid_t]]:
+    """
+    一次查询找出已经存在的用户 (参数个数超过数据库的限制时分为多次查询)
+    :param uid: 用户ID
+    :param db: 数据库
+    :return: 已存在的用户ID
+    """
+    res = set()
+    size = db.max_variable or max(len(uid), 1)
+    for i in range(0, len(uid), size):
+        chunk = uid[i: i + size]
+        cur = db.search(columns=["UserID"], table="user",
+                        where=f"UserID IN ({', '.join(['%s'] * len(chunk))})",
+                        params=tuple(chunk))
+        if cur is None:
+            return None
+        res.update(row[0] for row in cur.fetchall())
     return res
 
 
-def creat_auto_user_from_csv(path, db: DB) -> List[User]:
-    res = []
-    with open(path, "r") as f:
-        reader = csv.reader(f)
-        first = True
-        phone_index = 0
-        for item in reader:
-            if first:
-                try:
-                    phone_index = item.index('Phone')
-                except (ValueError, TypeError):
-                    return []
-                first = False
+def __import_user(path, columns: List[str], parse: Callable[[List[str]], Tuple[uname_t, passwd_t, phone_t, bool]],
+                  db: DB, progress: csv_progress_t) -> csv_result_t:
+    """
+    从CSV批量导入用户
+    每块只执行一次查重查询和一次批量插入 (多行 INSERT), 不需要逐行查询和提交
+    :param path: 文件路径
+    :param columns: 必须的列
+    :param parse: 把一行的列值转换为 (用户名, 密码, 手机号, 是否管理员), 出错时抛出 ValueError
+    :param db: 数据库
+    :param progress: 进度回调
+    :return: 新用户ID, 出错的行
+    """
+    uid_list: List[uid_t] = []
+    error: List[Tuple[int, str]] = []
+    seen: Set[uid_t] = set()  # 本次导入中已经出现的用户
+    done = 0
+    board = find_leaderboard(db)
+
+    for chunk, read in __read_csv(path, columns, Config.csv_import_chunk):
+        rows = {}
+        for line, item in chunk:
+            try:
+                if item is None:
+                    raise ValueError("缺少列")
+                name, passwd, phone, manager = parse(item)
+                if len(phone) != 11:
+                    raise ValueError("手机号错误")
+            except ValueError as e:
+                error.append((line, str(e)))
                 continue
-            phone = item[phone_index]
-            user = create_new_user(None, None, phone, False, db)
-            if user is not None:
-                res.append(user)
-    return res
+            uid = create_uid(name, passwd)
+            if uid in seen:
+                error.append((line, "用户重复"))
+                continue
+            seen.add(uid)
+            rows[uid] = (line, name, phone, manager)
+
+        exists = __search_exists_uid(list(rows.keys()), db)
+        if exists is None:
+            error += [(i[0], "数据库错误") for i in rows.values()]
+            rows = {}
+        for uid in exists or ():
+            error.append((rows.pop(uid)[0], "用户已存在"))
+
+        now = time.time()
+        if len(rows) != 0:
+            res = db.insert_many(table="user",
+                                 columns=["UserID", "Name", "IsManager", "Phone", "Score", "Reputation", "CreateTime"],
+                                 values="%s, %s, %s, %s, %s, %s, from_unixtime(%s)",
+                                 rows=[(uid, name, 1 if manager else 0, phone, Config.default_score,
+                                        Config.default_reputation, now)
+                                       for uid, (_, name, phone, manager) in rows.items()])
+            if res is None:
+                error += [(i[0], "数据库错误") for i in rows.values()]
+            else:
+                uid_list += rows.keys()
+                if board is not None:
+                    for uid, (_, name, _, manager) in rows.items():
+                        if not manager:
+                            board.update(uid, name, Config.default_score, Config.default_reputation)
+
+        done += len(chunk)
+        if progress is not None:
+            progress(done, read)
+
+    error.sort()
+    return uid_list, error
+
+
+def __parse_user_row(item: List[str]) -> Tuple[uname_t, passwd_t, phone_t, bool]:
+    name, passwd, phone, manager = item
+    if manager.upper() == "TRUE":
+        return name, passwd, phone, True
+    elif manager.upper() == "FALSE":
+        return name, passwd, phone, False
+    raise ValueError("Manager 列错误")
+
+
+def __parse_auto_user_row(item: List[str]) -> Tuple[uname_t, passwd_t, phone_t, bool]:
+    phone = item[0]
+    return f'User-{phone[-6:]}', randomPassword(), phone, False
+
+
+def creat_user_from_csv(path, db: DB, progress: csv_progress_t = None) -> csv_result_t:
+    """
+    从CSV创建用户 (列: Name, Passwd, Phone, Manager)
+    :param path: 文件路径
+    :param db: 数据库
+    :param progress: 进度回调
+    :return: 新用户ID, 出错的行
+    """
+    return __import_user(path, ['Name', 'Passwd', 'Phone', 'Manager'], __parse_user_row, db, progress)
+
+
+def creat_auto_user_from_csv(path, db: DB, progress: csv_progress_t = None) -> csv_result_t:
+    """
+    从CSV创建随机密码的用户 (列: Phone)
+    :param path: 文件路径
+    :param db: 数据库
+    :param progress: 进度回调
+    :return: 新用户ID, 出错的行
+    """
+    return __import_user(path, ['Phone'], __parse_auto_user_row, db, progress)
 
 
 def count_all_user(db: DB):
-    cur = db.search(columns=['count(UserID)'], table='user')
+    cur = db.search(columns=['count(UserID)'], table='user', cache=True)
+    if cur is None:
+        return 0
+    assert cur.rowcount == 1
+    return int(cur.fetchone()[0])
+
+
+def count_rank_user(db: DB) -> int:
+    """
+    :return: 排行榜中的用户数 (不包括管理员)
+    """
+    board = get_leaderboard(db)
+    if board is not None:
+        return board.count()
+    cur = db.search(columns=['count(UserID)'], table='user', where='IsManager=0', cache=True)
     if cur is None:
         return 0
     assert cur.rowcount == 1
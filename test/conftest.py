@@ -0,0 +1,18 @@
+"""
+测试配置
+不解析命令行参数, 使用 SQLite 数据库, 不写入慢查询日志
+需要在导入 sql 包之前修改 Config (部分默认参数在导入时确定)
+"""
+
+import os
+import sys
+
+os.environ.setdefault("HGSSystem_NA", "True")
+os.environ.setdefault("HGSSystem_Program", "manager")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from conf import Config
+
+Config.database = "SQLite"
+Config.slow_query_log = None
+Config.query_cache = False
@@ -0,0 +1,65 @@
+"""
+逐页写入的 PDF
+交叉引用表中每个对象的位置和 startxref 应指向文件中对应的内容
+"""
+
+import os
+import re
+import zlib
+
+import pytest
+
+label = pytest.importorskip("equipment.label", reason="需要 PIL 和 qrcode")
+
+
+@pytest.mark.parametrize("page_count", [0, 1, 3])
+def test_pdf_xref(tmp_path, page_count):
+    path = str(tmp_path / "label.pdf")
+    writer = label.PdfSheetWriter(path, dpi=300)
+    for i in range(page_count):
+        width, height = 20 + i, 30
+        writer.add_page(width, height, zlib.compress(bytes([i * 40]) * (width * height * 3)))
+    writer.close()
+
+    with open(path, "rb") as f:
+        pdf = f.read()
+    assert pdf.startswith(b"%PDF-1.4\n")
+    assert pdf.endswith(b"%%EOF\n")
+
+    startxref = int(re.search(rb"startxref\n(\d+)\n", pdf).group(1))
+    assert pdf[startxref:].startswith(b"xref\n")
+    size = int(re.search(rb"/Size (\d+)", pdf).group(1))
+    start, count = map(int, re.match(rb"xref\n(\d+) (\d+)\n", pdf[startxref:]).groups())
+    assert (start, count) == (0, size)
+    assert size == page_count * 3 + 3  # 每页 3 个对象, 另有页面树、目录和 0 号对象
+
+    table = pdf[startxref:].split(b"\n", 2)[2]
+    for obj_id in range(count):
+        entry = table[obj_id * 20:(obj_id + 1) * 20]  # 每项固定 20 字节
+        assert len(entry) == 20 and entry.endswith(b" \n")
+        if obj_id == 0:
+            assert entry == b"0000000000 65535 f \n"
+            continue
+        offset = int(entry[:10])
+        assert entry[10:] == b" 00000 n \n"
+        assert pdf[offset:].startswith(b"%d 0 obj\n" % obj_id)
+
+    assert re.search(rb"/Type /Pages /Kids \[[^]]*\] /Count (\d+)", pdf).group(1) == b"%d" % page_count
+    assert len(re.findall(rb"/Type /Page ", pdf)) == page_count
+
+
+def test_label_name(tmp_path):
+    """ png 返回文件的完整路径, 其余返回标签在输出文件中的名称 """
+    data = ("data", "title", "sub", True, "info", (0, 0, 0), "dir/label.png")
+    path = str(tmp_path / "label")
+    assert label.get_label_name(data, path, "png") == os.path.join(path, "dir/label.png")
+    for output in ("zip", "pdf", "tiff"):
+        assert label.get_label_name(data, path + "." + output, output) == "dir/label.png"
+
+
+@pytest.mark.parametrize("output", ["pdf", "tiff"])
+def test_empty_sheet(tmp_path, output):
+    """ 没有标签时不生成文件 """
+    path = tmp_path / ("label." + output)
+    assert label.make_labels([], str(path), output) == []
+    assert not path.exists()
@@ -0,0 +1,96 @@
+"""
+内存排行榜
+分页、名次和增量更新的结果应与按 (Reputation, Score, UserID) 排序 user 表的结果一致
+"""
+
+import pytest
+
+from sql.leaderboard import Leaderboard
+
+
+class FakeCursor:
+    def __init__(self, rows):
+        self._rows = rows
+
+    def fetchall(self):
+        return list(self._rows)
+
+
+class FakeDB:
+    """ 只提供排行榜加载时使用的 search """
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.load_count = 0
+
+    def search(self, columns, table, where):
+        assert table == "user" and where == "IsManager=0"
+        self.load_count += 1
+        return FakeCursor(self.rows)
+
+
+def expect_rows(rows, order_by="DESC"):
+    return sorted(rows, key=lambda i: (i[3], i[2], i[0]), reverse=order_by == "DESC")
+
+
+@pytest.fixture
+def rows():
+    # 部分用户的 Reputation 和 Score 相同, 按 UserID 区分
+    return [(f"u{i:02}", f"name{i}", i % 5, i % 3) for i in range(17)]
+
+
+@pytest.fixture
+def board(rows):
+    return Leaderboard(FakeDB(rows), reload_time=3600)
+
+
+@pytest.mark.parametrize("order_by", ["DESC", "ASC"])
+def test_get_page(board, rows, order_by):
+    expect = expect_rows(rows, order_by)
+    assert board.get_page(5, order_by=order_by) == expect[:5]
+    assert board.get_page(5, 15, order_by=order_by) == expect[15:]
+    assert board.get_page(0, order_by=order_by) == expect
+
+    res = []
+    page = board.get_page(4, order_by=order_by)
+    while len(page) != 0:
+        res += page
+        last = page[-1]
+        page = board.get_page(4, order_by=order_by, after=(last[3], last[2], last[0]))
+    assert res == expect
+
+
+def test_get_rank(board, rows):
+    expect = expect_rows(rows)
+    for i, row in enumerate(expect):
+        assert board.get_rank(row[0]) == i + 1
+    assert board.get_rank("not-exists") is None
+    assert board.count() == len(rows)
+    assert board._db.load_count == 1  # 只加载一次
+
+
+def test_get_neighbors(board, rows):
+    expect = expect_rows(rows)
+    assert board.get_neighbors(expect[0][0], 2) == [(1, expect[0]), (2, expect[1]), (3, expect[2])]
+    assert board.get_neighbors(expect[8][0], 1) == [(8, expect[7]), (9, expect[8]), (10, expect[9])]
+    assert board.get_neighbors("not-exists", 1) is None
+
+
+def test_update_and_remove(board, rows):
+    board.count()
+    board.update("u03", score=100, reputation=100)
+    board.update("u20", "name20", 1, 0)
+    board.remove("u05")
+
+    rows = {row[0]: row for row in rows}
+    rows["u03"] = ("u03", "name3", 100, 100)
+    rows["u20"] = ("u20", "name20", 1, 0)
+    del rows["u05"]
+    assert board.get_page(0) == expect_rows(rows.values())
+    assert board.get_rank("u03") == 1
+    assert board.get_rank("u05") is None
+    assert board._db.load_count == 1
+
+    board.update("u21", score=10)  # 信息不完整时重新加载
+    assert board.count() == 17
+    assert board._db.load_count == 2
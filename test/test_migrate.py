@@ -0,0 +1,18 @@
+"""
+数据库结构迁移
+SQLite 打开时自动迁移到最新版本, 版本落后时 check_schema_version 拒绝启动
+"""
+
+from sql.sqlite_db import SqliteDB
+from sql.migrate import migrations, get_schema_version, check_schema_version
+
+
+def test_schema_version(tmp_path):
+    db = SqliteDB(str(tmp_path / "hgssystem.db"))
+    latest = migrations[-1].version
+    assert get_schema_version(db) == latest
+    assert check_schema_version(db)
+
+    assert db.delete(table="schema_version", where="Version = %s", params=(latest,)) is not None
+    assert get_schema_version(db) == latest - 1
+    assert not check_schema_version(db)
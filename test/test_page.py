@@ -0,0 +1,49 @@
+"""
+键集分页
+keyset_where 生成的条件, 以及网页中传递上一页最后一行的键的 url 参数
+"""
+
+import sqlite3
+
+import pytest
+
+from sql.base_db import keyset_where
+
+
+def test_keyset_where():
+    where, params = keyset_where(["Score", "UserID"], (10, "b"), "DESC")
+    assert where == "(Score < %s) OR (Score = %s AND UserID < %s)"
+    assert params == (10, 10, "b")
+
+    where, params = keyset_where(["a", "b", "c"], (1, 2, 3))
+    assert where == "(a > %s) OR (a = %s AND b > %s) OR (a = %s AND b = %s AND c > %s)"
+    assert params == (1, 1, 2, 1, 2, 3)
+
+
+@pytest.mark.parametrize("order_by", ["ASC", "DESC"])
+def test_keyset_pages(order_by):
+    """ 按页依次读取的结果与一次读取的结果一致 (包括排序列的值相同的行) """
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE t (Score INT, UserID TEXT)")
+    conn.executemany("INSERT INTO t VALUES (?, ?)", [(i % 4, f"u{i:02}") for i in range(23)])
+    order = f"ORDER BY Score {order_by}, UserID {order_by}"
+    expect = conn.execute(f"SELECT Score, UserID FROM t {order}").fetchall()
+
+    res = conn.execute(f"SELECT Score, UserID FROM t {order} LIMIT 5").fetchall()
+    page = res
+    while len(page) != 0:
+        where, params = keyset_where(["Score", "UserID"], page[-1], order_by)
+        page = conn.execute(f"SELECT Score, UserID FROM t WHERE {where.replace('%s', '?')} {order} LIMIT 5",
+                            params).fetchall()
+        res += page
+    assert res == expect
+
+
+def test_cursor():
+    page = pytest.importorskip("tool.page", reason="需要 flask")
+    cursor = page.make_cursor((300, 10, "abc"))
+    assert page.parse_cursor(cursor, [int, int, str]) == (300, 10, "abc")
+    assert page.make_cursor(None) is None
+    assert page.parse_cursor(None, [int]) is None
+    assert page.parse_cursor("1_2", [int, int, str]) is None  # 项数不一致
+    assert page.parse_cursor("a_2", [int, int]) is None  # 类型错误
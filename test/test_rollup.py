@@ -0,0 +1,94 @@
+"""
+垃圾统计汇总表
+投放、检测和管理员修改后增量更新的汇总表应与从 garbage 表重建的结果一致
+"""
+
+import time
+
+import pytest
+
+from sql.sqlite_db import SqliteDB
+from sql.user import create_new_user
+from sql import garbage as sql_garbage
+from sql.rollup import rebuild_garbage_rollup, count_user_garbage, search_garbage_daily
+
+rollup_tables = ("garbage_daily", "garbage_hourly", "garbage_user_daily")
+
+
+def get_rollup(db: SqliteDB) -> dict:
+    return {table: sorted(row for row in db.search(columns=["*"], table=table).fetchall() if row[-1] != 0)
+            for table in rollup_tables}
+
+
+def assert_rollup(db: SqliteDB):
+    increment = get_rollup(db)
+    assert rebuild_garbage_rollup(db)
+    assert get_rollup(db) == increment
+
+
+@pytest.fixture
+def db(tmp_path):
+    return SqliteDB(str(tmp_path / "hgssystem.db"))  # 不关闭数据库, 用户对象析构时需要释放租约
+
+
+@pytest.fixture
+def garbage(db):
+    """ 两个用户投放的 12 个垃圾袋, 前 6 个已检测 """
+    user = [create_new_user(f"user{i}", "123", f"1380000000{i}", False, db) for i in range(2)]
+    checker = create_new_user("checker", "123", "13800000009", True, db)
+    garbage = sql_garbage.create_new_garbage_batch(12, db)
+    now = time.time()
+    for i, gb in enumerate(garbage):
+        gb.config_use(i % 4 + 1, now - i * 40000, user[i % 2].get_uid(), f"loc{i % 3}")
+        assert sql_garbage.update_garbage(gb, db)
+    for gb in garbage[:6]:
+        gb.config_check(int(gb.get_gid()) % 2 == 1, checker.get_uid())
+        assert sql_garbage.update_garbage(gb, db)
+    return user, garbage
+
+
+def test_throw_and_check(db, garbage):
+    user, _ = garbage
+    assert_rollup(db)
+    assert count_user_garbage(user[0].get_uid(), db, time_limit=False) == 6
+    count = search_garbage_daily(["count"], 30, db)
+    assert count == [(12,)]
+
+
+def test_update(db, garbage):
+    assert sql_garbage.update_garbage_type("GarbageID <= 3", 2, db) == 3
+    assert_rollup(db)
+    assert sql_garbage.update_garbage_check("Location = 'loc1'", False, db) == 4
+    assert_rollup(db)
+
+
+def test_delete(db, garbage):
+    _, garbage = garbage
+    assert sql_garbage.del_garbage(garbage[0].get_gid(), db)
+    assert_rollup(db)
+    assert sql_garbage.del_garbage_has_check(garbage[1].get_gid(), db)
+    assert not sql_garbage.del_garbage_has_check(garbage[10].get_gid(), db)  # 未检测
+    assert sql_garbage.del_garbage_wait_check(garbage[10].get_gid(), db)
+    assert_rollup(db)
+    assert sql_garbage.del_garbage_where_wait_check("Location = 'loc2'", db) == 2
+    assert sql_garbage.del_garbage_where_has_check("GarbageType = 4", db) == 1
+    assert_rollup(db)
+
+
+def test_delete_all(db, garbage):
+    assert sql_garbage.del_all_garbage(db) == 12
+    assert get_rollup(db) == {table: [] for table in rollup_tables}
+
+
+def test_delete_not_use(db, garbage):
+    """ 未使用的垃圾袋不计入汇总表, 删除后汇总表不变 """
+    new = sql_garbage.create_new_garbage_batch(4, db)
+    increment = get_rollup(db)
+    assert sql_garbage.del_garbage_not_use(new[0].get_gid(), db)
+    assert not sql_garbage.del_garbage_not_use(new[0].get_gid(), db)  # 已删除
+    assert not sql_garbage.del_garbage_not_use(garbage[1][0].get_gid(), db)  # 已使用
+    assert sql_garbage.del_garbage_where_scan_not_use("1", db) == 3
+    assert sql_garbage.del_garbage_where_not_use("1", db) == 3
+    assert sql_garbage.find_not_use_garbage(new[1].get_gid(), db) is None
+    assert sql_garbage.del_all_garbage_scan(db) == 12
+    assert get_rollup(db) == increment
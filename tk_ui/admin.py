@@ -7,11 +7,11 @@ from _tkinter import TclError
 from conf import Config
 from core.garbage import GarbageBag
 from core.user import User
-from equipment.scan_garbage import write_gid_qr, write_all_gid_qr
+from equipment.scan_garbage import write_gid_qr, write_garbage_qr_batch, write_all_gid_qr
 from equipment.scan_user import write_uid_qr, write_all_uid_qr
 from .event import TkEventMain
 from sql.db import DB, search_from_garbage_checker_user
-from sql.garbage import (create_new_garbage, search_garbage_by_fields, search_from_garbage_view,
+from sql.garbage import (create_new_garbage_batch, search_garbage_by_fields, search_from_garbage_view,
                          del_garbage, del_garbage_not_use, del_garbage_wait_check, del_garbage_has_check,
                          del_garbage_where_scan_not_use, del_garbage_where_scan_wait_check,
                          del_garbage_where_scan_has_check,
@@ -42,38 +42,36 @@ class AdminStationBase(TkEventMain, metaclass=abc.ABCMeta):
     def get_db(self):
         return self._db
 
-    def create_garbage(self, path: Optional[str], num: int = 1) -> "List[tuple[str, Optional[GarbageBag]]]":
-        re = []
-        for _ in range(num):
-            gar = create_new_garbage(self._db)
-            assert gar
-            if path is not None:
-                res = write_gid_qr(gar.get_gid(), path, self._db)
-                re.append(res)
-            else:
-                re.append(("", gar))
-        return re
+    def create_garbage(self, path: Optional[str], num: int = 1, progress=None,
+                       output: str = "png") -> "Optional[List[tuple[str, Optional[GarbageBag]]]]":
+        gars = create_new_garbage_batch(num, self._db)
+        if gars is None:
+            return None
+
+        if path is not None:
+            return write_garbage_qr_batch(gars, path, progress, output)
+        return [("", gar) for gar in gars]
 
     def export_garbage_by_gid(self, path: Optional[str], gid: gid_t) -> Tuple[str, Optional[GarbageBag]]:
         return write_gid_qr(gid, path, self._db)
 
-    def export_garbage(self, path: Optional[str], where: str) -> List[Tuple[str]]:
-        return write_all_gid_qr(path, self._db, where=where)
+    def export_garbage(self, path: Optional[str], where: str, progress=None, output: str = "png") -> List[Tuple[str]]:
+        return write_all_gid_qr(path, self._db, where=where, progress=progress, output=output)
 
     def create_user(self, name: uname_t, passwd: passwd_t, phone: str, manager: bool) -> Optional[User]:
         return create_new_user(name, passwd, phone, manager, self._db)
 
-    def create_user_from_csv(self, path) -> List[User]:
-        return creat_user_from_csv(path, self._db)
+    def create_user_from_csv(self, path, progress=None) -> Tuple[List[uid_t], List[Tuple[int, str]]]:
+        return creat_user_from_csv(path, self._db, progress)
 
-    def create_auto_user_from_csv(self, path) -> List[User]:
-        return creat_auto_user_from_csv(path, self._db)
+    def create_auto_user_from_csv(self, path, progress=None) -> Tuple[List[uid_t], List[Tuple[int, str]]]:
+        return creat_auto_user_from_csv(path, self._db, progress)
 
     def export_user_by_uid(self, path: str, uid: uid_t) -> Tuple[str, Optional[User]]:
         return write_uid_qr(uid, path, self._db)
 
-    def export_user(self, path: str, where) -> List[str]:
-        return write_all_uid_qr(path, self._db, where=where)
+    def export_user(self, path: str, where, progress=None, output: str = "png") -> List[str]:
+        return write_all_uid_qr(path, self._db, where=where, progress=progress, output=output)
 
     def del_garbage_not_use(self, gid: gid_t) -> bool:
         return del_garbage_not_use(gid, self._db)
@@ -135,6 +133,12 @@ class AdminStationBase(TkEventMain, metaclass=abc.ABCMeta):
     def search_advanced(self, columns, sql):
         return search_from_garbage_checker_user(columns, sql, self._db)
 
+    def get_slow_query(self, n: Optional[int] = None):
+        return self._db.get_query_stats().get_top(n)
+
+    def clear_slow_query(self):
+        self._db.get_query_stats().clear()
+
     def update_user_score(self, score: score_t, where: str) -> int:
         return update_user_score(where, score, self._db)
 
@@ -487,14 +491,22 @@ class AdminStation(AdminStationBase):
     def show_loading(self, _):
         self._is_loading = True
         self.set_all_btn_disable()
+        self._loading_pro['mode'] = 'indeterminate'
         self._loading_pro['value'] = 0
         self._loading_pro.place(relx=0.30, rely=0.035, relwidth=0.48, relheight=0.03)
         self._loading_pro.start(50)
 
+    def show_progress(self, progress: float):
+        if self._loading_pro['mode'] != 'determinate':
+            self._loading_pro.stop()
+            self._loading_pro['mode'] = 'determinate'
+        self._loading_pro['value'] = progress * self._loading_pro['maximum']
+
     def stop_loading(self):
         self._is_loading = False
         self._loading_pro.place_forget()
         self._loading_pro.stop()
+        self._loading_pro['mode'] = 'indeterminate'
         self.set_reset_all_btn()
 
     def __conf_msg(self):
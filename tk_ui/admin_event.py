@@ -5,6 +5,7 @@ from tool.typing import *
 from sql import DBBit
 from sql.db import DB
 from sql.user import find_user_by_name
+from sql.rollup import search_garbage_daily, search_garbage_hourly, search_passing_rate, get_passing_rate
 
 from core.user import User
 from core.garbage import GarbageBag, GarbageType
@@ -24,6 +25,23 @@ class AdminEventBase(TkEventBase):
         return "AdminEvent"
 
 
+class AdminProgressEventBase(AdminEventBase):
+    """ 可以报告进度的任务 """
+
+    def __init__(self, station):
+        super(AdminProgressEventBase, self).__init__(station)
+        self._progress: float = 0
+
+    def set_progress(self, progress: float):
+        self._progress = progress
+
+    def set_count_progress(self, done: int, total: int):
+        self._progress = done / total if total else 1
+
+    def get_progress(self) -> Optional[float]:
+        return self._progress
+
+
 class LoginEvent(AdminEventBase):
     def __init__(self, station):
         super().__init__(station)
@@ -75,20 +93,23 @@ class CreateUserEvent(AdminEventBase):
             self.station.show_msg("创建用户成功", f"成功创建 {name} 新用户")
 
 
-class CreateGarbageEvent(AdminEventBase):
-    def func(self, path, count):
-        return self.station.create_garbage(path, count)
+class CreateGarbageEvent(AdminProgressEventBase):
+    def func(self, path, count, output):
+        return self.station.create_garbage(path, count, self.set_count_progress, output)
 
     def __init__(self, station):
         super(CreateGarbageEvent, self).__init__(station)
         self._name = None
 
-    def start(self, path, count):
-        self.thread = TkThreading(self.func, path, count)
+    def start(self, path, count, output="png"):
+        self.thread = TkThreading(self.func, path, count, output)
         return self
 
     def done_after_event(self):
-        res: list[tuple[str, Optional[GarbageBag]]] = self.thread.wait_event()
+        res: Optional[list[tuple[str, Optional[GarbageBag]]]] = self.thread.wait_event()
+        if res is None:
+            self.station.show_warning("创建垃圾袋", f"创建垃圾袋失败")
+            return
         self.station.show_msg("创建垃圾袋", f"成功创建{len(res)}个垃圾袋")
 
 
@@ -112,16 +133,16 @@ class ExportGarbageByIDEvent(AdminEventBase):
             self.station.show_msg("导出成功", f"成功导出垃圾袋二维码")
 
 
-class ExportGarbageAdvancedEvent(AdminEventBase):
-    def func(self, path, where):
-        return self.station.export_garbage(path, where)
+class ExportGarbageAdvancedEvent(AdminProgressEventBase):
+    def func(self, path, where, output):
+        return self.station.export_garbage(path, where, self.set_count_progress, output)
 
     def __init__(self, station):
         super(ExportGarbageAdvancedEvent, self).__init__(station)
         self._name = None
 
-    def start(self, path, where):
-        self.thread = TkThreading(self.func, path, where)
+    def start(self, path, where, output="png"):
+        self.thread = TkThreading(self.func, path, where, output)
         return self
 
     def done_after_event(self):
@@ -149,17 +170,17 @@ class ExportUserByIDEvent(AdminEventBase):
             self.station.show_msg("导出成功", f"成功导出用户二维码")
 
 
-class ExportUserAdvancedEvent(AdminEventBase):
-    def func(self, path, where):
-        res = self.station.export_user(path, where)
+class ExportUserAdvancedEvent(AdminProgressEventBase):
+    def func(self, path, where, output):
+        res = self.station.export_user(path, where, self.set_count_progress, output)
         return res
 
     def __init__(self, station):
         super(ExportUserAdvancedEvent, self).__init__(station)
         self._name = None
 
-    def start(self, path, where):
-        self.thread = TkThreading(self.func, path, where)
+    def start(self, path, where, output="png"):
+        self.thread = TkThreading(self.func, path, where, output)
         return self
 
     def done_after_event(self):
@@ -167,38 +188,39 @@ class ExportUserAdvancedEvent(AdminEventBase):
         self.station.show_msg("导出完成", f"导出{len(res)}个用户二维码")
 
 
-class CreateUserFromCSVEvent(AdminEventBase):
+class CreateUserFromCSVEvent(AdminProgressEventBase):
     def func(self, path):
-        return self.station.create_user_from_csv(path)
+        return self.station.create_user_from_csv(path, self.set_read_progress)
 
     def __init__(self, station):
         super(CreateUserFromCSVEvent, self).__init__(station)
         self._name = None
 
+    def set_read_progress(self, _: int, read: float):
+        self.set_progress(read)
+
     def start(self, path):
         self.thread = TkThreading(self.func, path)
         return self
 
     def done_after_event(self):
-        res: list[User] = self.thread.wait_event()
-        self.station.show_msg("创建完成", f"从CSV创建{len(res)}个新用户")
+        res: Optional[Tuple[List[uid_t], List[Tuple[int, str]]]] = self.thread.wait_event()
+        if res is None:
+            self.station.show_warning("创建失败", f"无法从CSV创建用户")
+            return
+        uid, error = res
+        if len(error) == 0:
+            self.station.show_msg("创建完成", f"从CSV创建{len(uid)}个新用户")
+            return
+        info = "\n".join(f"第{line}行: {msg}" for line, msg in error[:3])
+        if len(error) > 3:
+            info += "\n..."
+        self.station.show_msg("创建完成", f"从CSV创建{len(uid)}个新用户\n{len(error)}行出错:\n{info}")
 
 
-class CreateAutoUserFromCSVEvent(AdminEventBase):
+class CreateAutoUserFromCSVEvent(CreateUserFromCSVEvent):
     def func(self, path):
-        return self.station.create_auto_user_from_csv(path)
-
-    def __init__(self, station):
-        super(CreateAutoUserFromCSVEvent, self).__init__(station)
-        self._name = None
-
-    def start(self, path):
-        self.thread = TkThreading(self.func, path)
-        return self
-
-    def done_after_event(self):
-        res: list[User] = self.thread.wait_event()
-        self.station.show_msg("创建完成", f"从CSV创建{len(res)}个新用户")
+        return self.station.create_auto_user_from_csv(path, self.set_read_progress)
 
 
 class DelUserEvent(AdminEventBase):
@@ -425,6 +447,32 @@ class SearchUserAdvancedEvent(AdminEventBase):
             self.program.view.insert('', 'end', values=i)
 
 
+class SlowQueryEvent(AdminEventBase):
+    def func(self):
+        return self.station.get_slow_query()
+
+    def __init__(self, station):
+        super(SlowQueryEvent, self).__init__(station)
+        self.program: Optional[admin_program.SlowQueryProgram] = None
+
+    def start(self, program):
+        self.thread = TkThreading(self.func)
+        self.program = program
+        return self
+
+    def done_after_event(self):
+        res: List[Tuple[str, int, float, float, float, int, float]] = self.thread.wait_event()
+        if res is None or self.program is None:
+            self.station.show_warning("慢查询统计", f"获取语句耗时统计失败")
+            return
+        for i in self.program.view.get_children():
+            self.program.view.delete(i)
+        for sql, count, total, avg, max_, rows, wait in res:
+            self.program.view.insert('', 'end', values=[f"{total:.3f}", count, f"{avg * 1000:.1f}",
+                                                        f"{max_ * 1000:.1f}", rows, f"{wait * 1000:.1f}",
+                                                        " ".join(sql.split())])
+
+
 def set_garbage_search_result(data):
     data = list(data)
     if data[6] is not None:
@@ -613,14 +661,10 @@ class CountTimeEvent(AdminEventBase):
 
     def func(self, column: List, get_name: Callable):
         res = {}
-        cur = self._db.search(columns=["DATE_FORMAT(UseTime,'%H') AS days", "count(GarbageID) AS count", *column],
-                              table="garbage",
-                              group_by=["days", *column],
-                              order_by=[(c, "DESC") for c in column] + [("days", "ASC")],
-                              where="UseTime IS NOT NULL")
-        if cur is None:
+        loc_list = search_garbage_hourly(["hour", "count", *column], self._db,
+                                         order_by=[(c, "DESC") for c in column] + [("hour", "ASC")])
+        if loc_list is None:
             return None
-        loc_list = cur.fetchall()
         loc_type = []
         for i in loc_list:
             name = get_name(i)
@@ -787,27 +831,24 @@ class ScoreReputationDistributedEvent(AdminEventBase):
 
 
 class PassingRateEvent(AdminEventBase):
-    def func(self, columns, where, where_select, order_by):
-        where_str = " AND ".join(["g.CheckResult is not null", *where_select])
-        columns += [f"get_avg(count(GarbageID), "
-                    f"(SELECT count(g.GarbageID) FROM garbage AS g WHERE {where_str})) AS count"]
-        where += ["CheckResult is not null", "CheckResult=1"]
-        cur = self._db.search(columns=columns,
-                              table="garbage",
-                              where=where,
-                              order_by=[(i, "DESC") for i in order_by] + [("count", "DESC")],
-                              group_by=order_by if len(order_by) != 0 else None)
-        if cur is None:
+    """
+    任务: 统计通过率
+    """
+
+    def func(self, columns: List[str], loc: Optional[str]):
+        res = search_passing_rate([*columns, "passing", "not_passing"], self._db, loc=loc,
+                                  order_by=[(i, "DESC") for i in columns])
+        if res is None:
             return None
-        return cur.fetchall()
+        return [(*i[:-2], get_passing_rate(i[-2], i[-1])) for i in res]
 
     def __init__(self, gb_station):
         super().__init__(gb_station)
         self.thread = None
         self._program: Optional[admin_program.StatisticsScoreDistributedProgram] = None
 
-    def start(self, columns, where, where_select, order_by, program):
-        self.thread = TkThreading(self.func, columns, where, where_select, order_by)
+    def start(self, columns: List[str], loc: Optional[str], program):
+        self.thread = TkThreading(self.func, columns, loc)
         self._program = program
         return self
 
@@ -830,18 +871,14 @@ class CountDateEvent(AdminEventBase):
     def func(self, days: int, column: List, get_name: Callable):
         res = {}
         start = time.strftime("%Y-%m-%d", time.localtime(time.time()))
-        cur = self._db.search(columns=["days", "count(GarbageID) AS count", *column],
-                              table=f"garbage_{days}d",
-                              group_by=["days", *column],
-                              order_by=[(c, "DESC") for c in column] + [("days", "ASC")],
-                              where="UseTime IS NOT NULL")
-        if cur is None:
+        loc_list = search_garbage_daily(["days", "count", *column], days, self._db,
+                                        order_by=[(c, "DESC") for c in column] + [("days", "ASC")])
+        if loc_list is None:
             return None
         end = time.strftime("%Y-%m-%d", time.localtime(time.time()))
         if end != start:  # 时间校验, 确保调用前后时间一致
             return None
 
-        loc_list = cur.fetchall()
         loc_type = []
         for i in loc_list:
             name = get_name(i)
@@ -211,8 +211,8 @@ class UpdateMenu(AdminMenu):
 class StatisticsMenu(AdminMenu):
     def __init__(self, station, win, color):
         super().__init__(station, win, color, "数据分析")
-        self.btn: List[tk.Button] = [tk.Button(self.frame) for _ in range(4)]
-        self.btn_name = ["时段分析", "日期分析", "积分信用分析", "通过率"]
+        self.btn: List[tk.Button] = [tk.Button(self.frame) for _ in range(5)]
+        self.btn_name = ["时段分析", "日期分析", "积分信用分析", "通过率", "慢查询统计"]
 
     def conf_gui(self, color: str, n: int = 1):
         super().conf_gui(color, n)
@@ -220,6 +220,7 @@ class StatisticsMenu(AdminMenu):
         self.btn[1]['command'] = self.statistics_date_command
         self.btn[2]['command'] = self.statistics_user_command
         self.btn[3]['command'] = self.statistics_pass_command
+        self.btn[4]['command'] = self.slow_query_command
 
     def statistics_time_command(self):
         self.station.to_menu("时段分析")
@@ -233,6 +234,9 @@ class StatisticsMenu(AdminMenu):
     def statistics_pass_command(self):
         self.station.to_menu("通过率")
 
+    def slow_query_command(self):
+        self.station.to_program("慢查询统计")
+
 
 class StatisticsTimeMenu(AdminMenu):
     def __init__(self, station, win, color):
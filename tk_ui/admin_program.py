@@ -25,6 +25,18 @@ from sql.user import find_user_by_name
 from core.garbage import GarbageType
 
 
+label_output = [("目录", "png", None), ("PDF", "pdf", ".pdf"),
+                ("TIFF", "tiff", ".tiff"), ("ZIP", "zip", ".zip")]  # 二维码导出方式: 名字, 输出方式, 文件后缀
+
+
+def ask_label_output_path(output: int) -> str:
+    """ 选择二维码导出位置 (导出到目录时选择目录, 否则选择文件) """
+    name, _, suffix = label_output[output]
+    if suffix is None:
+        return askdirectory(title='选择二维码导出位置')
+    return asksaveasfilename(title='选择二维码导出位置', filetypes=[(name, suffix)], defaultextension=suffix)
+
+
 class AdminProgram(metaclass=abc.ABCMeta):
     def __init__(self, station: "admin.AdminStation", win: Union[tk.Frame, tk.Toplevel, tk.Tk], color: str, title: str):
         self.station = station
@@ -328,6 +340,10 @@ class CreateGarbageProgram(AdminProgram):
         self.create_btn: tk.Button = tk.Button(self.frame)
         self.file_btn: tk.Button = tk.Button(self.frame)
 
+        self.output_var: tk.Variable = tk.IntVar()
+        self.output_var.set(0)
+        self.output_radio: List[tk.Radiobutton] = [tk.Radiobutton(self.frame) for _ in range(len(label_output))]
+
         self.__conf_font()
 
     def __conf_font(self, n: int = Config.tk_zoom):
@@ -369,8 +385,17 @@ class CreateGarbageProgram(AdminProgram):
             btn['command'] = func
             btn.place(relx=x, rely=0.7, relwidth=0.2, relheight=0.08)
 
+        for i, radio in enumerate(self.output_radio):
+            radio['font'] = btn_font
+            radio['text'] = label_output[i][0]
+            radio['bg'] = self.color
+            radio['value'] = i
+            radio['variable'] = self.output_var
+            radio['anchor'] = 'w'
+            radio.place(relx=0.2 + 0.15 * i, rely=0.53, relwidth=0.15, relheight=0.08)
+
     def choose_file(self):
-        path = askdirectory(title='选择二维码导出位置')
+        path = ask_label_output_path(self.output_var.get())
         self.var[1].set(path)
 
     def create_garbage(self):
@@ -384,18 +409,21 @@ class CreateGarbageProgram(AdminProgram):
             path = self.var[1].get()
             if len(path) == 0:
                 path = None
-            event = tk_event.CreateGarbageEvent(self.station).start(path, count)
+            output = label_output[self.output_var.get()][1]
+            event = tk_event.CreateGarbageEvent(self.station).start(path, count, output)
             self.station.push_event(event)
 
     def set_disable(self):
         self.create_btn['state'] = 'disable'
         self.file_btn['state'] = 'disable'
         set_tk_disable_from_list(self.enter)
+        set_tk_disable_from_list(self.output_radio)
 
     def reset_disable(self):
         self.create_btn['state'] = 'normal'
         self.file_btn['state'] = 'normal'
         set_tk_disable_from_list(self.enter, flat='normal')
+        set_tk_disable_from_list(self.output_radio, flat='normal')
 
 
 class ExportProgramBase(AdminProgram):
@@ -415,6 +443,10 @@ class ExportProgramBase(AdminProgram):
         self.create_btn: List[tk.Button] = [tk.Button(self.frame), tk.Button(self.frame)]
         self.file_btn: List[tk.Button] = [tk.Button(self.frame), tk.Button(self.frame)]
 
+        self.output_var: tk.Variable = tk.IntVar()  # 根据条件导出时的输出方式
+        self.output_var.set(0)
+        self.output_radio: List[tk.Radiobutton] = [tk.Radiobutton(self.frame) for _ in range(len(label_output))]
+
         self._conf("", [], [], [])
         self.__conf_font()
 
@@ -487,14 +519,26 @@ class ExportProgramBase(AdminProgram):
         self.file_btn[1].place(relx=0.6, rely=0.39, relwidth=0.2, relheight=0.08)
         self.file_btn[0].place(relx=0.6, rely=0.79, relwidth=0.2, relheight=0.08)
 
+        for i, radio in enumerate(self.output_radio):
+            radio['font'] = btn_font
+            radio['text'] = label_output[i][0]
+            radio['bg'] = self.color
+            radio['value'] = i
+            radio['variable'] = self.output_var
+            radio['anchor'] = 'w'
+            radio.place(relx=0.2 + 0.15 * i, rely=0.49, relwidth=0.15, relheight=0.07)
+
     def choose_file_id(self):
         path = askdirectory(title='选择二维码导出位置')
         self.gid_var[1].set(path)
 
     def choose_file_where(self):
-        path = askdirectory(title='选择二维码导出位置')
+        path = ask_label_output_path(self.output_var.get())
         self.where_var[1].set(path)
 
+    def get_output(self) -> str:
+        return label_output[self.output_var.get()][1]
+
     def export_id(self):
         ...
 
@@ -505,11 +549,13 @@ class ExportProgramBase(AdminProgram):
         set_tk_disable_from_list(self.gid_enter)
         set_tk_disable_from_list(self.create_btn)
         set_tk_disable_from_list(self.file_btn)
+        set_tk_disable_from_list(self.output_radio)
 
     def reset_disable(self):
         set_tk_disable_from_list(self.gid_enter, flat='normal')
         set_tk_disable_from_list(self.create_btn, flat='normal')
         set_tk_disable_from_list(self.file_btn, flat='normal')
+        set_tk_disable_from_list(self.output_radio, flat='normal')
 
 
 class ExportGarbageProgram(ExportProgramBase):
@@ -535,7 +581,7 @@ class ExportGarbageProgram(ExportProgramBase):
             self.station.show_warning("导出失败", "请指定导出的位置")
             return
 
-        event = tk_event.ExportGarbageAdvancedEvent(self.station).start(path, where)
+        event = tk_event.ExportGarbageAdvancedEvent(self.station).start(path, where, self.get_output())
         self.station.push_event(event)
 
 
@@ -562,7 +608,7 @@ class ExportUserProgram(ExportProgramBase):
             self.station.show_warning("导出失败", "请指定导出的位置")
             return
 
-        event = tk_event.ExportUserAdvancedEvent(self.station).start(path, where)
+        event = tk_event.ExportUserAdvancedEvent(self.station).start(path, where, self.get_output())
         self.station.push_event(event)
 
 
@@ -1430,6 +1476,51 @@ class SearchAdvancedProgram(SearchAdvancedProgramBase):
         self.station.push_event(event)
 
 
+class SlowQueryProgram(SearchProgramBase):
+    def __init__(self, station, win, color):
+        super().__init__(station, win, color, "慢查询统计")
+
+        self.btn: List[tk.Button] = [tk.Button(self.frame) for _ in range(2)]  # 刷新, 清空
+        self._columns_ch = ["总耗时[s]", "次数", "平均[ms]", "最大[ms]", "行数", "等待连接[ms]", "SQL"]
+        self.__conf_font()
+
+    def __conf_font(self, n: int = Config.tk_zoom):
+        self.btn_font_size = int(14 * n)
+
+    def conf_gui(self, n: int = 1):
+        self.__conf_font(n * Config.tk_zoom)
+        btn_font = make_font(size=self.btn_font_size)
+
+        for btn, text, x in zip(self.btn, ["刷新", "清空"], [0.2, 0.6]):
+            btn['font'] = btn_font
+            btn['text'] = text
+            btn['bg'] = Config.tk_btn_bg
+            btn.place(relx=x, rely=0.9, relwidth=0.2, relheight=0.08)
+
+        self.btn[0]['command'] = self.refresh
+        self.btn[1]['command'] = self.clear
+
+        self.conf_view_gui(self._columns_ch, relx=0.05, rely=0.02, relwidth=0.9, relheight=0.86)
+        self.view.column("SQL", anchor="w", width=600)
+
+    def to_program(self):
+        self.refresh()
+
+    def refresh(self):
+        event = tk_event.SlowQueryEvent(self.station).start(self)
+        self.station.push_event(event)
+
+    def clear(self):
+        self.station.clear_slow_query()
+        self.refresh()
+
+    def set_disable(self):
+        set_tk_disable_from_list(self.btn)
+
+    def reset_disable(self):
+        set_tk_disable_from_list(self.btn, flat='normal')
+
+
 class UpdateUserProgramBase(AdminProgram):
     def __init__(self, station, win, color, title: str):
         super().__init__(station, win, color, title)
@@ -2480,7 +2571,7 @@ class StatisticsPassRateGlobalProgram(StatisticsUserBaseProgram):
 
     def refresh(self, _=None):
         self.plt.cla()
-        event = tk_event.PassingRateEvent(self.station).start([], [], [], [], self)
+        event = tk_event.PassingRateEvent(self.station).start([], None, self)
         self.station.push_event(event)
 
 
@@ -2531,10 +2622,7 @@ class StatisticsPassRateTypeProgram(StatisticsUserBaseProgram):
 
     def refresh(self, _=None):
         self.plt.cla()
-        event = tk_event.PassingRateEvent(self.station).start(["GarbageType"],
-                                                              [],
-                                                              ["g.GarbageType=garbage.GarbageType"],
-                                                              ["GarbageType"], self)
+        event = tk_event.PassingRateEvent(self.station).start(["GarbageType"], None, self)
         self.station.push_event(event)
 
 
@@ -2589,13 +2677,13 @@ class StatisticsPassRateLocProgram(StatisticsUserBaseProgram):
         where = self.loc_enter[1].get()
         if len(where) == 0:
             where = "全局"
-            where_ = []
+            loc = None
         else:
-            where_ = [f"Location='{where}'"]
+            loc = where
 
         self.plt.cla()
         self.plt.set_title(f"{where}垃圾分类通过率")  # 设置标题以及其位置和字体大小
-        event = tk_event.PassingRateEvent(self.station).start([], where_, where_, [], self)
+        event = tk_event.PassingRateEvent(self.station).start([], loc, self)
         self.station.push_event(event)
 
 
@@ -2670,16 +2758,13 @@ class StatisticsPassRateTypeAndLocProgram(StatisticsUserBaseProgram):
         where = self.loc_enter[1].get()
         if len(where) == 0:
             where = "全局"
-            where_ = []
+            loc = None
         else:
-            where_ = [f"Location='{where}'"]
+            loc = where
 
         self.plt.cla()
         self.plt.set_title(f"{where}垃圾分类通过率")  # 设置标题以及其位置和字体大小
-        event = tk_event.PassingRateEvent(self.station).start(["GarbageType"],
-                                                              where_,
-                                                              where_ + ["g.GarbageType=garbage.GarbageType"],
-                                                              ["GarbageType"], self)
+        event = tk_event.PassingRateEvent(self.station).start(["GarbageType"], loc, self)
         self.station.push_event(event)
 
 
@@ -3067,4 +3152,4 @@ all_program = [WelcomeProgram, CreateNormalUserProgram, CreateManagerUserProgram
                StatisticsDate7DetailProgram, StatisticsDate30TypeProgram, StatisticsDate30LocProgram,
                StatisticsDate30TypeLocProgram, StatisticsDate30CheckResultProgram,
                StatisticsDate30CheckResultAndTypeProgram, StatisticsDate30CheckResultAndLocProgram,
-               StatisticsDate30DetailProgram]
+               StatisticsDate30DetailProgram, SlowQueryProgram]
@@ -23,6 +23,9 @@ class TkEventBase(metaclass=abc.ABCMeta):
     def get_title(self) -> str:  # 获取任务名字
         ...
 
+    def get_progress(self) -> Optional[float]:  # 子线程进度 (0-1), 无法得知进度时返回 None
+        return None
+
     def done_after_event(self):  # 子线程结束后, 在GUI线程执行的代码
         if self.thread is not None:
             self.thread.wait_event()
@@ -56,6 +59,10 @@ class TkEventMain(metaclass=abc.ABCMeta):
         self._event_list = new_event
         if len(self._event_list) == 0:
             self.stop_loading()
+        else:
+            progress = [event.get_progress() for event in self._event_list]
+            if None not in progress:  # 所有子线程都能得知进度时显示进度
+                self.show_progress(min(progress))
 
         for event in done_event:  # 隐藏进度条后执行Event-GUI任务
             try:
@@ -68,6 +75,9 @@ class TkEventMain(metaclass=abc.ABCMeta):
     def show_loading(self, title: str):  # 有子线程时显示加载
         ...
 
+    def show_progress(self, progress: float):  # 显示子线程进度 (0-1)
+        ...
+
     @abc.abstractmethod
     def stop_loading(self):  # 子线程运行完成后关闭加载
         ...
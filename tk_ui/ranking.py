@@ -8,6 +8,7 @@ from conf import Config
 from tool.typing import *
 from tool.tk import make_font
 from sql.db import DB
+from sql.user import get_rank_page, count_rank_user
 
 
 class RankingStationBase(metaclass=abc.ABCMeta):
@@ -22,6 +23,8 @@ class RankingStationBase(metaclass=abc.ABCMeta):
         self.rank_page = 1  # 页码是按1开始计算的
         self.rank_page_max = 1
         self.rank_count = 7
+        self._rank_first: Optional[tuple] = None  # 当前页第一行和最后一行的键 (用于键集分页)
+        self._rank_last: Optional[tuple] = None
 
         self.auto: bool = False
         self.auto_to_next: bool = True  # auto的移动方向
@@ -37,17 +40,20 @@ class RankingStationBase(metaclass=abc.ABCMeta):
         if offset < 0:
             return False, []
 
-        cur = self._db.search(columns=['UserID', 'Name', 'Score', 'Reputation'],
-                              table='user',
-                              where='IsManager=0',
-                              order_by=[('Reputation', "DESC"), ('Score', "DESC"), ('UserID', "DESC")],
-                              limit=self.rank_count,
-                              offset=offset)
-        if cur is None or cur.rowcount == 0:
+        if offset_page == 1 and self._rank_last is not None:  # 翻页时使用键集分页
+            rank_list = get_rank_page(self._db, self.rank_count, "DESC", after=self._rank_last)
+        elif offset_page == -1 and self._rank_first is not None:
+            rank_list = get_rank_page(self._db, self.rank_count, "ASC", after=self._rank_first)
+            if rank_list is not None:
+                rank_list.reverse()
+        else:
+            rank_list = get_rank_page(self._db, self.rank_count, "DESC", offset=offset)
+        if rank_list is None or len(rank_list) == 0:
             return False, []
         self.rank_page += offset_page
+        self._rank_first = (rank_list[0][3], rank_list[0][2], rank_list[0][0])
+        self._rank_last = (rank_list[-1][3], rank_list[-1][2], rank_list[-1][0])
 
-        rank_list = list(cur.fetchall())
         rank = []
         for i, r in enumerate(rank_list):
             color = None
@@ -105,15 +111,7 @@ class RankingStationBase(metaclass=abc.ABCMeta):
         :return:
         """
 
-        cur = self._db.search(columns=['Count(UserID)'],
-                              table='user',
-                              where='IsManager=0')
-        if cur is None or cur.rowcount != 1:
-            return
-        try:
-            max_ = int(cur.fetchone()[0])
-        except (ValueError, TypeError):
-            return
+        max_ = count_rank_user(self._db)
 
         self.rank_count = rank_count
         self.rank_page_max = ceil(max_ / rank_count)  # 计算最大页数
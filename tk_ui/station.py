@@ -20,10 +20,10 @@ from core.user import User
 from core.garbage import GarbageBag, GarbageType
 
 from sql.db import DB
-from sql.user import update_user, find_user_by_id
+from sql.user import update_user, find_user_by_id, get_rank_page
 from sql.garbage import update_garbage
 
-from equipment.scan import HGSCapture, HGSQRCoder
+from equipment.scan import HGSCapture, HGSQRCoder, HGSFrame
 from equipment.aliyun import Aliyun, AliyunClientException, AliyunServerException
 
 from .event import TkEventMain
@@ -122,7 +122,7 @@ class GarbageStationBase(TkEventMain, metaclass=abc.ABCMeta):
             return {}
         return self._user.get_info()
 
-    def get_cap_img(self):
+    def get_cap_img(self) -> Optional[HGSFrame]:
         return self._cap.get_frame()
 
     def logout_user(self):
@@ -150,10 +150,13 @@ class GarbageStationBase(TkEventMain, metaclass=abc.ABCMeta):
             return -1
         if not self._user.throw_rubbish(garbage, garbage_type, self._loc):
             return -2
-        if not update_garbage(garbage, self._db):
-            return -3
-        if not update_user(self._user, self._db):
-            return -3
+        with self._db.transaction() as tran:
+            if not update_garbage(garbage, self._db, not_commit=True):
+                tran.rollback()
+                return -3
+            if not update_user(self._user, self._db, not_commit=True):
+                tran.rollback()
+                return -3
         return 0
 
     def check_garbage_core(self, garbage: GarbageBag, check_result: bool) -> int:
@@ -164,12 +167,16 @@ class GarbageStationBase(TkEventMain, metaclass=abc.ABCMeta):
             return -2
         if not self._user.check_rubbish(garbage, check_result, user):
             return -3
-        if not update_garbage(garbage, self._db):
-            return -4
-        if not update_user(self._user, self._db):
-            return -4
-        if not update_user(user, self._db):
-            return -4
+        with self._db.transaction() as tran:
+            if not update_garbage(garbage, self._db, not_commit=True):
+                tran.rollback()
+                return -4
+            if not update_user(self._user, self._db, not_commit=True):
+                tran.rollback()
+                return -4
+            if not update_user(user, self._db, not_commit=True):
+                tran.rollback()
+                return -4
         return 0
 
     def ranking(self, limit: int = 0, order_by: str = 'DESC') -> "List[Tuple[uid_t, uname_t, score_t, score_t]]":
@@ -181,14 +188,10 @@ class GarbageStationBase(TkEventMain, metaclass=abc.ABCMeta):
         if order_by != 'ASC' and order_by != 'DESC':
             order_by = 'DESC'
 
-        cur = self._db.search(columns=['UserID', 'Name', 'Score', 'Reputation'],
-                              table='user',
-                              where='IsManager=0',
-                              order_by=[('Reputation', order_by), ('Score', order_by), ('UserID', order_by)],
-                              limit=limit)
-        if cur is None:
+        res = get_rank_page(self._db, limit, order_by)
+        if res is None:
             return []
-        return list(cur.fetchall())
+        return res
 
     def to_get_garbage_type(self, garbage: GarbageBag):
         self._flat = GarbageStationBase.status_get_garbage_type
@@ -362,7 +365,8 @@ class GarbageStationBase(TkEventMain, metaclass=abc.ABCMeta):
         二维码扫描的任务包括: 登录, 扔垃圾, 标记垃圾
         :return:
         """
-        self._cap.get_image()
+        if not self._cap.get_image() and not self._qr.is_waiting():  # 没有新的图像, 也没有等待中的识别结果
+            return GarbageStationBase.scan_no_to_done, None
         qr_code = self._qr.get_qr_code()
         if qr_code is None:
             return GarbageStationBase.scan_no_to_done, None
@@ -537,7 +541,7 @@ class GarbageStation(GarbageStationBase):
 
         self.__conf_windows()
 
-        self._cap_img = None  # 存储 PIL.image 的变量 防止gc释放
+        self._cap_img: Optional[HGSFrame] = None  # 正在显示的帧 (搜索垃圾时使用)
         self._cap_img_tk = None  # 存储 tkinter的image 的变量 防止gc释放
         self._user_im = None
 
@@ -1184,7 +1188,9 @@ class GarbageStation(GarbageStationBase):
 
     def search_pic(self, img: Image = None):
         if img is None:
-            img = self._cap_img
+            if self._cap_img is None:
+                return
+            img = self._cap_img.get_image()
         super(GarbageStation, self).search_pic(img)
 
     def __show_check_frame(self):
@@ -1273,23 +1279,15 @@ class GarbageStation(GarbageStationBase):
             self.show_warning("摄像头异常", "摄像头获取图像失败")
             return
 
+        frame: Optional[HGSFrame] = self.get_cap_img()
+        if frame is None:  # 摄像头还没有图像, 保留原来的画面
+            return
+        if frame is self._cap_img:  # 没有新的图像, 不需要重新显示
+            return
+        self._cap_img = frame
+
         # 需要存储一些数据 谨防被gc释放
-        _cap_img_info: Image.Image = self.get_cap_img()
-        self._cap_img = _cap_img_info
-
-        img_width, img_height = _cap_img_info.size
-        proportion = max(self._cap_width / img_width, self._cap_height / img_height)  # 缩放倍数, 取较大的那个
-        new_width = int(img_width * proportion)
-        new_height = int(img_height * proportion)
-        _cap_img_info = _cap_img_info.resize((new_width, new_height), Image.ANTIALIAS)
-
-        crop = (int(new_width / 2 - self._cap_width / 2),  # 左
-                int(new_height / 2 - self._cap_height / 2),  # 上
-                int(new_width / 2 + self._cap_width / 2),  # 右
-                int(new_height / 2 + self._cap_height / 2))  # 下
-        _cap_img_info = _cap_img_info.crop(crop)  # 裁剪图片
-
-        self._cap_img_tk = ImageTk.PhotoImage(image=_cap_img_info)
+        self._cap_img_tk = ImageTk.PhotoImage(image=frame.get_preview(self._cap_width, self._cap_height))
         self._cap_label['image'] = self._cap_img_tk
 
     def update_msg(self):
@@ -10,7 +10,7 @@ from core.user import User
 from core.garbage import GarbageBag
 
 from sql.db import DB
-from sql.user import find_user_by_id
+from sql.user import find_user_by_id, get_rank_page
 
 from .event import TkThreading, TkEventBase
 from . import station as tk_station
@@ -126,14 +126,10 @@ class RankingEvent(StationEventBase):
 
     @staticmethod
     def func(db: DB):
-        cur = db.search(columns=['UserID', 'Name', 'Score', 'Reputation'],
-                        table='user',
-                        where='IsManager=0',
-                        order_by=[('Reputation', "DESC"), ('Score', "DESC"), ('UserID', "DESC")],
-                        limit=20)
-        if cur is None:
+        res = get_rank_page(db, 20)
+        if res is None:
             return []
-        return list(cur.fetchall())
+        return res
 
     def __init__(self, gb_station):
         super().__init__(gb_station, "排行榜")
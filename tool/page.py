@@ -2,35 +2,75 @@ from flask import url_for
 from tool.typing import *
 
 
-def get_page(url, page: int, count: int):
+cursor_sep = "_"
+
+
+def make_cursor(key: Optional[tuple]) -> Optional[str]:
+    """
+    把上一页最后一行的键转换为 url 参数 (键集分页)
+    :param key: 键
+    :return:
+    """
+    if key is None:
+        return None
+    return cursor_sep.join(str(i) for i in key)
+
+
+def parse_cursor(cursor: Optional[str], types: List[Callable]) -> Optional[tuple]:
+    """
+    解析 url 中的键集分页参数
+    :param cursor: url 参数
+    :param types: 每一项的类型
+    :return: 键, 参数不合法时返回 None (退回使用 OFFSET 分页)
+    """
+    if cursor is None:
+        return None
+    key = cursor.split(cursor_sep)
+    if len(key) != len(types):
+        return None
+    try:
+        return tuple(t(i) for t, i in zip(types, key))
+    except (ValueError, TypeError):
+        return None
+
+
+def get_page(url, page: int, count: int, cursor: Optional[str] = None):
+    """
+    :param cursor: 当前页最后一行的键, 下一页的链接会带上该参数以使用键集分页
+    """
+    def page_url(i: int):
+        if cursor is not None and i == page + 1:
+            return url_for(url, page=i, after=cursor)
+        return url_for(url, page=i)
+
     if count <= 9:
-        page_list = [[f"{i + 1}", url_for(url, page=i + 1)] for i in range(count)]
+        page_list = [[f"{i + 1}", page_url(i + 1)] for i in range(count)]
     elif page <= 5:
         """
         [1][2][3][4][5][6][...][count - 1][count]
         """
-        page_list = [[f"{i + 1}", url_for(url, page=i + 1)] for i in range(6)]
+        page_list = [[f"{i + 1}", page_url(i + 1)] for i in range(6)]
 
         page_list += [None,
-                      [f"{count - 1}", url_for(url, page=count - 1)],
-                      [f"{count}", url_for(url, page=count)]]
+                      [f"{count - 1}", page_url(count - 1)],
+                      [f"{count}", page_url(count)]]
     elif page >= count - 5:
         """
         [1][2][...][count - 5][count - 4][count - 3][count - 2][count - 1][count]
         """
-        page_list: Optional[list] = [["1", url_for(url, page=1)],
-                                     ["2", url_for(url, page=2)],
+        page_list: Optional[list] = [["1", page_url(1)],
+                                     ["2", page_url(2)],
                                      None]
-        page_list += [[f"{count - 5 + i}", url_for(url, page=count - 5 + i), False] for i in range(6)]
+        page_list += [[f"{count - 5 + i}", page_url(count - 5 + i), False] for i in range(6)]
     else:
         """
         [1][2][...][page - 2][page - 1][page][page + 1][page + 2][...][count - 1][count]
         """
-        page_list: Optional[list] = [["1", url_for(url, page=1)],
-                                     ["2", url_for(url, page=2)],
+        page_list: Optional[list] = [["1", page_url(1)],
+                                     ["2", page_url(2)],
                                      None]
-        page_list += [[f"{page - 2 + i}", url_for(url, page=page - 2 + i)] for i in range(5)]
+        page_list += [[f"{page - 2 + i}", page_url(page - 2 + i)] for i in range(5)]
         page_list += [None,
-                      [f"{count - 1}", url_for(url, page=count - 1)],
-                      [f"{count}", url_for(url, page=count)]]
+                      [f"{count - 1}", page_url(count - 1)],
+                      [f"{count}", page_url(count)]]
     return page_list
@@ -1,4 +1,4 @@
-from typing import Dict, List, Tuple, Union, Optional, Callable, IO
+from typing import Dict, List, Tuple, Union, Optional, Callable, IO, Set, Deque
 
 gid_t = str  # garbage bag id 类型
 uid_t = str  # user id 类型